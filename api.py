@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# 供其他程序导入的转换接口：不依赖 Qt，可指定 ffmpeg，接收进度回调，GIF 可写入文件、文件对象或直接返回字节
+"""
+用法：
+
+    import api
+    api.set_binary('ffmpeg', '/opt/ffmpeg/bin/ffmpeg')  # 可选，默认自动查找
+    api.convert_video('input.mp4', 'output.gif', fps=15, width=480,
+                      on_progress=lambda p: print(f'{p.fraction:.0%}'))
+    data = api.convert_to_bytes('input.mp4', fps=10, width=320, end=3)
+    result = await api.convert_video_async('input.mp4', 'output.gif')
+
+输出缓存、性能记录、帧间优化和 asyncio 只在用到时才导入，导入本模块不会加载 Qt 或 NumPy。
+"""
+import io
+import os
+from dataclasses import dataclass, field
+from functools import partial
+from typing import BinaryIO, Callable, List, Optional, Tuple, Union
+
+from converter import (CancelToken, ConversionCancelled, ConversionJob, ConversionProgress, MAX_COLORS,
+                       PIPE_OUTPUT, convert, conversion_failed, output_format, remove_outputs, replaces_output)
+from ffmpeg_runner import FFmpegResult, find_binary, set_binary
+from get_video_info import probe_video
+
+
+@dataclass
+class ConversionOutcome:
+    result: FFmpegResult
+    optimize_stats: List = field(default_factory=list)  # 每个输出的 OptimizeStats，未优化时为空
+
+
+def convert_job(job: ConversionJob, duration: Optional[float] = None,
+                on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                convert_fn: Callable = convert, optimize: bool = False, use_cache: bool = False,
+                sinks: Tuple[Callable, ...] = (), on_metrics: Optional[Callable] = None,
+                cancel: Optional[CancelToken] = None) -> ConversionOutcome:
+    """
+    完整的转换流程：可选的输出缓存、性能记录（提供 sinks 或 on_metrics 时）、转换和帧间优化。
+    转换失败不抛异常，由调用方用 conversion_failed(outcome.result) 判断；
+    cancel 被取消后，下一次进度回调时结束 ffmpeg、删除不完整的输出并抛出 ConversionCancelled；
+    以替换方式写出的转换（可续转）完成前不会碰输出，已有的文件保留。
+    """
+    cancel = cancel or CancelToken()
+
+    def report(progress: ConversionProgress):
+        cancel.check()
+        if on_progress:
+            on_progress(progress)
+
+    if use_cache:
+        from output_cache import cached_convert
+        convert_fn = partial(cached_convert, convert_fn=convert_fn)
+    try:
+        if sinks or on_metrics:
+            from telemetry import instrumented_convert
+            result = instrumented_convert(job, duration, report, convert_fn=convert_fn, sinks=sinks,
+                                          on_metrics=on_metrics)
+        else:
+            result = convert_fn(job, duration, report)
+        cancel.check()
+    except ConversionCancelled:
+        # 可续转等以替换方式写出的转换在完成前没有碰过输出，已有的文件保留
+        if not replaces_output(convert_fn):
+            remove_outputs(job)
+        raise
+
+    stats = []
+    if optimize and not conversion_failed(result):
+        from gif_optimize import optimize_outputs
+        stats = optimize_outputs([spec.output_path for spec in job.outputs
+                                  if output_format(spec.output_path).name == 'gif'])
+    return ConversionOutcome(result, stats)
+
+
+def convert_video(input_video: str, output: Union[str, os.PathLike, BinaryIO], fps: int = 15, width: int = 480,
+                  start: Optional[float] = None, end: Optional[float] = None, colors: int = MAX_COLORS,
+                  threads: Optional[int] = None, duration: Optional[float] = None,
+                  on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                  optimize: bool = False, cancel: Optional[CancelToken] = None,
+                  ffmpeg_path: Optional[str] = None, crop: Optional[Tuple[int, int, int, int]] = None) -> FFmpegResult:
+    """
+    把 input_video 转为 GIF。output 为路径，或可写的二进制文件对象（文件、BytesIO、socket.makefile('wb') 等）；
+    路径的扩展名为 .webp、.apng、.mp4 或 .webm 时输出对应格式（见 converter.OUTPUT_FORMATS）。
+    写入文件对象时 GIF 经管道直接写入，不产生临时文件，此时不能做帧间优化。
+    提供 on_progress 但没有 duration 和终点时先探测视频时长。
+    crop 为 (x, y, 宽, 高) 时先裁剪再缩放，width 是裁剪后的画面缩放到的宽度。
+    转换失败抛出 RuntimeError，取消时抛出 ConversionCancelled。
+    """
+    stream = None if isinstance(output, (str, os.PathLike)) else output
+    if stream is not None and optimize:
+        raise ValueError('写入文件对象时不支持帧间优化')
+    output_path = PIPE_OUTPUT if stream is not None else os.fspath(output)
+    job = ConversionJob(input_video, output_path, fps, width, threads=threads, start=start, end=end, colors=colors,
+                        crop=crop)
+    if on_progress and duration is None and end is None:
+        info = probe_video(input_video)
+        duration = info.duration if info else None
+
+    outcome = convert_job(job, duration, on_progress,
+                          convert_fn=partial(convert, output=stream, ffmpeg_path=ffmpeg_path),
+                          optimize=optimize, cancel=cancel)
+    result = outcome.result
+    if conversion_failed(result):
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(f'转换失败: {lines[-1] if lines else result.returncode}')
+    return result
+
+
+def convert_to_bytes(input_video: str, **options) -> bytes:
+    """转换并返回 GIF 数据，参数同 convert_video"""
+    buffer = io.BytesIO()
+    convert_video(input_video, buffer, **options)
+    return buffer.getvalue()
+
+
+async def convert_video_async(input_video: str, output: Union[str, os.PathLike, BinaryIO],
+                              **options) -> FFmpegResult:
+    """
+    convert_video 的 asyncio 版本，转换在默认线程池中运行，on_progress 在事件循环所在的线程中回调。
+    写入文件对象时写操作发生在线程池中。等待的任务被取消时先结束 ffmpeg，等它退出后再传播 CancelledError。
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    cancel = options.pop('cancel', None) or CancelToken()
+    on_progress = options.pop('on_progress', None)
+    if on_progress:
+        options['on_progress'] = lambda progress: loop.call_soon_threadsafe(on_progress, progress)
+    future = loop.run_in_executor(None, partial(convert_video, input_video, output, cancel=cancel, **options))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancel.cancel()
+        try:
+            await future
+        except Exception:
+            pass
+        raise
+
+
+async def convert_to_bytes_async(input_video: str, **options) -> bytes:
+    """convert_to_bytes 的 asyncio 版本"""
+    buffer = io.BytesIO()
+    await convert_video_async(input_video, buffer, **options)
+    return buffer.getvalue()
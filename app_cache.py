@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+
+
+def cache_dir(*parts: str) -> str:
+    """
+    返回（并创建）本程序的缓存目录。
+
+    可用环境变量 VID2GIF_CACHE_DIR 覆盖；默认 Windows 使用 %LOCALAPPDATA%\\vid2gif，
+    其他平台使用 $XDG_CACHE_HOME/vid2gif 或 ~/.cache/vid2gif。
+    """
+    base = os.environ.get('VID2GIF_CACHE_DIR')
+    if not base:
+        if os.name == 'nt':
+            root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        else:
+            root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        base = os.path.join(root, 'vid2gif')
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def load_json(path: str, default=None):
+    """读取 JSON 文件，文件不存在或损坏时返回 default"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path: str, data) -> None:
+    """先写临时文件再替换，避免写入中断留下损坏的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# 转换流程的基准测试：用 ffmpeg 内置的 lavfi 信号源生成可复现的测试视频，按参数网格运行各转换路径
+import argparse
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, List, Optional
+
+from app_cache import cache_dir
+from converter import ConversionJob, convert, conversion_failed
+from ffmpeg_check import ffmpeg_version
+from ffmpeg_runner import find_binary, popen_kwargs
+from get_video_info import ProbeCache, probe_video
+from gif_format import read_gif
+from quality import measure_quality
+from scheduler import cpu_count
+
+# 信号源的 lavfi 滤镜图，{w} {h} {rate} 为尺寸和帧率；都不依赖随机数，结果可复现
+SOURCES = {
+    'testsrc2': 'testsrc2=size={w}x{h}:rate={rate}',
+    'mandelbrot': 'mandelbrot=size={w}x{h}:rate={rate}',
+    'noise': 'color=c=gray:size={w}x{h}:rate={rate},noise=alls=40:allf=t+u:all_seed=42',
+    # 近似屏幕录像：浅色背景和网格基本不变，只有一小块区域在变化
+    'screen': ('color=c=0xf0f0f0:size={w}x{h}:rate={rate},drawgrid=w=160:h=48:c=0xd8d8d8[bg];'
+               'testsrc=size=160x48:rate=2[fg];[bg][fg]overlay=x=32:y=32:shortest=1'),
+}
+
+# (宽, 高, 时长秒, 帧率)
+VARIANTS = {
+    'quick': [(640, 360, 4, 30)],
+    'default': [(640, 360, 10, 30), (1280, 720, 10, 30), (1920, 1080, 5, 60)],
+    'long': [(1280, 720, 60, 30)],
+    # 手机拍摄的 4K 60 帧视频，大幅缩小、降低帧率时走快速解码
+    '4k': [(3840, 2160, 4, 60)],
+}
+
+FPS_GRID = (10, 15)
+WIDTH_GRID = (320, 480)
+DEFAULT_PATHS = ('convert', 'native', 'parallel')
+
+# compare 模式中各指标的方向：数值越大越差
+REGRESSION_METRICS = ('wall_seconds', 'peak_rss_bytes', 'output_bytes', 'cpu_seconds')
+# 画质指标（--quality 时记录）：数值越小越差
+QUALITY_METRICS = ('psnr', 'ssim')
+# 界面启动的各阶段（毫秒），process_ms 为从启动进程到它退出，包含解释器启动和退出
+STARTUP_METRICS = ('import_ms', 'ui_built_ms', 'window_shown_ms', 'interactive_ms', 'process_ms')
+
+
+@dataclass
+class BenchResult:
+    source: str
+    size: str
+    duration: float
+    rate: int
+    path: str
+    fps: int
+    width: int
+    success: bool
+    wall_seconds: float
+    frames: int
+    frames_per_second: float
+    peak_rss_bytes: int
+    cpu_seconds: float
+    output_bytes: int
+    psnr: float = 0.0  # 与缩放后的源视频比较，未测量时为 0
+    ssim: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return f'{self.source}/{self.size}/{self.duration:g}s@{self.rate}/{self.path}/{self.width}w{self.fps}fps'
+
+
+def conversion_paths() -> Dict[str, object]:
+    """可测试的转换路径，可选依赖缺失的路径不列出"""
+    from segmented import parallel_convert
+    from scene_palette import scene_convert
+
+    def exact_convert(job, duration=None, on_progress=None):
+        # 关闭快速解码，与 convert 对比跳帧解码和预缩放的效果
+        return convert(replace(job, fast_decode=False), duration, on_progress)
+
+    paths = {'convert': convert, 'exact': exact_convert, 'parallel': parallel_convert, 'scene': scene_convert}
+    try:
+        from native_gif import native_convert, require_numpy
+        require_numpy()
+        paths['native'] = native_convert
+    except RuntimeError:
+        pass
+    try:
+        from gif_optimize import optimize_outputs, require_numpy as require_optimize
+
+        def optimized_convert(job, duration=None, on_progress=None):
+            result = convert(job, duration, on_progress)
+            if not conversion_failed(result):
+                optimize_outputs([job.output_path])
+            return result
+
+        require_optimize()
+        paths['optimize'] = optimized_convert
+    except RuntimeError:
+        pass
+    return paths
+
+
+def generate_source(name: str, width: int, height: int, duration: float, rate: int, directory: str) -> str:
+    """生成测试视频，同样参数的文件已存在时直接复用"""
+    path = os.path.join(directory, f'{name}_{width}x{height}_{duration:g}s_{rate}fps.mp4')
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    graph = SOURCES[name].format(w=width, h=height, rate=rate)
+    tmp_path = path + '.tmp.mp4'
+    command = [find_binary('ffmpeg'), '-v', 'error', '-y', '-f', 'lavfi', '-i', graph, '-t', f'{duration:g}',
+               '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-g', str(rate * 2),
+               '-pix_fmt', 'yuv420p', '-threads', '1', tmp_path]
+    process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             text=True, encoding='utf-8', errors='replace', **popen_kwargs())
+    if process.returncode != 0:
+        raise RuntimeError(f'生成测试视频 {name} 失败: {process.stderr.strip()}')
+    os.replace(tmp_path, path)
+    return path
+
+
+def measure_probe(path: str) -> dict:
+    """冷启动（无缓存，启动 ffprobe）和命中缓存两种情况的探测耗时"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ProbeCache(os.path.join(tmp, 'probe.json'))
+        start = time.perf_counter()
+        probe_video(path, cache)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        probe_video(path, cache)
+        warm = time.perf_counter() - start
+    return {'cold_ms': round(cold * 1000, 3), 'warm_ms': round(warm * 1000, 3)}
+
+
+def run_case(source: str, video: str, variant, path_name: str, convert_fn, fps: int, width: int,
+             output_dir: str, repeat: int, quality: bool = False) -> BenchResult:
+    """同一组参数运行 repeat 次，耗时取中位数，峰值内存取最大值；quality 为真时再测量最后一次输出的画质"""
+    w, h, duration, rate = variant
+    output_path = os.path.join(output_dir, f'{source}_{w}x{h}_{path_name}_{width}w_{fps}fps.gif')
+    walls, cpus, rss = [], [], 0
+    success = True
+    for _ in range(repeat):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        job = ConversionJob(video, output_path, fps, width)
+        start = time.perf_counter()
+        try:
+            result = convert_fn(job, duration)
+            success = success and not conversion_failed(result)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Warning: {source} {path_name} 失败: {e}", file=sys.stderr)
+            success, result = False, None
+        walls.append(time.perf_counter() - start)
+        if result is not None and result.usage is not None:
+            cpus.append(result.usage.cpu_seconds)
+            rss = max(rss, result.usage.peak_rss_bytes)
+    frames, output_bytes = 0, 0
+    if success and os.path.exists(output_path):
+        output_bytes = os.path.getsize(output_path)
+        frames = len(read_gif(output_path).frames)
+    wall = statistics.median(walls)
+    report = measure_quality(ConversionJob(video, output_path, fps, width)) if quality and output_bytes else None
+    return BenchResult(source, f'{w}x{h}', duration, rate, path_name, fps, width, success, round(wall, 4),
+                       frames, round(frames / wall, 2) if wall > 0 else 0.0, rss,
+                       round(statistics.median(cpus), 4) if cpus else 0.0, output_bytes,
+                       round(min(report.psnr, 100.0), 3) if report else 0.0, round(report.ssim, 5) if report else 0.0)
+
+
+def measure_startup(command: Optional[List[str]] = None, repeat: int = 5, qt_platform: str = 'offscreen') -> dict:
+    """
+    重复启动界面（vid2gif.py --startup-timing，或打包后的可执行文件），各阶段耗时取中位数。
+    第一次启动会预热磁盘缓存，不计入结果。
+    """
+    command = (command or [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vid2gif.py')])
+    env = dict(os.environ, QT_QPA_PLATFORM=qt_platform) if qt_platform else None
+    runs = []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        process = subprocess.run(command + ['--startup-timing'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 text=True, encoding='utf-8', errors='replace', env=env, timeout=120)
+        elapsed = time.perf_counter() - start
+        lines = process.stdout.strip().splitlines()
+        if process.returncode != 0 or not lines:
+            raise RuntimeError(f'界面启动失败: {process.stderr.strip()}')
+        marks = json.loads(lines[-1])
+        marks['process_ms'] = round(elapsed * 1000, 1)
+        print(' '.join(f'{name}={marks.get(name)}' for name in STARTUP_METRICS), file=sys.stderr)
+        if i:
+            runs.append(marks)
+    return {
+        'meta': _meta(repeat),
+        'startup': {name: statistics.median(run[name] for run in runs) for name in STARTUP_METRICS
+                    if all(name in run for run in runs)},
+        'startup_runs': runs,
+    }
+
+
+def _meta(repeat: int) -> dict:
+    return {
+        'ffmpeg': ffmpeg_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+        'repeat': repeat,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run_benchmark(sources: List[str], variants, paths: List[str], fps_grid, width_grid,
+                  repeat: int = 1, work_dir: Optional[str] = None, quality: bool = False) -> dict:
+    work_dir = work_dir or cache_dir('bench')
+    available = conversion_paths()
+    missing = [name for name in paths if name not in available]
+    if missing:
+        print(f"Warning: 跳过不可用的转换路径: {', '.join(missing)}", file=sys.stderr)
+    results, probes = [], []
+    with tempfile.TemporaryDirectory(prefix='vid2gif-bench-') as output_dir:
+        for variant in variants:
+            for source in sources:
+                video = generate_source(source, *variant, os.path.join(work_dir, 'sources'))
+                probes.append(dict(source=source, size=f'{variant[0]}x{variant[1]}', **measure_probe(video)))
+                for path_name in paths:
+                    if path_name not in available:
+                        continue
+                    for fps in fps_grid:
+                        for width in width_grid:
+                            result = run_case(source, video, variant, path_name, available[path_name],
+                                              fps, width, output_dir, repeat, quality)
+                            scores = f'{result.psnr:>8.2f}dB{result.ssim:>8.4f}' if quality else ''
+                            print(f'{result.key:<60}{result.wall_seconds:>9.3f}s{result.frames_per_second:>9.1f} 帧/秒'
+                                  f'{result.peak_rss_bytes / 1024 ** 2:>9.1f} MB{result.output_bytes:>11}{scores}',
+                                  file=sys.stderr)
+                            results.append(result)
+    return {
+        'meta': _meta(repeat),
+        'results': [dict(asdict(r), key=r.key) for r in results],
+        'probe': probes,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 0.1) -> List[dict]:
+    """
+    按 key 对比两次运行，指标变差超过 threshold（比例）的记为回退；
+    之前成功而现在失败的用例也算回退。
+    """
+    old_results = {r['key']: r for r in old.get('results', [])}
+    rows = []
+    for result in new.get('results', []):
+        before = old_results.get(result['key'])
+        if before is None:
+            continue
+        if before['success'] and not result['success']:
+            rows.append({'key': result['key'], 'metric': 'success', 'old': True, 'new': False, 'change': None,
+                         'regression': True})
+            continue
+        for metric in REGRESSION_METRICS + QUALITY_METRICS:
+            old_value, new_value = before.get(metric, 0), result.get(metric, 0)
+            if not old_value or (metric in QUALITY_METRICS and not new_value):
+                continue
+            change = new_value / old_value - 1
+            regression = change < -threshold if metric in QUALITY_METRICS else change > threshold
+            rows.append({'key': result['key'], 'metric': metric, 'old': old_value, 'new': new_value,
+                         'change': round(change, 4), 'regression': regression})
+    old_probes = {(p['source'], p['size']): p for p in old.get('probe', [])}
+    for probe in new.get('probe', []):
+        before = old_probes.get((probe['source'], probe['size']))
+        if before and before['cold_ms']:
+            change = probe['cold_ms'] / before['cold_ms'] - 1
+            rows.append({'key': f"probe/{probe['source']}/{probe['size']}", 'metric': 'cold_ms',
+                         'old': before['cold_ms'], 'new': probe['cold_ms'], 'change': round(change, 4),
+                         'regression': change > threshold})
+    old_startup = old.get('startup', {})
+    for metric, value in new.get('startup', {}).items():
+        before = old_startup.get(metric)
+        if before:
+            change = value / before - 1
+            rows.append({'key': 'startup', 'metric': metric, 'old': before, 'new': value,
+                         'change': round(change, 4), 'regression': change > threshold})
+    return rows
+
+
+def _load(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='benchmark', description='vid2gif 转换流程基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='生成测试视频并运行基准测试')
+    run.add_argument('--sources', default=','.join(SOURCES), help='信号源，逗号分隔')
+    run.add_argument('--variants', choices=sorted(VARIANTS), default='default',
+                     help='测试视频的分辨率/时长/帧率组合')
+    run.add_argument('--paths', default=','.join(DEFAULT_PATHS),
+                     help='转换路径，逗号分隔：convert, exact, native, parallel, scene, optimize')
+    run.add_argument('--fps', default=','.join(map(str, FPS_GRID)), help='输出帧率网格')
+    run.add_argument('--width', default=','.join(map(str, WIDTH_GRID)), help='输出宽度网格')
+    run.add_argument('--repeat', type=int, default=1, help='每组参数的运行次数，耗时取中位数')
+    run.add_argument('--quality', action='store_true', help='同时测量每个输出与源视频相比的 PSNR 和 SSIM')
+    run.add_argument('--work-dir', help='测试视频的存放目录，默认在缓存目录下')
+    run.add_argument('-o', '--output', default='-', help='JSON 结果的写入路径，- 表示标准输出')
+
+    startup = sub.add_parser('startup', help='测量界面的启动耗时')
+    startup.add_argument('--repeat', type=int, default=5, help='启动次数，各阶段取中位数')
+    startup.add_argument('--executable', help='启动命令（如打包后的可执行文件），默认用当前解释器运行 vid2gif.py')
+    startup.add_argument('--platform', default='offscreen',
+                         help='QT_QPA_PLATFORM，默认 offscreen；传空字符串则使用系统默认')
+    startup.add_argument('-o', '--output', default='-', help='JSON 结果的写入路径，- 表示标准输出')
+
+    cmp = sub.add_parser('compare', help='比较两次运行的结果，有回退时返回 1')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.1, help='判定为回退的变差比例（默认 0.1，即 10%%）')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        rows = compare(_load(args.old), _load(args.new), args.threshold)
+        regressions = [row for row in rows if row['regression']]
+        for row in rows:
+            change = '' if row['change'] is None else f"{row['change'] * 100:+.1f}%"
+            flag = '回退' if row['regression'] else ''
+            print(f"{row['key']:<60}{row['metric']:<16}{row['old']!s:>14}{row['new']!s:>14}{change:>9} {flag}")
+        print(f'{len(rows)} 项对比，{len(regressions)} 项回退', file=sys.stderr)
+        return 1 if regressions else 0
+
+    if args.command == 'startup':
+        report = measure_startup(shlex.split(args.executable) if args.executable else None, max(1, args.repeat),
+                                 args.platform)
+        _write_report(report, args.output)
+        return 0
+
+    sources = [s for s in args.sources.split(',') if s]
+    unknown = [s for s in sources if s not in SOURCES]
+    if unknown:
+        parser.error(f"未知的信号源: {', '.join(unknown)}，可选 {', '.join(SOURCES)}")
+    report = run_benchmark(sources, VARIANTS[args.variants],
+                           [p for p in args.paths.split(',') if p],
+                           [int(v) for v in args.fps.split(',') if v], [int(v) for v in args.width.split(',') if v],
+                           max(1, args.repeat), args.work_dir, args.quality)
+    _write_report(report, args.output)
+    return 0
+
+
+def _write_report(report: dict, output: str) -> None:
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output == '-':
+        print(text)
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# 无界面的批量转换入口，不导入 PySide6
+import argparse
+import glob
+import json
+import os
+import sys
+from functools import partial
+from typing import List, Tuple
+
+from converter import OUTPUT_FORMATS, ConversionJob, OutputSpec, convert
+from scheduler import BatchScheduler
+from segmented import parallel_convert
+from output_cache import DEFAULT_MAX_BYTES, OutputCache, cached_convert
+from quality import measure_quality
+from resumable import CHUNK_SECONDS, resumable_convert
+from scene_palette import SCENE_THRESHOLD, scene_convert
+from native_gif import native_convert
+from size_target import target_size_convert
+from telemetry import JsonLinesLog, MetricsRegistry, default_log_path, instrumented_convert, serve_metrics
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v')
+
+
+def collect_inputs(patterns: List[str]) -> List[str]:
+    """展开文件、通配符和目录（递归查找视频文件），去重并保持顺序"""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                for name in sorted(files):
+                    if name.lower().endswith(VIDEO_EXTENSIONS):
+                        found.append(os.path.join(root, name))
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            found.extend(sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)))
+    seen = set()
+    result = []
+    for path in found:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+def output_path_for(input_video: str, output_dir: str = None, suffix: str = '', extension: str = '.gif') -> str:
+    name = os.path.splitext(os.path.basename(input_video))[0] + suffix + extension
+    return os.path.join(output_dir or os.path.dirname(input_video), name)
+
+
+def int_list(value: str) -> List[int]:
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'无效的数值列表: {value}')
+
+
+def format_list(value: str) -> List[str]:
+    names = [item.strip().lower() for item in value.split(',') if item.strip()]
+    unknown = [name for name in names if name not in OUTPUT_FORMATS]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(f"未知的输出格式: {', '.join(unknown) or value}，可选 {', '.join(OUTPUT_FORMATS)}")
+    return names
+
+
+def time_arg(value: str) -> float:
+    """接受秒数或 MM:SS / HH:MM:SS 格式"""
+    try:
+        seconds = 0.0
+        for part in value.split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'无效的时间: {value}')
+
+
+def crop_arg(value: str) -> Tuple[int, int, int, int]:
+    """与 ffmpeg 的 crop 滤镜相同的 宽:高:X:Y，返回 (x, y, 宽, 高)"""
+    try:
+        width, height, x, y = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'无效的裁剪区域: {value}，格式为 宽:高:X:Y')
+    if width < 2 or height < 2 or x < 0 or y < 0:
+        raise argparse.ArgumentTypeError(f'无效的裁剪区域: {value}')
+    return x, y, width, height
+
+
+def build_outputs(input_video: str, fps_list: List[int], width_list: List[int],
+                  output_dir: str = None, formats: List[str] = ('gif',)) -> List[OutputSpec]:
+    """多个帧率/宽度组合时，文件名加上 _<宽度>w_<帧率>fps 后缀；每种格式各输出一份，扩展名不同"""
+    variants = [(fps, width) for width in width_list for fps in fps_list]
+    extensions = [OUTPUT_FORMATS[name].extension for name in formats]
+    if len(variants) == 1:
+        fps, width = variants[0]
+        return [OutputSpec(output_path_for(input_video, output_dir, '', extension), fps, width)
+                for extension in extensions]
+    return [OutputSpec(output_path_for(input_video, output_dir, f'_{width}w_{fps}fps', extension), fps, width)
+            for fps, width in variants for extension in extensions]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='vid2gif', description='批量将视频转换为 GIF')
+    parser.add_argument('inputs', nargs='*', help='视频文件、通配符或目录')
+    parser.add_argument('--fps', type=int_list, default=[10],
+                        help='输出帧率，可用逗号分隔多个（默认 10）')
+    parser.add_argument('--width', type=int_list, default=[480],
+                        help='输出宽度，高度按比例，可用逗号分隔多个（默认 480）')
+    parser.add_argument('--format', type=format_list, default=['gif'],
+                        help=f"输出格式，可用逗号分隔多个，同一次解码输出：{', '.join(OUTPUT_FORMATS)}（默认 gif）")
+    parser.add_argument('--start', type=time_arg, help='截取起点，秒或 HH:MM:SS')
+    parser.add_argument('--end', type=time_arg, help='截取终点，秒或 HH:MM:SS')
+    parser.add_argument('--crop', type=crop_arg, default=None, metavar='W:H:X:Y',
+                        help='先裁剪画面再缩放，坐标为源视频显示尺寸上的像素，--width 按裁剪后的宽度等比缩放')
+    parser.add_argument('-o', '--output-dir', help='输出目录，默认与源文件相同')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='同时运行的 ffmpeg 进程数，默认按核数自动选择')
+    parser.add_argument('--backend', choices=['ffmpeg', 'native'], default='ffmpeg',
+                        help='编码后端：ffmpeg 的 palettegen/paletteuse，或 NumPy 实现的内置编码器')
+    parser.add_argument('--parallel', action='store_true',
+                        help='分段并行模式：逐个处理文件，每个文件切段后用所有核并行编码，适合长视频')
+    parser.add_argument('--resumable', action='store_true',
+                        help='可续转模式：按固定时长分块编码，进度记录在输出文件旁的 .parts 目录，中断后用同样的参数重新运行即可继续')
+    parser.add_argument('--chunk-seconds', type=float, default=CHUNK_SECONDS,
+                        help=f'可续转模式的分块时长（秒，默认 {CHUNK_SECONDS:g}），中断时最多损失一块的工作')
+    parser.add_argument('--palette', choices=['global', 'scene'], default='global',
+                        help='调色板：整段共用一个，或按场景切换分别生成并按运动程度选择抖动方式')
+    parser.add_argument('--scene-threshold', type=float, default=SCENE_THRESHOLD,
+                        help=f'分场景调色板的切换阈值（0 - 1，默认 {SCENE_THRESHOLD:g}），越小切得越多')
+    parser.add_argument('--exact-decode', action='store_true',
+                        help='总是完整解码每一帧，不自动启用快速解码（跳帧解码和预缩放）')
+    parser.add_argument('--quality', action='store_true',
+                        help='转换后与缩放后的源视频比较，把每个输出的 PSNR 和 SSIM 写入汇总')
+    parser.add_argument('--max-size', type=float, default=None, metavar='MB',
+                        help='输出大小上限（MB）：先试编几段样本，在 --fps/--width 以内选出不超过上限的帧率、宽度和颜色数')
+    parser.add_argument('--optimize', action='store_true',
+                        help='转换后做帧间优化：合并重复帧、只保留变化区域，适合屏幕录像（内置编码器总是优化）')
+    parser.add_argument('--skip-existing', action='store_true', help='跳过已存在的输出文件')
+    parser.add_argument('--no-cache', action='store_true', help='不使用输出缓存，总是重新转换')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2,
+                        help='输出缓存的大小上限（MB），超过时淘汰最久未用的结果')
+    parser.add_argument('--cache-stats', action='store_true', help='显示输出缓存的命中率和节省的字节数后退出')
+    parser.add_argument('--telemetry-log', default=None,
+                        help='每个任务的性能记录（JSON Lines）写入路径，默认在缓存目录下的 telemetry/jobs.jsonl')
+    parser.add_argument('--no-telemetry', action='store_true', help='不记录任务的性能数据')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='运行期间在 127.0.0.1 的该端口以 Prometheus 文本格式提供 /metrics')
+    parser.add_argument('--summary', default='-', help='JSON 汇总的写入路径，- 表示标准输出')
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    cache = None if args.no_cache else OutputCache(max_bytes=args.cache_size * 1024 ** 2)
+    if args.cache_stats:
+        print(json.dumps((cache or OutputCache()).stats(), ensure_ascii=False, indent=2))
+        return 0
+    if not args.inputs:
+        parser.error('需要至少一个输入')
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print('没有找到视频文件', file=sys.stderr)
+        return 2
+
+    jobs = []
+    for input_video in inputs:
+        # 同一源文件的所有帧率/宽度组合在一次解码中完成
+        outputs = build_outputs(input_video, args.fps, args.width, args.output_dir, args.format)
+        if args.skip_existing:
+            outputs = [spec for spec in outputs if not os.path.exists(spec.output_path)]
+        if not outputs:
+            continue
+        first = outputs[0]
+        jobs.append(ConversionJob(input_video, first.output_path, first.fps, first.width,
+                                  extra_outputs=outputs[1:], start=args.start, end=args.end,
+                                  fast_decode=not args.exact_decode, crop=args.crop))
+
+    scene = args.palette == 'scene'
+    if sum((args.parallel, args.resumable, scene, args.backend == 'native')) > 1:
+        print('分段并行、可续转、分场景调色板和内置编码器只能选择一种', file=sys.stderr)
+        return 2
+    if ((args.parallel or args.resumable or scene or args.backend == 'native' or args.max_size)
+            and any(job.extra_outputs for job in jobs)):
+        print('分段并行模式、可续转模式、分场景调色板、内置编码器和大小上限不支持多个帧率/宽度组合或格式', file=sys.stderr)
+        return 2
+    if (args.parallel or args.resumable or scene or args.backend == 'native') and args.format != ['gif']:
+        print('分段并行模式、可续转模式、分场景调色板和内置编码器只支持 GIF 输出', file=sys.stderr)
+        return 2
+    if scene:
+        scheduler = BatchScheduler(args.jobs)
+        convert_fn = partial(scene_convert, threshold=args.scene_threshold)
+    elif args.resumable:
+        scheduler = BatchScheduler(args.jobs)
+        convert_fn = partial(resumable_convert, chunk_seconds=args.chunk_seconds)
+    elif args.parallel:
+        # 文件依次处理，并发度用在同一文件的分段上
+        scheduler = BatchScheduler(1)
+        convert_fn = partial(parallel_convert, workers=args.jobs)
+    else:
+        scheduler = BatchScheduler(args.jobs)
+        convert_fn = native_convert if args.backend == 'native' else convert
+    if args.max_size:
+        convert_fn = partial(target_size_convert, max_bytes=int(args.max_size * 1024 ** 2), convert_fn=convert_fn)
+    if cache is not None:
+        convert_fn = partial(cached_convert, cache=cache, convert_fn=convert_fn)
+    sinks = []
+    if not args.no_telemetry:
+        sinks.append(JsonLinesLog(args.telemetry_log or default_log_path()))
+    server = None
+    if args.metrics_port:
+        registry = MetricsRegistry()
+        sinks.append(registry)
+        server = serve_metrics(registry, args.metrics_port)
+    if sinks:
+        convert_fn = partial(instrumented_convert, convert_fn=convert_fn, sinks=tuple(sinks))
+    jobs_by_input = {job.input_video: job for job in jobs}
+    print(f'{len(jobs)} 个任务，{scheduler.jobs} 个并发进程，每个 {scheduler.threads_per_job} 线程',
+          file=sys.stderr)
+
+    def on_done(result):
+        reports = []
+        if args.quality and result.success:
+            job = jobs_by_input[result.input_video]
+            reports = [measure_quality(job, spec) for spec in job.outputs]
+            result.quality = [report.to_json() for report in reports if report is not None]
+        status = 'OK  ' if result.success else 'FAIL'
+        optimized = ''
+        if result.bytes_before_optimize:
+            optimized = f', {result.bytes_before_optimize} -> {result.output_bytes} 字节'
+        quality = ''.join(f", PSNR {report.psnr:.2f} dB, SSIM {report.ssim:.4f}" for report in reports[:1] if report)
+        print(f'[{status}] {result.input_video} -> {result.output_path} ({result.elapsed:.1f}s{optimized}{quality})',
+              file=sys.stderr)
+
+    # 内置编码器在编码时已经做了帧间优化
+    try:
+        results = scheduler.run(jobs, on_done, convert_fn, args.optimize and args.backend != 'native')
+    finally:
+        if server is not None:
+            server.shutdown()
+    summary = {
+        'jobs': scheduler.jobs,
+        'threads_per_job': scheduler.threads_per_job,
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r.success),
+        'failed': sum(1 for r in results if not r.success),
+        'skipped': len(inputs) - len(jobs),
+        'results': [r.to_json() for r in results],
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary == '-':
+        print(text)
+    else:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# 应用内的转换队列：按优先级和顺序启动任务，同时运行的任务数和每个任务的线程数由 CpuGovernor 决定
+import itertools
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import Callable, List, Optional
+
+from PySide6.QtCore import QObject, QThread, QTimer, Signal
+
+from api import convert_job
+from converter import CancelToken, ConversionCancelled, ConversionJob, convert, conversion_failed
+from scheduler import CpuGovernor
+
+GOVERNOR_INTERVAL_MS = 2000  # 有任务排队时按此间隔重新评估负载
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "高", PRIORITY_NORMAL: "普通", PRIORITY_LOW: "低"}
+
+STATE_QUEUED = "排队中"
+STATE_RUNNING = "转换中"
+STATE_CANCELLING = "正在取消"
+STATE_DONE = "完成"
+STATE_FAILED = "失败"
+STATE_CANCELLED = "已取消"
+FINISHED_STATES = (STATE_DONE, STATE_FAILED, STATE_CANCELLED)
+
+_ids = itertools.count(1)
+
+
+class ConversionThread(QThread):
+    progress_update = Signal(int)
+    error = Signal(str)
+    optimized = Signal(int, int)  # 帧间优化前后的字节数
+    metrics_ready = Signal(str)  # 性能摘要
+    cancelled = Signal()
+    success = Signal()
+
+    def __init__(self, job, duration, convert_fn=convert, optimize=False, cancel_token=None):
+        super().__init__()
+        self.job = job
+        self.duration = duration
+        self.convert_fn = convert_fn
+        self.optimize = optimize
+        self.cancel_token = cancel_token or CancelToken()
+
+    def run(self):
+        from telemetry import JsonLinesLog, default_log_path  # http.server 等，第一次转换时才导入
+
+        try:
+            # 按已输出时长计算进度，完成前不超过99%
+            def on_progress(progress):
+                self.progress_update.emit(min(int(progress.fraction * 100), 99))
+
+            # 同样的源文件和设置再次转换时直接从输出缓存取结果；性能数据写入 JSON Lines 日志
+            outcome = convert_job(self.job, self.duration, on_progress, self.convert_fn, self.optimize,
+                                  use_cache=True, sinks=(JsonLinesLog(default_log_path()),),
+                                  on_metrics=lambda metrics: self.metrics_ready.emit(metrics.summary()),
+                                  cancel=self.cancel_token)
+
+            if conversion_failed(outcome.result):
+                self.error.emit(f"FFmpeg error: {outcome.result.stderr}")
+            else:
+                stats = outcome.optimize_stats
+                if stats:
+                    self.optimized.emit(sum(s.bytes_before for s in stats), sum(s.bytes_after for s in stats))
+                self.success.emit()
+
+            # 确保进度到达100%
+            self.progress_update.emit(100)
+
+        except ConversionCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(f"Error: {str(e)}")
+
+
+@dataclass
+class QueueEntry:
+    job: ConversionJob
+    duration: Optional[float]
+    convert_fn: Callable = convert
+    optimize: bool = False
+    priority: int = PRIORITY_NORMAL
+    entry_id: int = 0
+    state: str = STATE_QUEUED
+    progress: int = 0
+    threads: int = 0  # 启动时分配的线程数
+    message: str = ''  # 错误信息或帧间优化结果
+    metrics: str = ''  # 性能摘要
+    reported: bool = False  # 界面已经汇总提示过结果
+    cancel_token: CancelToken = field(default_factory=CancelToken, repr=False)
+    thread: Optional[ConversionThread] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if not self.entry_id:
+            self.entry_id = next(_ids)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+
+class ConversionQueue(QObject):
+    """
+    转换队列。排队的任务先按优先级、再按队列中的顺序启动，每次有任务结束、加入或调整时重新调度；
+    有任务在排队时定时重新评估机器负载。线程数在启动时确定，运行中的 ffmpeg 无法再调整。
+    """
+    entry_changed = Signal(int)  # entry_id，状态、进度或信息有变化
+    entry_finished = Signal(int)
+
+    def __init__(self, governor: Optional[CpuGovernor] = None, parent=None):
+        super().__init__(parent)
+        self.governor = governor or CpuGovernor()
+        self.entries: List[QueueEntry] = []
+        self.timer = QTimer(self)
+        self.timer.setInterval(GOVERNOR_INTERVAL_MS)
+        self.timer.timeout.connect(self.schedule)
+
+    def entry(self, entry_id: int) -> Optional[QueueEntry]:
+        for entry in self.entries:
+            if entry.entry_id == entry_id:
+                return entry
+        return None
+
+    def running(self) -> List[QueueEntry]:
+        return [entry for entry in self.entries if entry.state in (STATE_RUNNING, STATE_CANCELLING)]
+
+    def busy(self) -> bool:
+        return any(not entry.finished for entry in self.entries)
+
+    def add(self, entry: QueueEntry) -> QueueEntry:
+        self.entries.append(entry)
+        self.entry_changed.emit(entry.entry_id)
+        self.schedule()
+        return entry
+
+    def schedule(self) -> None:
+        running = self.running()
+        # sorted 是稳定排序，同优先级保持队列中的顺序
+        waiting = sorted((entry for entry in self.entries if entry.state == STATE_QUEUED),
+                         key=lambda entry: entry.priority)
+        for entry in waiting:
+            threads = self.governor.allocate([item.threads for item in running])
+            if not threads:
+                break
+            self._start(entry, threads)
+            running.append(entry)
+        if any(entry.state == STATE_QUEUED for entry in self.entries):
+            if not self.timer.isActive():
+                self.timer.start()
+        else:
+            self.timer.stop()
+
+    def _start(self, entry: QueueEntry, threads: int) -> None:
+        entry.threads = threads
+        entry.state = STATE_RUNNING
+        thread = ConversionThread(replace(entry.job, threads=threads), entry.duration, entry.convert_fn,
+                                  entry.optimize, entry.cancel_token)
+        entry_id = entry.entry_id
+        thread.progress_update.connect(partial(self._on_progress, entry_id))
+        thread.optimized.connect(partial(self._on_optimized, entry_id))
+        thread.metrics_ready.connect(partial(self._on_metrics, entry_id))
+        thread.error.connect(partial(self._on_error, entry_id))
+        thread.cancelled.connect(partial(self._on_cancelled, entry_id))
+        thread.success.connect(partial(self._on_success, entry_id))
+        thread.finished.connect(partial(self._on_finished, entry_id))
+        entry.thread = thread
+        thread.start()
+        self.entry_changed.emit(entry_id)
+
+    def _update(self, entry_id: int, **changes) -> None:
+        entry = self.entry(entry_id)
+        if entry is None:
+            return
+        for name, value in changes.items():
+            setattr(entry, name, value)
+        self.entry_changed.emit(entry_id)
+
+    def _on_progress(self, entry_id: int, value: int) -> None:
+        self._update(entry_id, progress=value)
+
+    def _on_optimized(self, entry_id: int, before: int, after: int) -> None:
+        self._update(entry_id, message=f"帧间优化：{before / 1024:.0f} KB → {after / 1024:.0f} KB")
+
+    def _on_metrics(self, entry_id: int, summary: str) -> None:
+        self._update(entry_id, metrics=summary)
+
+    def _on_error(self, entry_id: int, message: str) -> None:
+        self._update(entry_id, state=STATE_FAILED, message=message)
+
+    def _on_cancelled(self, entry_id: int) -> None:
+        self._update(entry_id, state=STATE_CANCELLED)
+
+    def _on_success(self, entry_id: int) -> None:
+        self._update(entry_id, state=STATE_DONE, progress=100)
+
+    def _on_finished(self, entry_id: int) -> None:
+        entry = self.entry(entry_id)
+        if entry is not None:
+            if not entry.finished:
+                # 线程没有报告结果（不应发生），按失败处理，免得一直占着线程预算
+                entry.state = STATE_FAILED
+            if entry.thread is not None:
+                entry.thread.deleteLater()
+                entry.thread = None
+            self.entry_changed.emit(entry_id)
+            self.entry_finished.emit(entry_id)
+        self.schedule()
+
+    def cancel(self, entry_id: int) -> None:
+        """排队中的任务直接取消；运行中的任务结束 ffmpeg 并删除不完整的输出"""
+        entry = self.entry(entry_id)
+        if entry is None or entry.finished:
+            return
+        if entry.state == STATE_QUEUED:
+            entry.state = STATE_CANCELLED
+            self.entry_changed.emit(entry_id)
+            self.entry_finished.emit(entry_id)
+            self.schedule()
+        else:
+            entry.cancel_token.cancel()
+            self._update(entry_id, state=STATE_CANCELLING)
+
+    def move(self, entry_id: int, offset: int) -> None:
+        entry = self.entry(entry_id)
+        if entry is None:
+            return
+        index = self.entries.index(entry)
+        target = max(0, min(len(self.entries) - 1, index + offset))
+        if target != index:
+            self.entries.insert(target, self.entries.pop(index))
+            self.entry_changed.emit(entry_id)
+
+    def set_priority(self, entry_id: int, priority: int) -> None:
+        entry = self.entry(entry_id)
+        if entry is not None and entry.priority != priority:
+            self._update(entry_id, priority=priority)
+            self.schedule()
+
+    def clear_finished(self) -> List[int]:
+        # 已报告结果但线程还没退出的任务留到下次，线程对象由 _on_finished 释放
+        removed = [entry.entry_id for entry in self.entries if entry.finished and entry.thread is None]
+        self.entries = [entry for entry in self.entries if entry.entry_id not in removed]
+        return removed
+
+    def shutdown(self, msecs: int = 5000) -> None:
+        """退出前取消所有任务并等待线程结束"""
+        self.timer.stop()
+        for entry in list(self.entries):
+            if entry.state == STATE_QUEUED:
+                entry.state = STATE_CANCELLED
+            elif not entry.finished:
+                entry.cancel_token.cancel()
+        for entry in self.entries:
+            if entry.thread is not None:
+                entry.thread.wait(msecs)
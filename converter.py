@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# 视频转 GIF（以及 WebP、APNG、MP4、WebM 动图）的核心逻辑，不依赖 Qt，图形界面和命令行共用
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from ffmpeg_runner import DECODE_PROBE_FILTER, FFmpegProgress, FFmpegResult, find_binary, run_ffmpeg
+
+# 每个输出分支：缩放后生成调色板并应用
+GIF_CHAIN = 'scale={width}:-1:flags=lanczos,split[s{i}][t{i}];[s{i}]{palettegen}[p{i}];[t{i}][p{i}]paletteuse[out{i}]'
+MAX_COLORS = 256
+PIPE_OUTPUT = 'pipe:1'  # 输出路径为此值时 GIF 写到 stdout，由 convert 的 output 参数接收
+# 快速解码：源帧率达到输出帧率的 SKIP_FRAME_RATIO 倍时，解码器跳过不被其他帧参考的帧；
+# 源宽度达到输出宽度的 2 * PRESCALE_FACTOR 倍时，先用 area 缩到输出宽度的 PRESCALE_FACTOR 倍再做 lanczos
+SKIP_FRAME_RATIO = 4
+PRESCALE_FACTOR = 3
+MIN_CROP_SIZE = 16
+
+
+def normalize_crop(crop: Optional[Tuple[int, int, int, int]],
+                   display_size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    把裁剪区域限制在画面内，坐标和宽高取偶数（yuv420p 输出要求偶数尺寸）。
+    覆盖整个画面或小于 MIN_CROP_SIZE 时返回 None，即不裁剪。
+    """
+    if crop is None:
+        return None
+    frame_width, frame_height = display_size
+    x, y, width, height = (int(value) for value in crop)
+    x = min(max(0, x), frame_width) // 2 * 2
+    y = min(max(0, y), frame_height) // 2 * 2
+    width = min(width, frame_width - x) // 2 * 2
+    height = min(height, frame_height - y) // 2 * 2
+    if width < MIN_CROP_SIZE or height < MIN_CROP_SIZE:
+        return None
+    if width >= frame_width // 2 * 2 and height >= frame_height // 2 * 2:
+        return None
+    return x, y, width, height
+
+
+def palettegen_filter(colors: int = MAX_COLORS) -> str:
+    return 'palettegen' if colors >= MAX_COLORS else f'palettegen=max_colors={max(2, colors)}'
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    name: str
+    extension: str
+    label: str  # 文件对话框中的类型名
+    codec_options: Tuple[str, ...] = ()
+    even_size: bool = False  # yuv420p 编码要求宽高都是偶数
+    pixel_format: str = ''
+
+    def chain(self, spec: 'OutputSpec', i: int) -> str:
+        """缩放后的滤镜分支，以 [out{i}] 结尾"""
+        if self.name == 'gif':
+            return GIF_CHAIN.format(width=spec.width, i=i, palettegen=palettegen_filter(spec.colors))
+        width = spec.width // 2 * 2 if self.even_size else spec.width
+        pixel_format = f',format={self.pixel_format}' if self.pixel_format else ''
+        return f'scale={width}:-2:flags=lanczos{pixel_format}[out{i}]'
+
+
+# 按扩展名选择输出格式。MP4/WebM 文件本身没有循环标记，网页中用 <video autoplay loop muted playsinline> 播放
+OUTPUT_FORMATS = {
+    'gif': OutputFormat('gif', '.gif', 'GIF'),
+    'webp': OutputFormat('webp', '.webp', 'WebP', ('-c:v', 'libwebp_anim', '-quality', '75', '-loop', '0')),
+    'apng': OutputFormat('apng', '.apng', 'APNG', ('-c:v', 'apng', '-plays', '0')),
+    'mp4': OutputFormat('mp4', '.mp4', 'MP4 (H.264)',
+                        ('-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-movflags', '+faststart'),
+                        even_size=True, pixel_format='yuv420p'),
+    'webm': OutputFormat('webm', '.webm', 'WebM (VP9)',
+                         ('-c:v', 'libvpx-vp9', '-crf', '35', '-b:v', '0', '-row-mt', '1', '-deadline', 'good',
+                          '-cpu-used', '4'),
+                         even_size=True, pixel_format='yuv420p'),
+}
+
+
+def output_format(path: str) -> OutputFormat:
+    """按扩展名确定输出格式，管道输出和未知扩展名为 GIF"""
+    extension = os.path.splitext(path)[1].lower()
+    for fmt in OUTPUT_FORMATS.values():
+        if fmt.extension == extension:
+            return fmt
+    return OUTPUT_FORMATS['gif']
+
+
+def require_gif(job: 'ConversionJob', mode: str) -> None:
+    """只能输出 GIF 的转换方式在开始前检查"""
+    for spec in job.outputs:
+        if output_format(spec.output_path).name != 'gif':
+            raise ValueError(f'{mode}只支持 GIF 输出')
+
+
+@dataclass
+class OutputSpec:
+    output_path: str
+    fps: int
+    width: int
+    colors: int = MAX_COLORS  # 调色板颜色数
+
+
+@dataclass
+class ConversionJob:
+    input_video: str
+    output_path: str
+    fps: int
+    width: int
+    threads: Optional[int] = None  # 每个 ffmpeg 进程可用的线程数，None 表示由 ffmpeg 自行决定
+    extra_outputs: List[OutputSpec] = field(default_factory=list)  # 同一次解码产生的其他输出
+    start: Optional[float] = None  # 截取范围的起点（秒），None 表示从头开始
+    end: Optional[float] = None  # 截取范围的终点（秒），None 表示到结尾
+    colors: int = MAX_COLORS
+    fast_decode: bool = True  # 按源视频的尺寸和帧率自动启用快速解码，见 plan_decode
+    crop: Optional[Tuple[int, int, int, int]] = None  # 裁剪区域 (x, y, 宽, 高)，源视频显示尺寸上的像素
+
+    def __post_init__(self):
+        if self.crop is not None:
+            x, y, width, height = self.crop
+            if x < 0 or y < 0 or width < 2 or height < 2:
+                raise ValueError(f'无效的裁剪区域: {self.crop}')
+
+    @property
+    def outputs(self) -> List[OutputSpec]:
+        return [OutputSpec(self.output_path, self.fps, self.width, self.colors)] + list(self.extra_outputs)
+
+    def clip_duration(self, source_duration: Optional[float]) -> Optional[float]:
+        """截取范围的实际时长，用于计算进度"""
+        start = self.start or 0.0
+        end = self.end if self.end is not None else source_duration
+        if end is None:
+            return None
+        if source_duration:
+            end = min(end, source_duration)
+        return max(0.0, end - start)
+
+    def seek_options(self) -> List[str]:
+        """放在 -i 之前的快速定位参数"""
+        return ['-ss', f'{self.start:.3f}'] if self.start else []
+
+    def trim_filter(self) -> str:
+        """快速定位后按时长精确裁剪，时间戳已从 0 开始"""
+        if self.end is None:
+            return ''
+        return f'trim=duration={max(0.0, self.end - (self.start or 0.0)):.3f},setpts=PTS-STARTPTS,'
+
+    def crop_filter(self) -> str:
+        """画面裁剪，放在缩放和生成调色板之前，之后的滤镜只处理保留的像素"""
+        if self.crop is None:
+            return ''
+        x, y, width, height = self.crop
+        return f'crop={width}:{height}:{x}:{y},'
+
+    def source_size(self, display_size: Tuple[int, int]) -> Tuple[int, int]:
+        """缩放前的画面尺寸：裁剪区域，或源视频的显示尺寸"""
+        return tuple(self.crop[2:]) if self.crop is not None else display_size
+
+
+@dataclass
+class DecodePlan:
+    skip_noref: bool = False  # 解码器跳过不被参考的帧（-skip_frame noref）
+    source_width: int = 0  # 缩放前的宽度（源视频的显示宽度或裁剪宽度），大于 0 时对大幅缩小的输出先做预缩放
+
+    def input_options(self) -> List[str]:
+        return ['-skip_frame', 'noref'] if self.skip_noref else []
+
+    def prescale_width(self, width: int) -> int:
+        """预缩放的目标宽度，不需要预缩放时为 0"""
+        if self.source_width >= 2 * PRESCALE_FACTOR * width:
+            return PRESCALE_FACTOR * width
+        return 0
+
+
+def plan_decode(job: ConversionJob, source_width: int, source_fps: float) -> DecodePlan:
+    """
+    输出比源视频小得多或帧率低得多时启用快速解码。不被参考的帧（通常是 B 帧）不影响其他帧的解码，
+    连续的这类帧一般不超过三个，
+    跳过后剩下的帧间隔仍不超过输出帧间隔，fps 滤镜选出的帧与完整解码时基本相同。
+    """
+    if not job.fast_decode:
+        return DecodePlan()
+    outputs = job.outputs
+    return DecodePlan(skip_noref=source_fps >= SKIP_FRAME_RATIO * max(spec.fps for spec in outputs),
+                      source_width=source_width)
+
+
+def source_decode_plan(job: ConversionJob) -> DecodePlan:
+    """探测源视频（命中探测缓存时不启动子进程）并决定解码方式，探测失败时按普通方式解码"""
+    if not job.fast_decode:
+        return DecodePlan()
+    from get_video_info import probe_video
+    info = probe_video(job.input_video)
+    if info is None:
+        return DecodePlan()
+    return plan_decode(job, job.source_size(info.display_size)[0], float(info.frame_rate or 0))
+
+
+class ConversionCancelled(Exception):
+    """任务被用户取消"""
+
+
+class CancelToken:
+    """
+    跨线程的取消标记。转换函数没有单独的取消参数，调用方在进度回调里调用 check()，
+    抛出的 ConversionCancelled 沿转换函数向上传播，run_ffmpeg 会先结束正在运行的子进程。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise ConversionCancelled('已取消')
+
+
+def replaces_output(convert_fn: Callable) -> bool:
+    """
+    转换函数是否只在完成时以替换的方式写出输出、之前保留已有的文件（如 resumable_convert）。
+    这样的转换开始前和取消后都不应删除输出。partial 包装（输出缓存、大小上限）按其中实际的转换函数判断。
+    """
+    while isinstance(convert_fn, partial):
+        convert_fn = convert_fn.keywords.get('convert_fn', convert_fn.func)
+    return getattr(convert_fn, 'replaces_output', False)
+
+
+def remove_outputs(job: 'ConversionJob') -> None:
+    """删除取消或失败的任务留下的不完整输出"""
+    for spec in job.outputs:
+        if spec.output_path == PIPE_OUTPUT:
+            continue
+        try:
+            os.remove(spec.output_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not remove {spec.output_path}: {e}")
+
+
+@dataclass
+class OutputProgress:
+    output_path: str
+    fraction: float
+    bytes_written: int
+
+
+@dataclass
+class ConversionProgress:
+    fraction: float  # 整个任务的完成比例
+    ffmpeg: FFmpegProgress
+    outputs: List[OutputProgress]
+
+
+def build_filtergraph(outputs: List[OutputSpec], trim: str = '', decode: Optional[DecodePlan] = None) -> str:
+    """
+    构建只解码一次的滤镜图：输入先按帧率分组 split，同帧率的输出共用 fps 滤镜，
+    再按输出各自缩放（需要时先预缩放）；GIF 输出生成调色板，其他格式直接交给编码器。
+    额外的 [tap] 分支经 showinfo 报告解码进度后丢弃。
+    """
+    decode = decode or DecodePlan()
+    groups: Dict[int, List[int]] = {}
+    for index, spec in enumerate(outputs):
+        groups.setdefault(spec.fps, []).append(index)
+
+    chains = [f'[0:v]{trim}split={len(groups) + 1}' + ''.join(f'[f{g}]' for g in range(len(groups))) + '[tap]']
+    for g, (fps, indexes) in enumerate(groups.items()):
+        if len(indexes) == 1:
+            heads = {indexes[0]: f'[f{g}]fps={fps},'}
+        else:
+            chains.append(f'[f{g}]fps={fps},split={len(indexes)}' + ''.join(f'[v{i}]' for i in indexes))
+            heads = {i: f'[v{i}]' for i in indexes}
+        for i in indexes:
+            prescale = decode.prescale_width(outputs[i].width)
+            if prescale:
+                heads[i] += f'scale={prescale}:-2:flags=area,'
+            chains.append(heads[i] + output_format(outputs[i].output_path).chain(outputs[i], i))
+    chains.append('[tap]' + DECODE_PROBE_FILTER)
+    return ';'.join(chains)
+
+
+def build_command(job: ConversionJob, ffmpeg_path: Optional[str] = None,
+                  decode: Optional[DecodePlan] = None) -> List[str]:
+    """decode 为 None 时按源视频决定（job.fast_decode 为 False 时不探测）"""
+    decode = decode or source_decode_plan(job)
+    command = [ffmpeg_path or find_binary('ffmpeg')]
+    if job.threads:
+        command += ['-filter_threads', str(job.threads), '-threads', str(job.threads)]
+    outputs = job.outputs
+    command += job.seek_options() + decode.input_options()
+    command += ['-i', job.input_video, '-filter_complex', build_filtergraph(outputs, job.trim_filter() + job.crop_filter(), decode),
+                '-y']
+    for i, spec in enumerate(outputs):
+        command += ['-map', f'[out{i}]']
+        if job.threads:
+            command += ['-threads', str(job.threads)]
+        command += list(output_format(spec.output_path).codec_options)
+        if spec.output_path == PIPE_OUTPUT:
+            # 管道输出无法从扩展名推断格式
+            command += ['-f', 'gif']
+        command.append(spec.output_path)
+    return command
+
+
+def conversion_failed(result: FFmpegResult) -> bool:
+    """ffmpeg 返回非零但只是报告 Output file is empty 时仍视为成功"""
+    return result.returncode != 0 and "Output file is empty" not in result.stderr
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def estimate_progress(job: ConversionJob, duration: Optional[float], progress: FFmpegProgress) -> ConversionProgress:
+    """
+    解码阶段按 decoded_time / duration 计算，编码阶段按第一个输出的帧数计算，各占一半。
+    所有输出共用同一次解码，编码阶段也基本同步，因此各输出的比例相同，只有已写出的字节数不同。
+    """
+    outputs = job.outputs
+    if progress.finished:
+        fraction = 1.0
+    elif not duration or duration <= 0:
+        fraction = 0.0
+    else:
+        decoded = min(max(progress.decoded_time, progress.out_time) / duration, 1.0)
+        expected_frames = duration * outputs[0].fps
+        encoded = min(progress.frame / expected_frames, 1.0) if expected_frames else 0.0
+        fraction = (decoded + encoded) / 2
+    return ConversionProgress(fraction, progress, [
+        OutputProgress(spec.output_path, fraction,
+                       progress.total_size if spec.output_path == PIPE_OUTPUT else _file_size(spec.output_path))
+        for spec in outputs
+    ])
+
+
+def convert(job: ConversionJob, duration: Optional[float] = None,
+            on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+            output: Optional[BinaryIO] = None, ffmpeg_path: Optional[str] = None) -> FFmpegResult:
+    """
+    执行一次转换（可能有多个输出）。duration 为源视频时长，设置了截取范围时按范围计算进度；
+    未提供 duration 且没有终点时完成比例恒为 0。
+    提供 output 时第一个输出不落盘，经管道写入这个二进制文件对象，job.output_path 会被忽略。
+    """
+    if output is not None:
+        job = replace(job, output_path=PIPE_OUTPUT)
+    duration = job.clip_duration(duration)
+    for spec in job.outputs:
+        if spec.output_path != PIPE_OUTPUT:
+            os.makedirs(os.path.dirname(os.path.abspath(spec.output_path)), exist_ok=True)
+
+    def report(progress: FFmpegProgress):
+        on_progress(estimate_progress(job, duration, progress))
+
+    return run_ffmpeg(build_command(job, ffmpeg_path), report if on_progress else None, output=output)
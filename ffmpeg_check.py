@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# ffmpeg 的版本和可用滤镜：每个可执行文件只查询一次，结果按路径、大小和修改时间缓存到磁盘
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from app_cache import cache_dir, load_json, save_json
+from ffmpeg_runner import find_binary, popen_kwargs
+
+REQUIRED_FILTERS = ('fps', 'scale', 'split', 'palettegen', 'paletteuse', 'showinfo')
+CACHE_FILE = 'capabilities.json'
+
+
+@dataclass
+class FFmpegCapabilities:
+    ffmpeg_path: str
+    ffprobe_path: str
+    found: bool = False  # ffmpeg 能够运行
+    ffprobe_found: bool = False
+    version: str = 'unknown'  # ffmpeg -version 的第一行
+    filters: List[str] = field(default_factory=list)
+
+    @property
+    def missing_filters(self) -> List[str]:
+        return [name for name in REQUIRED_FILTERS if name not in self.filters] if self.found else []
+
+    def problems(self) -> List[str]:
+        """界面上提示的问题，没有问题时为空"""
+        problems = []
+        if not self.found:
+            problems.append(f"找不到 ffmpeg（{self.ffmpeg_path}）")
+        elif self.missing_filters:
+            problems.append(f"ffmpeg 缺少滤镜: {', '.join(self.missing_filters)}")
+        if not self.ffprobe_found:
+            problems.append(f"找不到 ffprobe（{self.ffprobe_path}）")
+        return problems
+
+
+def _resolve(path: str) -> Optional[str]:
+    if os.path.isfile(path):
+        return path
+    return shutil.which(path)
+
+
+def _run(command: List[str]) -> Optional[str]:
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                 encoding='utf-8', errors='replace', **popen_kwargs())
+    except OSError:
+        return None
+    return process.stdout if process.returncode == 0 else None
+
+
+def _query(ffmpeg_path: str) -> Optional[Tuple[str, List[str]]]:
+    version_text = _run([ffmpeg_path, '-version'])
+    if version_text is None:
+        return None
+    lines = version_text.splitlines()
+    filters = []
+    # 滤镜列表的每一行形如 " TSC palettegen  V->V  说明"，说明部分前的标志位固定为三个字符
+    for line in (_run([ffmpeg_path, '-hide_banner', '-filters']) or '').splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and len(parts[0]) == 3 and '->' in parts[2]:
+            filters.append(parts[1])
+    return (lines[0].strip() if lines else 'unknown'), filters
+
+
+@lru_cache(maxsize=None)
+def _ffmpeg_info(ffmpeg_path: str, size: int, mtime_ns: int) -> Optional[Tuple[str, List[str]]]:
+    cache_path = os.path.join(cache_dir('ffmpeg'), CACHE_FILE)
+    key = f'{os.path.abspath(ffmpeg_path)}:{size}:{mtime_ns}'
+    cached = load_json(cache_path, {})
+    if key in cached:
+        return cached[key]['version'], cached[key]['filters']
+    info = _query(ffmpeg_path)
+    if info is not None:
+        cached = {k: v for k, v in cached.items() if not k.startswith(os.path.abspath(ffmpeg_path) + ':')}
+        cached[key] = {'version': info[0], 'filters': info[1]}
+        try:
+            save_json(cache_path, cached)
+        except OSError as e:
+            print(f"Warning: Could not save ffmpeg capabilities: {e}")
+    return info
+
+
+def ffmpeg_capabilities(ffmpeg_path: Optional[str] = None, ffprobe_path: Optional[str] = None) -> FFmpegCapabilities:
+    """
+    检查 ffmpeg 和 ffprobe。同一个 ffmpeg 只运行一次 -version 和 -filters，
+    结果缓存在磁盘上，可执行文件被替换（大小或修改时间变化）后重新查询。
+    """
+    ffmpeg_path = ffmpeg_path or find_binary('ffmpeg')
+    ffprobe_path = ffprobe_path or find_binary('ffprobe')
+    capabilities = FFmpegCapabilities(ffmpeg_path, ffprobe_path, ffprobe_found=_resolve(ffprobe_path) is not None)
+    resolved = _resolve(ffmpeg_path)
+    if resolved is None:
+        return capabilities
+    stat = os.stat(resolved)
+    info = _ffmpeg_info(resolved, stat.st_size, stat.st_mtime_ns)
+    if info is not None:
+        capabilities.found = True
+        capabilities.version, filters = info
+        capabilities.filters = list(filters)
+    return capabilities
+
+
+def ffmpeg_version(ffmpeg_path: Optional[str] = None) -> str:
+    """ffmpeg -version 的第一行，找不到 ffmpeg 时为 unknown"""
+    return ffmpeg_capabilities(ffmpeg_path).version
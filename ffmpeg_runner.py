@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+
+@dataclass
+class FFmpegProgress:
+    """ffmpeg -progress 输出的一个进度块"""
+    out_time: float = 0.0  # 已输出的时长（秒）
+    frame: int = 0
+    fps: float = 0.0
+    speed: float = 0.0  # 相对实时的倍速，未知时为 0
+    total_size: int = 0  # 已写出的字节数
+    decoded_time: float = 0.0  # 已解码的输入时长（秒），来自滤镜图中的 showinfo 分支
+    finished: bool = False
+
+    def fraction(self, duration: Optional[float]) -> float:
+        """按时长计算完成比例（0.0 - 1.0）"""
+        if self.finished:
+            return 1.0
+        if not duration or duration <= 0:
+            return 0.0
+        return max(0.0, min(self.out_time / duration, 1.0))
+
+
+@dataclass
+class ProcessUsage:
+    """子进程结束时的资源占用，来自 wait4；不支持的平台上没有这项数据"""
+    user_seconds: float = 0.0
+    system_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+
+    @property
+    def cpu_seconds(self) -> float:
+        return self.user_seconds + self.system_seconds
+
+
+@dataclass
+class FFmpegResult:
+    returncode: int
+    stderr: str
+    progress: FFmpegProgress
+    usage: Optional[ProcessUsage] = None
+
+
+def merge_usage(usages: List[Optional[ProcessUsage]]) -> Optional[ProcessUsage]:
+    """多个子进程的合计：CPU 时间相加，峰值内存取最大值"""
+    usages = [usage for usage in usages if usage is not None]
+    if not usages:
+        return None
+    return ProcessUsage(sum(u.user_seconds for u in usages), sum(u.system_seconds for u in usages),
+                        max(u.peak_rss_bytes for u in usages))
+
+
+def read_peak_rss(pid: int) -> int:
+    """
+    运行中子进程的峰值内存（/proc/<pid>/status 的 VmHWM），不支持或进程已退出时返回 0。
+    Linux 上 wait4 的 ru_maxrss 会继承 fork 时父进程的内存占用，父进程较大时不能反映 ffmpeg 本身。
+    """
+    try:
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def wait_process(process: subprocess.Popen, sampled_peak_rss: int = 0) -> Optional[ProcessUsage]:
+    """
+    等待子进程结束并返回其资源占用。sampled_peak_rss 为运行期间用 read_peak_rss 采样到的最大值，
+    有采样时优先使用；否则用 ru_maxrss（Linux 上以 KB 为单位，macOS 上以字节为单位）。
+    """
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # 已被其他地方回收
+        process.wait()
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+    return ProcessUsage(rusage.ru_utime, rusage.ru_stime, sampled_peak_rss or peak_rss)
+
+
+_configured_binaries: Dict[str, str] = {}
+# 自动查找的结果，每次转换和探测都要用到，进程内只查找一次；找不到时不记录，之后安装的 ffmpeg 仍能被找到
+_discovered_binaries: Dict[str, str] = {}
+
+
+def set_binary(name: str, path: Optional[str]) -> None:
+    """在程序中指定 ffmpeg/ffprobe 的路径，优先于环境变量；path 为 None 时恢复自动查找"""
+    if path:
+        _configured_binaries[name] = path
+    else:
+        _configured_binaries.pop(name, None)
+
+
+def find_binary(name: str = 'ffmpeg') -> str:
+    """
+    查找 ffmpeg/ffprobe 可执行文件。
+
+    依次检查 set_binary 指定的路径、环境变量 VID2GIF_FFMPEG / VID2GIF_FFPROBE、当前目录和程序所在目录，
+    最后查找 PATH。都找不到时返回名称本身，交由操作系统报错。
+    """
+    override = _configured_binaries.get(name) or os.environ.get(f'VID2GIF_{name.upper()}')
+    if override:
+        return override
+    if name in _discovered_binaries:
+        return _discovered_binaries[name]
+    exe_name = f'{name}.exe' if os.name == 'nt' else name
+    for directory in (os.getcwd(), os.path.dirname(os.path.abspath(sys.argv[0] or '.')),
+                      os.path.dirname(os.path.abspath(__file__))):
+        candidate = os.path.join(directory, exe_name)
+        if os.path.isfile(candidate):
+            _discovered_binaries[name] = candidate
+            return candidate
+    found = shutil.which(name)
+    if found:
+        _discovered_binaries[name] = found
+    return found or exe_name
+
+
+def popen_kwargs() -> dict:
+    """Windows 下隐藏 ffmpeg 的控制台窗口，其他平台无需额外参数"""
+    if os.name != 'nt':
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return {'startupinfo': startupinfo, 'creationflags': subprocess.CREATE_NO_WINDOW}
+
+
+def parse_timestamp(value: str) -> float:
+    """解析 HH:MM:SS.micro 格式的时间，无法解析时返回 0"""
+    try:
+        hours, minutes, seconds = value.strip().split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return 0.0
+
+
+class ProgressParser:
+    """逐行解析 ffmpeg -progress 的 key=value 输出，每个块以 progress= 结束"""
+
+    def __init__(self):
+        self.current = FFmpegProgress()
+
+    def feed(self, line: str) -> Optional[FFmpegProgress]:
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+        value = value.strip()
+        progress = self.current
+        if key == 'out_time_us':
+            # out_time_ms 实际也是微秒，这里统一使用 out_time_us
+            if value.lstrip('-').isdigit():
+                progress.out_time = max(0.0, int(value) / 1_000_000)
+        elif key == 'out_time' and not progress.out_time:
+            progress.out_time = parse_timestamp(value)
+        elif key == 'frame':
+            progress.frame = _to_int(value)
+        elif key == 'fps':
+            progress.fps = _to_float(value)
+        elif key == 'speed':
+            progress.speed = _to_float(value.rstrip('x'))
+        elif key == 'total_size':
+            progress.total_size = _to_int(value)
+        elif key == 'progress':
+            progress.finished = value == 'end'
+            self.current = FFmpegProgress()
+            return progress
+        return None
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _to_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+# 解码进度分支：palettegen 读完整个输入前不会输出任何帧，ffmpeg 在此期间也不写 -progress，
+# 因此在滤镜图中用 showinfo 打出已解码帧的时间戳
+DECODE_PROBE_FILTER = 'fps=2,showinfo=checksum=0,nullsink'
+_PTS_TIME = re.compile(r'pts_time:\s*(-?\d+(?:\.\d+)?)')
+
+
+_PROGRESS_LINE = re.compile(r'^[a-z0-9_]+=\S*$')
+STREAM_CHUNK = 64 * 1024
+
+
+def _read_lines(stream, source: str, events: queue.Queue):
+    for line in io.TextIOWrapper(stream, encoding='utf-8', errors='replace'):
+        events.put((source, line))
+    stream.close()
+    events.put((source, None))
+
+
+def _read_chunks(stream, events: queue.Queue):
+    while True:
+        chunk = stream.read1(STREAM_CHUNK)
+        if not chunk:
+            break
+        events.put(('data', chunk))
+    stream.close()
+    events.put(('data', None))
+
+
+def run_ffmpeg(command: List[str], on_progress: Optional[Callable[[FFmpegProgress], None]] = None,
+               interval: float = 0.1, stderr_lines: Optional[int] = 200,
+               output: Optional[BinaryIO] = None) -> FFmpegResult:
+    """
+    运行 ffmpeg 并通过 -progress 读取结构化进度。
+
+    stdout 和 stderr 各由一个后台线程同时排空，避免子进程因管道写满而阻塞；
+    stdout 解析为进度块，stderr 中 showinfo 的时间戳更新 decoded_time，其余行只保留最后 stderr_lines 行
+    （None 表示全部保留，用于解析滤镜逐帧打印的数据）。
+    提供 output 时命令应输出到 pipe:1，stdout 上的数据在调用线程中写入 output，进度改走 stderr。
+    on_progress 在调用线程中执行，间隔不小于 interval 秒，最后一个进度块总会回调；
+    回调抛出的异常会结束子进程后原样抛出。
+    """
+    progress_pipe = 'pipe:2' if output is not None else 'pipe:1'
+    command = [command[0], '-nostats', '-progress', progress_pipe] + list(command[1:])
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               **popen_kwargs())
+
+    stderr_tail = deque(maxlen=stderr_lines)
+    events = queue.Queue()
+    if output is not None:
+        threading.Thread(target=_read_chunks, args=(process.stdout, events), daemon=True).start()
+    else:
+        threading.Thread(target=_read_lines, args=(process.stdout, 'stdout', events), daemon=True).start()
+    threading.Thread(target=_read_lines, args=(process.stderr, 'stderr', events), daemon=True).start()
+
+    parser = ProgressParser()
+    last = FFmpegProgress()
+    decoded_time = 0.0
+    last_update_time = 0.0
+    last_sample_time = 0.0
+    peak_rss = 0
+    open_streams = 2
+    try:
+        while open_streams:
+            source, line = events.get()
+            current_time = time.monotonic()
+            if current_time - last_sample_time >= interval:
+                last_sample_time = current_time
+                peak_rss = max(peak_rss, read_peak_rss(process.pid))
+            if line is None:
+                open_streams -= 1
+                continue
+            if source == 'data':
+                output.write(line)
+                continue
+            if source == 'stderr':
+                match = _PTS_TIME.search(line) if 'Parsed_showinfo' in line else None
+                if match is not None:
+                    decoded_time = max(decoded_time, float(match.group(1)))
+                    progress = replace(last, decoded_time=decoded_time, finished=False)
+                elif output is not None and _PROGRESS_LINE.match(line.strip()):
+                    progress = parser.feed(line)
+                    if progress is None:
+                        continue
+                    progress.decoded_time = decoded_time
+                else:
+                    stderr_tail.append(line)
+                    continue
+            else:
+                progress = parser.feed(line)
+                if progress is None:
+                    continue
+                progress.decoded_time = decoded_time
+            last = progress
+            if on_progress and (progress.finished or current_time - last_update_time >= interval):
+                last_update_time = current_time
+                on_progress(progress)
+    except BaseException:
+        # 回调或写入 output 抛出异常（如任务被取消）时结束子进程，不留下还在写输出的 ffmpeg
+        process.kill()
+        process.wait()
+        raise
+
+    usage = wait_process(process, peak_rss)
+    return FFmpegResult(process.returncode, ''.join(stderr_tail), last, usage)
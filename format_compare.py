@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# 输出格式对比：截取一小段，以同样的帧率和宽度编码为每种格式，比较编码耗时和文件大小
+import argparse
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from converter import OUTPUT_FORMATS, ConversionJob, convert, conversion_failed
+from get_video_info import probe_video
+
+SAMPLE_SECONDS = 3.0
+
+
+@dataclass
+class FormatSample:
+    format: str
+    label: str
+    seconds: float  # 编码样本的耗时（含解码）
+    bytes: int
+    error: str = ''
+
+    def to_json(self):
+        return asdict(self)
+
+
+def sample_range(duration: float, start: Optional[float] = None, end: Optional[float] = None,
+                 sample_seconds: float = SAMPLE_SECONDS) -> Tuple[float, float]:
+    """样本的 (起点, 终点)：从截取范围的起点开始，没有截取范围时取视频中间的一段"""
+    if start is None and end is None and duration > sample_seconds:
+        start = (duration - sample_seconds) / 2
+    start = start or 0.0
+    stop = start + sample_seconds
+    if end is not None:
+        stop = min(stop, end)
+    if duration > 0:
+        stop = min(stop, duration)
+    return start, max(stop, start)
+
+
+def compare_formats(input_video: str, fps: int, width: int, start: Optional[float] = None,
+                    end: Optional[float] = None, duration: Optional[float] = None,
+                    sample_seconds: float = SAMPLE_SECONDS, formats: Optional[Sequence[str]] = None,
+                    output_dir: Optional[str] = None, crop: Optional[Tuple[int, int, int, int]] = None,
+                    on_progress: Optional[Callable[[float], None]] = None) -> List[FormatSample]:
+    """
+    把同一段样本依次编码为 formats 中的每种格式（默认全部），返回各格式的耗时和字节数。
+    每种格式单独运行一次 ffmpeg，耗时可以直接比较。output_dir 为 None 时样本在临时目录中，结束后删除。
+    """
+    formats = list(formats or OUTPUT_FORMATS)
+    if duration is None:
+        info = probe_video(input_video)
+        duration = info.duration if info else 0.0
+    sample_start, sample_end = sample_range(duration, start, end, sample_seconds)
+    name = os.path.splitext(os.path.basename(input_video))[0]
+
+    def run(directory: str) -> List[FormatSample]:
+        samples = []
+        for index, key in enumerate(formats):
+            fmt = OUTPUT_FORMATS[key]
+            output_path = os.path.join(directory, f'{name}_sample{fmt.extension}')
+            job = ConversionJob(input_video, output_path, fps, width, start=sample_start, end=sample_end, crop=crop)
+
+            def report(progress, index=index):
+                if on_progress:
+                    on_progress((index + progress.fraction) / len(formats))
+
+            began = time.monotonic()
+            result = convert(job, duration, report)
+            elapsed = time.monotonic() - began
+            error = ''
+            if conversion_failed(result):
+                lines = result.stderr.strip().splitlines()
+                error = lines[-1] if lines else str(result.returncode)
+            size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+            samples.append(FormatSample(key, fmt.label, round(elapsed, 3), size, error))
+        return samples
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        return run(output_dir)
+    with tempfile.TemporaryDirectory(prefix='vid2gif-formats-') as tmp:
+        return run(tmp)
+
+
+def format_table(samples: List[FormatSample]) -> List[str]:
+    """按字节数排序的对比表，大小同时给出相对 GIF 的比例"""
+    gif_bytes = next((s.bytes for s in samples if s.format == 'gif' and not s.error), 0)
+    lines = [f"{'格式':<14}{'耗时(s)':>10}{'字节':>12}{'相对 GIF':>10}"]
+    for sample in sorted(samples, key=lambda s: (bool(s.error), s.bytes)):
+        if sample.error:
+            lines.append(f'{sample.label:<14}失败: {sample.error}')
+            continue
+        ratio = f'{sample.bytes / gif_bytes:.0%}' if gif_bytes else '-'
+        lines.append(f'{sample.label:<14}{sample.seconds:>10.2f}{sample.bytes:>12}{ratio:>10}')
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把一段样本编码为各种输出格式，比较耗时和大小')
+    parser.add_argument('input')
+    parser.add_argument('--fps', type=int, default=10)
+    parser.add_argument('--width', type=int, default=480)
+    parser.add_argument('--start', type=float, default=None, help='样本起点（秒），默认取视频中间')
+    parser.add_argument('--seconds', type=float, default=SAMPLE_SECONDS, help='样本时长（秒）')
+    parser.add_argument('--formats', default=','.join(OUTPUT_FORMATS), help='逗号分隔的格式')
+    parser.add_argument('-o', '--output-dir', default=None, help='保留样本文件的目录，默认不保留')
+    args = parser.parse_args()
+    names = [name for name in args.formats.split(',') if name]
+    unknown = [name for name in names if name not in OUTPUT_FORMATS]
+    if unknown:
+        parser.error(f"未知的输出格式: {', '.join(unknown)}")
+    for line in format_table(compare_formats(args.input, args.fps, args.width, args.start,
+                                             sample_seconds=args.seconds, formats=names,
+                                             output_dir=args.output_dir)):
+        print(line)
+    sys.exit(0)
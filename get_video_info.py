@@ -1,63 +1,223 @@
 import subprocess
 import os
-import re
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from fractions import Fraction
 from typing import Dict, Optional
 
+from app_cache import cache_dir, load_json, save_json
+from ffmpeg_runner import find_binary, popen_kwargs
 
-def get_video_info(video_path: str) -> Optional[Dict]:
-    ffmpeg_path = 'ffmpeg.exe'
-    if not os.path.exists(ffmpeg_path):
-        print(f"Error: {ffmpeg_path} not found.")
+
+@dataclass
+class VideoInfo:
+    width: int  # 编码尺寸，未考虑旋转
+    height: int
+    frame_rate: Fraction  # 精确的有理数帧率
+    duration: float
+    nb_frames: Optional[int]  # 容器记录的帧数，部分格式没有
+    codec: str
+    pix_fmt: str
+    rotation: int  # 顺时针旋转角度，0/90/180/270
+    stream_index: int  # 选中的视频流在文件中的序号
+
+    @property
+    def display_size(self):
+        """ffmpeg 默认自动旋转，滤镜看到的是旋转后的尺寸"""
+        if self.rotation % 180 == 90:
+            return self.height, self.width
+        return self.width, self.height
+
+    @property
+    def total_frames(self) -> int:
+        if self.nb_frames:
+            return self.nb_frames
+        return int(self.duration * self.frame_rate)
+
+    def to_json(self) -> Dict:
+        data = asdict(self)
+        data['frame_rate'] = f'{self.frame_rate.numerator}/{self.frame_rate.denominator}'
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'VideoInfo':
+        data = dict(data)
+        data['frame_rate'] = Fraction(data['frame_rate'])
+        return cls(**data)
+
+
+class ProbeCache:
+    """
+    磁盘上的探测结果缓存，以 (路径, 大小, 修改时间) 为键，超过 max_entries 时按最近最少使用淘汰。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1024):
+        self.path = path or os.path.join(cache_dir(), 'probe_cache.json')
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self) -> OrderedDict:
+        if self._entries is None:
+            data = load_json(self.path, {})
+            self._entries = OrderedDict(data if isinstance(data, dict) else {})
+        return self._entries
+
+    @staticmethod
+    def _stat_key(video_path: str):
+        stat = os.stat(video_path)
+        return os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, video_path: str) -> Optional[VideoInfo]:
+        try:
+            key, size, mtime_ns = self._stat_key(video_path)
+        except OSError:
+            return None
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if not entry or entry.get('size') != size or entry.get('mtime_ns') != mtime_ns:
+                return None
+            entries.move_to_end(key)
+            try:
+                return VideoInfo.from_json(entry['info'])
+            except (KeyError, TypeError, ValueError, ZeroDivisionError):
+                return None
+
+    def put(self, video_path: str, info: VideoInfo) -> None:
+        try:
+            key, size, mtime_ns = self._stat_key(video_path)
+        except OSError:
+            return
+        with self._lock:
+            entries = self._load()
+            entries[key] = {'size': size, 'mtime_ns': mtime_ns, 'info': info.to_json()}
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            try:
+                save_json(self.path, entries)
+            except OSError as e:
+                print(f"Warning: Could not write probe cache: {e}")
+
+
+_default_cache = None
+
+
+def default_cache() -> ProbeCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ProbeCache()
+    return _default_cache
+
+
+def _parse_rate(value: Optional[str]) -> Fraction:
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return Fraction(0)
+    return rate if rate > 0 else Fraction(0)
+
+
+def _rotation(stream: Dict) -> int:
+    rotation = stream.get('tags', {}).get('rotate')
+    if rotation is None:
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                # displaymatrix 中的角度为逆时针
+                rotation = -float(side_data['rotation'])
+                break
+    try:
+        return int(round(float(rotation or 0))) % 360
+    except ValueError:
+        return 0
+
+
+def _select_video_stream(streams):
+    """选择第一个非封面图的视频流，有默认标记的优先"""
+    candidates = [s for s in streams
+                  if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')]
+    for stream in candidates:
+        if stream.get('disposition', {}).get('default'):
+            return stream
+    return candidates[0] if candidates else None
+
+
+def parse_probe_output(output: str) -> Optional[VideoInfo]:
+    """解析 ffprobe -print_format json 的输出"""
+    data = json.loads(output)
+    stream = _select_video_stream(data.get('streams', []))
+    if stream is None:
+        print("Warning: No video stream found.")
         return None
 
-    cmd = [ffmpeg_path, '-i', video_path]
+    frame_rate = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+    try:
+        duration = float(stream.get('duration') or data.get('format', {}).get('duration') or 0)
+    except ValueError:
+        duration = 0.0
+    try:
+        nb_frames = int(stream['nb_frames']) or None
+    except (KeyError, ValueError):
+        nb_frames = None
+
+    return VideoInfo(
+        width=int(stream.get('width', 0)),
+        height=int(stream.get('height', 0)),
+        frame_rate=frame_rate,
+        duration=duration,
+        nb_frames=nb_frames,
+        codec=stream.get('codec_name', ''),
+        pix_fmt=stream.get('pix_fmt', ''),
+        rotation=_rotation(stream),
+        stream_index=int(stream.get('index', 0)),
+    )
 
+
+def probe_video(video_path: str, cache: Optional[ProbeCache] = None) -> Optional[VideoInfo]:
+    """用 ffprobe 获取视频信息，命中缓存时不启动子进程"""
+    cache = cache or default_cache()
+    info = cache.get(video_path)
+    if info is not None:
+        return info
+
+    ffprobe_path = find_binary('ffprobe')
+    cmd = [ffprobe_path, '-v', 'error', '-print_format', 'json',
+           '-show_format', '-show_streams', video_path]
     try:
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                   universal_newlines=True, encoding='utf-8', errors='replace')
-        _, output = process.communicate()
-
-        info = {}
-
-        # 提取分辨率
-        resolution_match = re.search(r'Stream #0:0.*: Video:.* (\d+)x(\d+)', output)
-        if resolution_match:
-            width, height = resolution_match.groups()
-            info['width'] = int(width)
-            info['height'] = int(height)
-        else:
-            print("Warning: Could not extract resolution.")
-
-        # 提取帧率
-        framerate_match = re.search(r'(\d+(?:\.\d+)?)\s*fps', output)
-        if framerate_match:
-            info['frame_rate'] = float(framerate_match.group(1))
-        else:
-            # 尝试从 avg_frame_rate 提取
-            avg_framerate_match = re.search(r'avg_frame_rate=(\d+)/(\d+)', output)
-            if avg_framerate_match:
-                num, den = map(int, avg_framerate_match.groups())
-                info['frame_rate'] = round(num / den, 2) if den != 0 else None
-            else:
-                print("Warning: Could not extract frame rate.")
-
-        # 提取总帧数
-        duration_match = re.search(r'Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})', output)
-        if duration_match and 'frame_rate' in info:
-            hours, minutes, seconds = map(float, duration_match.groups())
-            total_seconds = hours * 3600 + minutes * 60 + seconds
-            info['total_frames'] = int(total_seconds * info['frame_rate'])
-        else:
-            print("Warning: Could not calculate total frames.")
-
-        return info if info else None
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error running FFmpeg: {e}")
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 text=True, encoding='utf-8', errors='replace', **popen_kwargs())
+    except OSError as e:
+        print(f"Error running FFprobe: {e}")
+        return None
+    if process.returncode != 0:
+        print(f"Error running FFprobe: {process.stderr.strip()}")
         return None
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+
+    try:
+        info = parse_probe_output(process.stdout)
+    except ValueError as e:
+        print(f"Error parsing FFprobe output: {e}")
+        return None
+    if info is not None:
+        cache.put(video_path, info)
+    return info
+
+
+def get_video_info(video_path: str) -> Optional[Dict]:
+    info = probe_video(video_path)
+    if info is None:
         return None
+    width, height = info.display_size
+    return {
+        'width': width,
+        'height': height,
+        'frame_rate': float(info.frame_rate),
+        'duration': info.duration,
+        'total_frames': info.total_frames,
+    }
 
 
 # 使用示例
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+# GIF 文件的块级读写：解析帧、拼接多个 GIF，以及 LZW 编解码
+import struct
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional
+
+TRAILER = b'\x3b'
+
+
+@dataclass
+class GifFrame:
+    control: Optional[bytes]  # 完整的图形控制扩展块（含 0x21 0xF9），可能没有
+    descriptor: bytes  # 10 字节的图像描述符（含 0x2C）
+    local_color_table: Optional[bytes]
+    image_data: bytes  # LZW 最小码长 + 所有数据子块 + 结束块
+
+    @property
+    def delay(self) -> int:
+        """帧延时，单位 1/100 秒"""
+        if not self.control:
+            return 0
+        return struct.unpack('<H', self.control[4:6])[0]
+
+    @property
+    def rect(self):
+        """(left, top, width, height)"""
+        return struct.unpack('<HHHH', self.descriptor[1:9])
+
+    @property
+    def interlaced(self) -> bool:
+        return bool(self.descriptor[9] & 0x40)
+
+    @property
+    def transparent(self) -> Optional[int]:
+        if not self.control or not self.control[3] & 0x01:
+            return None
+        return self.control[6]
+
+    @property
+    def disposal(self) -> int:
+        return (self.control[3] >> 2) & 0x07 if self.control else 0
+
+    def with_delay(self, delay: int) -> 'GifFrame':
+        control = self.control or b'\x21\xf9\x04\x00\x00\x00\x00\x00'
+        control = control[:4] + struct.pack('<H', max(0, min(delay, 0xFFFF))) + control[6:]
+        return GifFrame(control, self.descriptor, self.local_color_table, self.image_data)
+
+
+@dataclass
+class GifFile:
+    width: int
+    height: int
+    packed: int  # 逻辑屏幕描述符的标志字节
+    background: int
+    aspect: int
+    global_color_table: Optional[bytes]
+    loop: Optional[int]  # NETSCAPE2.0 循环次数，0 表示无限循环，None 表示只播放一次
+    frames: List[GifFrame] = field(default_factory=list)
+
+
+def _color_table_size(packed: int) -> int:
+    return 3 * (2 << (packed & 0x07))
+
+
+def _read_sub_blocks(data: bytes, pos: int) -> int:
+    """跳过一串数据子块，返回结束块之后的位置"""
+    while True:
+        size = data[pos]
+        pos += 1
+        if size == 0:
+            return pos
+        pos += size
+
+
+def parse_gif(data: bytes) -> GifFile:
+    if data[:6] not in (b'GIF87a', b'GIF89a'):
+        raise ValueError('不是 GIF 文件')
+    width, height, packed, background, aspect = struct.unpack('<HHBBB', data[6:13])
+    pos = 13
+    global_color_table = None
+    if packed & 0x80:
+        size = _color_table_size(packed)
+        global_color_table = data[pos:pos + size]
+        pos += size
+
+    gif = GifFile(width, height, packed, background, aspect, global_color_table, None)
+    control = None
+    while pos < len(data):
+        introducer = data[pos]
+        if introducer == 0x3B:
+            break
+        if introducer == 0x21:
+            label = data[pos + 1]
+            end = _read_sub_blocks(data, pos + 2)
+            block = data[pos:end]
+            if label == 0xF9:
+                control = block
+            elif label == 0xFF and block[3:14] == b'NETSCAPE2.0' and len(block) >= 19:
+                gif.loop = struct.unpack('<H', block[16:18])[0]
+            pos = end
+        elif introducer == 0x2C:
+            descriptor = data[pos:pos + 10]
+            pos += 10
+            local_color_table = None
+            if descriptor[9] & 0x80:
+                size = _color_table_size(descriptor[9])
+                local_color_table = data[pos:pos + size]
+                pos += size
+            end = _read_sub_blocks(data, pos + 1)
+            gif.frames.append(GifFrame(control, descriptor, local_color_table, data[pos:end]))
+            control = None
+            pos = end
+        else:
+            raise ValueError(f'无法识别的 GIF 块: 0x{introducer:02x}，位置 {pos}')
+    return gif
+
+
+def read_gif(path: str) -> GifFile:
+    with open(path, 'rb') as f:
+        return parse_gif(f.read())
+
+
+def loop_extension(loop: int) -> bytes:
+    return b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00'
+
+
+def write_header(out: BinaryIO, gif: GifFile, loop: Optional[int]) -> None:
+    out.write(b'GIF89a')
+    out.write(struct.pack('<HHBBB', gif.width, gif.height, gif.packed, gif.background, gif.aspect))
+    if gif.global_color_table:
+        out.write(gif.global_color_table)
+    if loop is not None:
+        out.write(loop_extension(loop))
+
+
+def write_frame(out: BinaryIO, frame: GifFrame, global_color_table: Optional[bytes] = None,
+                own_color_table: Optional[bytes] = None) -> None:
+    """
+    写出一帧。帧来自全局颜色表 own_color_table 与输出文件的 global_color_table 不同的文件时，
+    把原文件的全局颜色表转为该帧的局部颜色表，保证拼接后颜色不变。
+    """
+    descriptor = frame.descriptor
+    local_color_table = frame.local_color_table
+    if local_color_table is None and own_color_table and own_color_table != global_color_table:
+        size_bits = (len(own_color_table) // 3).bit_length() - 2
+        packed = (descriptor[9] & 0x78) | 0x80 | (size_bits & 0x07)
+        descriptor = descriptor[:9] + bytes([packed])
+        local_color_table = own_color_table
+    if frame.control:
+        out.write(frame.control)
+    out.write(descriptor)
+    if local_color_table:
+        out.write(local_color_table)
+    out.write(frame.image_data)
+
+
+def make_frame(image_data: bytes, width: int, height: int, delay: int, left: int = 0, top: int = 0,
+               transparent: Optional[int] = None, disposal: int = 1) -> GifFrame:
+    """用已编码的图像数据构造一帧，颜色表由 write_frame 决定"""
+    flags = (disposal << 2) | (1 if transparent is not None else 0)
+    control = struct.pack('<4BHBB', 0x21, 0xF9, 0x04, flags, max(0, min(delay, 0xFFFF)), transparent or 0, 0)
+    descriptor = b'\x2c' + struct.pack('<HHHHB', left, top, width, height, 0)
+    return GifFrame(control, descriptor, None, image_data)
+
+
+def join_gifs(paths: List[str], output: BinaryIO, loop: Optional[int] = None) -> int:
+    """
+    按顺序拼接多个尺寸相同的 GIF，保留每帧的延时、处置方式和透明色。
+    loop 为 None 时沿用第一个文件的循环设置。返回总帧数。
+    """
+    if not paths:
+        raise ValueError('没有要拼接的 GIF')
+    first = read_gif(paths[0])
+    write_header(output, first, first.loop if loop is None else loop)
+    frame_count = 0
+    for index, path in enumerate(paths):
+        gif = first if index == 0 else read_gif(path)
+        if (gif.width, gif.height) != (first.width, first.height):
+            raise ValueError(f'{path} 的尺寸 {gif.width}x{gif.height} 与第一个文件不一致')
+        for frame in gif.frames:
+            write_frame(output, frame, first.global_color_table, gif.global_color_table)
+            frame_count += 1
+    output.write(TRAILER)
+    return frame_count
+
+
+class LZWEncoder:
+    """GIF 变长 LZW 编码，码表字典在帧之间复用，只清空不重建"""
+
+    def __init__(self):
+        self._table = {}
+
+    def encode(self, indices: bytes, min_code_size: int = 8) -> bytes:
+        """返回完整的图像数据：最小码长 + 255 字节的数据子块 + 结束块"""
+        table = self._table
+        table.clear()
+        clear_code = 1 << min_code_size
+        end_code = clear_code + 1
+        code_size = min_code_size + 1
+        next_code = end_code + 1
+        out = bytearray()
+        bits = clear_code
+        bit_count = code_size
+
+        if indices:
+            prefix = indices[0]
+            for k in indices[1:]:
+                key = (prefix << 8) | k
+                code = table.get(key)
+                if code is not None:
+                    prefix = code
+                    continue
+                bits |= prefix << bit_count
+                bit_count += code_size
+                while bit_count >= 8:
+                    out.append(bits & 0xFF)
+                    bits >>= 8
+                    bit_count -= 8
+                if next_code < 4096:
+                    table[key] = next_code
+                    next_code += 1
+                    if next_code > (1 << code_size) and code_size < 12:
+                        code_size += 1
+                else:
+                    # 码表已满，发送清除码重新开始
+                    bits |= clear_code << bit_count
+                    bit_count += code_size
+                    table.clear()
+                    code_size = min_code_size + 1
+                    next_code = end_code + 1
+                prefix = k
+            bits |= prefix << bit_count
+            bit_count += code_size
+            # 解码器在读到这个码后才会加入新条目，码长可能随之增加
+            if next_code == (1 << code_size) and code_size < 12:
+                code_size += 1
+        bits |= end_code << bit_count
+        bit_count += code_size
+        while bit_count > 0:
+            out.append(bits & 0xFF)
+            bits >>= 8
+            bit_count -= 8
+
+        data = bytearray([min_code_size])
+        for start in range(0, len(out), 255):
+            chunk = out[start:start + 255]
+            data.append(len(chunk))
+            data += chunk
+        data.append(0)
+        return bytes(data)
+
+
+def min_code_size(table: bytes) -> int:
+    return max(2, (len(table) // 3 - 1).bit_length())
+
+
+def lzw_decode(image_data: bytes, pixel_count: int) -> bytes:
+    """
+    解码一帧的图像数据（最小码长 + 数据子块），返回 pixel_count 个颜色索引，
+    数据不足时补 0，多余的丢弃。
+    """
+    min_size = image_data[0]
+    clear_code = 1 << min_size
+    end_code = clear_code + 1
+    base = [bytes([i]) for i in range(clear_code)] + [b'', b'']
+    table = list(base)
+    code_size = min_size + 1
+    out = bytearray()
+    previous = None
+    bits = 0
+    bit_count = 0
+    pos = 1
+    while pos < len(image_data):
+        size = image_data[pos]
+        if size == 0:
+            break
+        for byte in image_data[pos + 1:pos + 1 + size]:
+            bits |= byte << bit_count
+            bit_count += 8
+            while bit_count >= code_size:
+                code = bits & ((1 << code_size) - 1)
+                bits >>= code_size
+                bit_count -= code_size
+                if code == clear_code:
+                    table = list(base)
+                    code_size = min_size + 1
+                    previous = None
+                    continue
+                if code == end_code:
+                    return _fit(out, pixel_count)
+                if code < len(table):
+                    entry = table[code]
+                elif code == len(table) and previous is not None:
+                    entry = previous + previous[:1]
+                else:
+                    raise ValueError('LZW 数据损坏')
+                out += entry
+                if previous is not None and len(table) < 4096:
+                    table.append(previous + entry[:1])
+                    if len(table) == (1 << code_size) and code_size < 12:
+                        code_size += 1
+                previous = entry
+        pos += size + 1
+    return _fit(out, pixel_count)
+
+
+def _fit(data: bytearray, count: int) -> bytes:
+    if len(data) < count:
+        data += bytes(count - len(data))
+    return bytes(data[:count])
+
+
+def deinterlace(data: bytes, width: int, height: int) -> bytes:
+    """隔行存储的行顺序：0,8,16…；4,12…；2,6…；1,3…"""
+    rows = [r for start, step in ((0, 8), (4, 8), (2, 4), (1, 2)) for r in range(start, height, step)]
+    out = bytearray(len(data))
+    for stored, row in enumerate(rows):
+        out[row * width:(row + 1) * width] = data[stored * width:(stored + 1) * width]
+    return bytes(out)
+
+
+def decode_frame(frame: GifFrame) -> bytes:
+    """解码一帧，返回按行排列的颜色索引"""
+    _, _, width, height = frame.rect
+    data = lzw_decode(frame.image_data, width * height)
+    return deinterlace(data, width, height) if frame.interlaced else data
+
+
+class GifWriter:
+    """
+    逐帧写出 GIF。第一帧的颜色表作为全局颜色表，之后颜色表不同的帧写局部颜色表。
+    """
+
+    def __init__(self, output: BinaryIO, width: int, height: int, loop: Optional[int] = 0):
+        self.output = output
+        self.width = width
+        self.height = height
+        self.loop = loop
+        self.global_table = None
+        self.frame_count = 0
+        self.lzw = LZWEncoder()
+
+    def write_indexed(self, indices: bytes, width: int, height: int, table: bytes, delay: int,
+                      left: int = 0, top: int = 0, transparent: Optional[int] = None, disposal: int = 1) -> None:
+        """写出一帧颜色索引图像，table 的长度必须是 2 的幂"""
+        if self.global_table is None:
+            self.global_table = table
+            packed = 0x80 | 0x70 | ((len(table) // 3).bit_length() - 2)
+            header = GifFile(self.width, self.height, packed, 0, 0, table, self.loop)
+            write_header(self.output, header, self.loop)
+        image_data = self.lzw.encode(indices, min_code_size(table))
+        frame = make_frame(image_data, width, height, delay, left, top, transparent, disposal)
+        write_frame(self.output, frame, self.global_table, table)
+        self.frame_count += 1
+
+    def close(self) -> None:
+        if self.global_table is None:
+            raise ValueError('没有读到任何帧')
+        self.output.write(TRAILER)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# 帧间优化：合并相同的连续帧，每帧只保留变化区域，未变化的像素标为透明，并为每帧选择处置方式
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # 帧间优化是可选功能，没有 NumPy 时跳过
+    np = None
+
+from gif_format import GifWriter, decode_frame, read_gif
+
+DISPOSE_NONE = 1  # 保留本帧，下一帧画在它上面
+DISPOSE_PREVIOUS = 3  # 恢复到绘制本帧之前的画面
+
+
+@dataclass
+class OptimizeStats:
+    output_path: str
+    bytes_before: int
+    bytes_after: int
+    frames_before: int
+    frames_after: int
+
+    def to_json(self):
+        return asdict(self)
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError('帧间优化需要 NumPy，请先安装：pip install numpy')
+
+
+def _color_keys(colors):
+    colors = colors.astype(np.uint32)
+    return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+
+class _ColorIndex:
+    """RGB 到某个颜色表索引的精确查找，找不到的颜色取最近的颜色"""
+
+    def __init__(self, table: bytes):
+        self.palette = np.frombuffer(table, np.uint8).reshape(-1, 3)
+        keys = _color_keys(self.palette)
+        # 稳定排序，重复的颜色取最小的索引
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def lookup(self, pixels):
+        keys = _color_keys(pixels)
+        position = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        indices = self.order[position].astype(np.uint8)
+        missing = self.keys[position] != keys
+        if missing.any():
+            colors, inverse = np.unique(pixels[missing], axis=0, return_inverse=True)
+            distance = ((colors[:, None, :].astype(np.int32) - self.palette[None, :, :]) ** 2).sum(axis=2)
+            indices[missing] = distance.argmin(axis=1).astype(np.uint8)[inverse.reshape(-1)]
+        return indices
+
+
+def _bounding_box(mask):
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+def _area(box) -> int:
+    return 0 if box is None else (box[1] - box[0]) * (box[3] - box[2])
+
+
+class FrameOptimizer:
+    """
+    接收完整画面（RGB）和对应的颜色表，只写出与前一画面不同的矩形区域。
+
+    写出一帧之前会先看下一帧：下一帧与“绘制本帧之前的画面”更接近时（如光标闪烁、弹出提示），
+    本帧用“恢复到之前”处置，否则保留本帧。与当前画面完全相同的帧并入上一帧的延时。
+    """
+
+    def __init__(self, writer: GifWriter):
+        require_numpy()
+        self.writer = writer
+        self.frames_in = 0
+        self._indexes = {}
+        self._displayed = None  # 当前画面
+        self._before = None  # 绘制待写帧之前的画面
+        self._pending = None  # 已确定内容、尚未确定处置方式的帧
+
+    def _index(self, table: bytes) -> _ColorIndex:
+        index = self._indexes.get(table)
+        if index is None:
+            if len(self._indexes) >= 32:
+                self._indexes.clear()
+            index = self._indexes[table] = _ColorIndex(table)
+        return index
+
+    def add(self, frame, table: bytes, delay: int) -> None:
+        """frame 为 (高, 宽, 3) 的 uint8 画面，颜色都应在 table 中"""
+        self.frames_in += 1
+        if self._displayed is not None and np.array_equal(frame, self._displayed):
+            self._pending['delay'] += delay
+            return
+
+        base = self._displayed
+        if self._pending is not None:
+            keep = np.any(frame != self._displayed, axis=2)
+            restore = np.any(frame != self._before, axis=2) if self._before is not None else None
+            if restore is not None and _area(_bounding_box(restore)) < _area(_bounding_box(keep)):
+                self._pending['disposal'] = DISPOSE_PREVIOUS
+                base, mask = self._before, restore
+            else:
+                mask = keep
+            self._flush_pending()
+        else:
+            mask = np.ones(frame.shape[:2], bool)
+
+        self._pending = self._crop(frame, mask, table, delay)
+        self._before = base
+        self._displayed = frame.copy()
+
+    def _crop(self, frame, mask, table: bytes, delay: int) -> dict:
+        box = _bounding_box(mask)
+        if box is None:
+            # 与恢复后的画面相同，仍需写一个 1x1 的透明帧承载延时
+            box = (0, 1, 0, 1)
+        top, bottom, left, right = box
+        region_mask = mask[top:bottom, left:right]
+        indices = self._index(table).lookup(frame[top:bottom, left:right])
+        transparent = None
+        if not region_mask.all():
+            used = np.bincount(indices[region_mask], minlength=len(table) // 3)
+            free = np.flatnonzero(used == 0)
+            if free.size:
+                # 颜色表满且每个颜色都用到时只能不用透明色，未变化的像素照原样编码
+                transparent = int(free[-1])
+                indices[~region_mask] = transparent
+        return {'indices': indices.tobytes(), 'width': right - left, 'height': bottom - top, 'table': table,
+                'delay': delay, 'left': left, 'top': top, 'transparent': transparent, 'disposal': DISPOSE_NONE}
+
+    def _flush_pending(self) -> None:
+        pending = self._pending
+        self.writer.write_indexed(pending['indices'], pending['width'], pending['height'], pending['table'],
+                                  pending['delay'], pending['left'], pending['top'], pending['transparent'],
+                                  pending['disposal'])
+        self._pending = None
+
+    def close(self) -> None:
+        if self._pending is not None:
+            self._flush_pending()
+        self.writer.close()
+
+
+def optimize_gif(path: str, output_path: Optional[str] = None) -> OptimizeStats:
+    """
+    优化一个已有的 GIF。按原文件的透明色和处置方式逐帧合成完整画面后交给 FrameOptimizer，
+    结果不比原文件小时保留原文件。output_path 为空时原地替换。
+    """
+    require_numpy()
+    output_path = output_path or path
+    gif = read_gif(path)
+    before = os.path.getsize(path)
+    global_table = gif.global_color_table or bytes(6)
+    palette = np.frombuffer(global_table, np.uint8).reshape(-1, 3)
+    background = palette[min(gif.background, len(palette) - 1)]
+    canvas = np.empty((gif.height, gif.width, 3), np.uint8)
+    canvas[:] = background
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.gif', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            optimizer = FrameOptimizer(GifWriter(output, gif.width, gif.height, gif.loop))
+            for frame in gif.frames:
+                table = frame.local_color_table or global_table
+                colors = np.frombuffer(table, np.uint8).reshape(-1, 3)
+                left, top, width, height = frame.rect
+                indices = np.frombuffer(decode_frame(frame), np.uint8).reshape(height, width)
+                # 超出逻辑屏幕的部分不显示
+                indices = indices[:max(0, gif.height - top), :max(0, gif.width - left)]
+                region = canvas[top:top + indices.shape[0], left:left + indices.shape[1]]
+                saved = region.copy() if frame.disposal == DISPOSE_PREVIOUS else None
+                visible = indices != frame.transparent if frame.transparent is not None else np.ones_like(indices, bool)
+                region[visible] = colors[np.minimum(indices[visible], len(colors) - 1)]
+                optimizer.add(canvas, table, frame.delay)
+                if frame.disposal == 2:
+                    # 恢复为背景色：视频转出的 GIF 不透明，用背景色代替透明
+                    region[:] = background
+                elif saved is not None:
+                    region[:] = saved
+            optimizer.close()
+            frames_after = optimizer.writer.frame_count
+        after = os.path.getsize(tmp_path)
+        if after < before:
+            shutil.copymode(path, tmp_path)  # mkstemp 创建的文件只有所有者可读写
+            os.replace(tmp_path, output_path)
+        else:
+            os.remove(tmp_path)
+            after = before
+            frames_after = len(gif.frames)
+            if output_path != path:
+                shutil.copyfile(path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return OptimizeStats(output_path, before, after, len(gif.frames), frames_after)
+
+
+def optimize_outputs(paths: List[str]) -> List[OptimizeStats]:
+    """优化一个任务的所有输出，失败的文件保持原样"""
+    stats = []
+    for path in paths:
+        try:
+            stats.append(optimize_gif(path))
+        except (OSError, ValueError, IndexError) as e:
+            print(f"Warning: Could not optimize {path}: {e}")
+    return stats
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# 导入文件列表：每个文件各自的设置，以及在线程池中并行探测视频信息
+import itertools
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+from converter import normalize_crop
+from get_video_info import VideoInfo, probe_video
+
+# 分辨率预设的宽度，高度按缩放前的画面（源视频或裁剪区域）等比计算
+PRESET_WIDTHS = (320, 480, 640, 854, 960, 1280, 1920, 2560, 3840)
+DEFAULT_PRESET_SOURCE = (3840, 2160)  # 探测完成前按 16:9 的 4K 画面给出全部预设
+PROBE_WORKERS = 4  # 探测主要等待 I/O（网络共享盘），与核数无关，限制同时运行的 ffprobe 数量
+
+STATUS_PROBING = "探测中…"
+STATUS_READY = "就绪"
+STATUS_FAILED = "无法读取"
+
+_ids = itertools.count(1)
+
+
+@dataclass
+class FileItem:
+    input_video: str
+    output_path: str
+    fps: int
+    resolution: str  # 输出分辨率，如 1280x720
+    item_id: int = 0
+    info: Optional[VideoInfo] = None
+    status: str = STATUS_PROBING
+    range_start_ms: Optional[int] = None
+    range_end_ms: Optional[int] = None
+    settings_edited: bool = False  # 用户改过设置后，探测结果不再覆盖帧率和分辨率
+    crop: Optional[Tuple[int, int, int, int]] = None  # 裁剪区域 (x, y, 宽, 高)，见 ConversionJob.crop
+
+    def __post_init__(self):
+        if not self.item_id:
+            self.item_id = next(_ids)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.input_video)
+
+    @property
+    def probing(self) -> bool:
+        return self.status == STATUS_PROBING
+
+    @property
+    def width(self) -> int:
+        return int(self.resolution.split('x')[0])
+
+    def clip_range(self):
+        """截取范围 (起点秒, 终点秒)，未设置的一端为 None"""
+        start = self.range_start_ms / 1000 if self.range_start_ms is not None else None
+        end = self.range_end_ms / 1000 if self.range_end_ms is not None else None
+        return start, end
+
+    @property
+    def source_size(self) -> Optional[Tuple[int, int]]:
+        """缩放前的画面尺寸：裁剪区域，或源视频的显示尺寸；未探测时为 None"""
+        if self.crop is not None:
+            return self.crop[2], self.crop[3]
+        return self.info.display_size if self.info is not None else None
+
+    @property
+    def settings_text(self) -> str:
+        text = f"{self.resolution} · {self.fps}fps"
+        if self.crop is not None:
+            text += f" · 裁剪 {self.crop[2]}x{self.crop[3]}"
+        return text
+
+    def saved_settings(self) -> dict:
+        """按源文件保存的设置，见 source_settings"""
+        return {'fps': self.fps, 'resolution': self.resolution, 'range_start_ms': self.range_start_ms,
+                'range_end_ms': self.range_end_ms, 'crop': list(self.crop) if self.crop else None}
+
+    def apply_settings(self, settings: dict) -> None:
+        """恢复保存的设置，裁剪区域按当前的画面尺寸重新校验"""
+        self.fps = settings.get('fps') or self.fps
+        self.resolution = settings.get('resolution') or self.resolution
+        self.range_start_ms = settings.get('range_start_ms')
+        self.range_end_ms = settings.get('range_end_ms')
+        crop = settings.get('crop')
+        if crop and self.info is not None:
+            self.crop = normalize_crop(crop, self.info.display_size)
+        self.settings_edited = True
+
+
+def scaled_resolution(width: int, source_size: Tuple[int, int]) -> str:
+    """按 source_size 的比例给出宽度为 width 的分辨率，高度取偶数"""
+    source_width, source_height = source_size
+    height = max(2, int(round(width * source_height / source_width / 2)) * 2)
+    return f"{width}x{height}"
+
+
+def resolution_presets(source_size: Tuple[int, int]) -> List[str]:
+    """小于缩放前画面宽度的预设宽度，加上原尺寸"""
+    width, height = source_size
+    return [scaled_resolution(preset, source_size) for preset in PRESET_WIDTHS if preset < width] + \
+        [f"{width}x{height}"]
+
+
+def format_duration(seconds: float) -> str:
+    return f"{int(seconds // 60):02d}:{seconds % 60:04.1f}"
+
+
+def default_output_path(input_video: str) -> str:
+    return os.path.splitext(input_video)[0] + '.gif'
+
+
+class _ProbeTask(QRunnable):
+    def __init__(self, service: 'ProbeService', item_id: int, path: str):
+        super().__init__()
+        self.service = service
+        self.item_id = item_id
+        self.path = path
+
+    def run(self):
+        try:
+            info = probe_video(self.path)
+        except Exception as e:  # 不能让异常留在工作线程里，结果总要发回界面
+            print(f"Warning: Could not probe {self.path}: {e}")
+            info = None
+        # 在工作线程中发出，连接到主线程对象的槽会排队执行
+        self.service.probed.emit(self.item_id, info)
+
+
+class ProbeService(QObject):
+    """在有界线程池中探测视频信息，结果通过 probed(item_id, VideoInfo 或 None) 信号返回主线程"""
+    probed = Signal(int, object)
+
+    def __init__(self, workers: int = PROBE_WORKERS, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(workers)
+
+    def submit(self, item_id: int, path: str) -> None:
+        self.pool.start(_ProbeTask(self, item_id, path))
+
+    def wait(self, msecs: int = -1) -> bool:
+        return self.pool.waitForDone(msecs)
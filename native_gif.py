@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# 内置 GIF 编码器：ffmpeg 只负责解码和缩放，调色板、抖动、LZW 压缩由 NumPy 和本模块完成
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import BinaryIO, Callable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # 内置编码器是可选功能，没有 NumPy 时只影响这个后端
+    np = None
+
+from converter import ConversionJob, ConversionProgress, OutputProgress, require_gif, source_decode_plan
+from ffmpeg_runner import FFmpegProgress, FFmpegResult, find_binary, popen_kwargs, read_peak_rss, wait_process
+from get_video_info import probe_video
+from gif_format import GifWriter
+from gif_optimize import FrameOptimizer
+
+BATCH_FRAMES = 16  # 每批帧共用一个调色板
+SAMPLE_PIXELS = 1 << 16  # 生成调色板时每批最多采样的像素数
+LUT_BITS = 5  # 颜色查找表每个通道的精度
+
+# 8x8 Bayer 矩阵，归一化到 [-0.5, 0.5)
+_BAYER8 = [
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+]
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError('内置编码器需要 NumPy，请先安装：pip install numpy')
+
+
+def median_cut(pixels, colors: int = 256):
+    """
+    对 (N, 3) 的像素做中位切分，返回最多 colors 个颜色的 (K, 3) uint8 调色板。
+    每次切分像素数与颜色范围乘积最大的盒子，沿范围最大的通道在中位数处分开。
+    """
+    boxes = [pixels]
+    scores = [_box_score(pixels)]
+    while len(boxes) < colors:
+        index = int(np.argmax(scores))
+        if scores[index] <= 0:
+            break
+        box = boxes.pop(index)
+        scores.pop(index)
+        axis = int(np.argmax(box.max(axis=0) - box.min(axis=0)))
+        middle = len(box) // 2
+        order = np.argpartition(box[:, axis], middle)
+        for part in (box[order[:middle]], box[order[middle:]]):
+            boxes.append(part)
+            scores.append(_box_score(part))
+    return np.array([box.mean(axis=0) for box in boxes]).round().astype(np.uint8)
+
+
+def _box_score(box) -> int:
+    if len(box) < 2:
+        return 0
+    return int((box.max(axis=0).astype(np.int32) - box.min(axis=0)).max()) * len(box)
+
+
+def build_lut(palette):
+    """
+    为 5 位精度的 RGB 网格预先计算最近的调色板颜色，之后每个像素只需查表。
+    距离用 |c|^2 - 2c·p + |p|^2 展开，一次矩阵乘法算完。
+    """
+    levels = 1 << LUT_BITS
+    step = 256 // levels
+    grid = np.arange(levels, dtype=np.float32) * step + step / 2
+    cells = np.stack(np.meshgrid(grid, grid, grid, indexing='ij'), axis=-1).reshape(-1, 3)
+    colors = palette.astype(np.float32)
+    distance = (colors ** 2).sum(axis=1)[None, :] - 2 * cells @ colors.T
+    return distance.argmin(axis=1).astype(np.uint8)
+
+
+class Quantizer:
+    """批量把 RGB 帧映射为调色板索引，工作缓冲区按批大小预先分配"""
+
+    def __init__(self, batch: int, height: int, width: int, dither: bool = True):
+        self.dither = dither
+        self._work = np.empty((batch, height, width, 3), np.int16)
+        self._index = np.empty((batch, height, width), np.uint16)
+        self._channel = np.empty((batch, height, width), np.uint16)
+        bayer = (np.array(_BAYER8, np.float32) / 64 - 0.5) * (256 >> LUT_BITS)
+        tiled = np.tile(bayer, (height // 8 + 1, width // 8 + 1))[:height, :width]
+        self._threshold = tiled.round().astype(np.int16)[None, :, :, None]
+
+    def map(self, frames, lut):
+        count = len(frames)
+        work = self._work[:count]
+        np.copyto(work, frames, casting='unsafe')
+        if self.dither:
+            work += self._threshold
+            np.clip(work, 0, 255, out=work)
+        shift = 8 - LUT_BITS
+        index = self._index[:count]
+        channel = self._channel[:count]
+        np.right_shift(work[..., 0], shift, out=index, casting='unsafe')
+        for c in (1, 2):
+            np.left_shift(index, LUT_BITS, out=index)
+            np.right_shift(work[..., c], shift, out=channel, casting='unsafe')
+            index |= channel
+        return lut[index]
+
+
+def frame_delays(count: int, fps: float, start: int = 0) -> List[int]:
+    """按帧率计算每帧延时（1/100 秒），累计误差不超过 1/100 秒"""
+    return [round((i + 1) * 100 / fps) - round(i * 100 / fps) for i in range(start, start + count)]
+
+
+def _pack_palette(palette) -> bytes:
+    """颜色表长度必须是 2 的幂，不足部分补黑色"""
+    size = 2
+    while size < len(palette):
+        size *= 2
+    table = bytearray(palette.tobytes())
+    table += bytes(3 * (size - len(palette)))
+    return bytes(table)
+
+
+class NativeGifEncoder:
+    """
+    流式写 GIF。每批帧生成一个调色板：第一批的调色板作为全局颜色表，
+    之后调色板不同的批次写局部颜色表。optimize 为 True 时经 FrameOptimizer 只写变化区域，
+    调色板少用一个颜色，保证总有空位作透明色。
+    """
+
+    def __init__(self, output: BinaryIO, width: int, height: int, fps: float,
+                 colors: int = 256, dither: bool = True, loop: int = 0, batch: int = BATCH_FRAMES,
+                 optimize: bool = True):
+        require_numpy()
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.colors = min(colors, 255) if optimize else colors
+        self.frame_count = 0
+        self.quantizer = Quantizer(batch, height, width, dither)
+        self.writer = GifWriter(output, width, height, loop)
+        self.optimizer = FrameOptimizer(self.writer) if optimize else None
+        self._rng = np.random.default_rng(0)
+
+    @property
+    def global_table(self) -> Optional[bytes]:
+        return self.writer.global_table
+
+    def _palette(self, frames):
+        pixels = frames.reshape(-1, 3)
+        if len(pixels) > SAMPLE_PIXELS:
+            pixels = pixels[self._rng.choice(len(pixels), SAMPLE_PIXELS, replace=False)]
+        return median_cut(pixels, self.colors)
+
+    def add_frames(self, frames) -> None:
+        if not len(frames):
+            return
+        palette = self._palette(frames)
+        table = _pack_palette(palette)
+        indices = self.quantizer.map(frames, build_lut(palette))
+        delays = frame_delays(len(frames), self.fps, self.frame_count)
+        for frame_indices, delay in zip(indices, delays):
+            if self.optimizer:
+                self.optimizer.add(palette[frame_indices], table, delay)
+            else:
+                self.writer.write_indexed(frame_indices.tobytes(), self.width, self.height, table, delay)
+            self.frame_count += 1
+
+    def close(self) -> None:
+        if self.optimizer:
+            self.optimizer.close()
+        else:
+            self.writer.close()
+
+
+def output_size(job: ConversionJob):
+    """按显示尺寸（有裁剪时为裁剪区域）等比缩放，高度取偶数，与 scale=W:-2 一致"""
+    info = probe_video(job.input_video)
+    if info is None:
+        raise ValueError('无法获取视频信息')
+    source_width, source_height = job.source_size(info.display_size)
+    height = max(2, int(round(job.width * source_height / source_width / 2)) * 2)
+    return job.width, height, info.duration
+
+
+def decode_command(job: ConversionJob, width: int, height: int) -> List[str]:
+    command = [find_binary('ffmpeg'), '-v', 'error']
+    if job.threads:
+        command += ['-threads', str(job.threads), '-filter_threads', str(job.threads)]
+    decode = source_decode_plan(job)
+    prescale = decode.prescale_width(width)
+    command += job.seek_options() + decode.input_options()
+    command += ['-i', job.input_video, '-an',
+                '-vf', f'{job.trim_filter()}{job.crop_filter()}fps={job.fps},'
+                       + (f'scale={prescale}:-2:flags=area,' if prescale else '')
+                       + f'scale={width}:{height}:flags=lanczos',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+    return command
+
+
+def _read_frames(stream, buffer) -> int:
+    """把帧读入预分配的缓冲区，返回读到的完整帧数"""
+    view = memoryview(buffer).cast('B')
+    frame_bytes = buffer[0].nbytes
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled // frame_bytes
+
+
+def native_convert(job: ConversionJob, duration: Optional[float] = None,
+                   on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                   colors: Optional[int] = None, dither: bool = True) -> FFmpegResult:
+    """
+    使用内置编码器转换，colors 默认取 job.colors。ffmpeg 通过 rawvideo 管道输出 RGB 帧，读入预分配的批缓冲区，
+    进度按已编码帧数计算，回调形式与 converter.convert 相同。
+    """
+    require_numpy()
+    if job.extra_outputs:
+        raise ValueError('内置编码器不支持多个输出')
+    require_gif(job, '内置编码器')
+    width, height, source_duration = output_size(job)
+    duration = job.clip_duration(duration if duration is not None else source_duration)
+    expected_frames = (duration or 0) * job.fps
+
+    os.makedirs(os.path.dirname(os.path.abspath(job.output_path)), exist_ok=True)
+    process = subprocess.Popen(decode_command(job, width, height), stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs())
+    stderr_tail = deque(maxlen=200)
+
+    def drain():
+        for line in process.stderr:
+            stderr_tail.append(line.decode('utf-8', 'replace'))
+
+    stderr_thread = threading.Thread(target=drain, daemon=True)
+    stderr_thread.start()
+
+    buffer = np.empty((BATCH_FRAMES, height, width, 3), np.uint8)
+    last_update_time = 0.0
+    peak_rss = 0
+    progress = FFmpegProgress()
+    try:
+        with open(job.output_path, 'wb') as output:
+            encoder = NativeGifEncoder(output, width, height, job.fps, colors or job.colors, dither)
+            while True:
+                count = _read_frames(process.stdout, buffer)
+                if count == 0:
+                    break
+                peak_rss = max(peak_rss, read_peak_rss(process.pid))
+                encoder.add_frames(buffer[:count])
+                progress = FFmpegProgress(out_time=encoder.frame_count / job.fps, frame=encoder.frame_count,
+                                          total_size=output.tell())
+                current_time = time.monotonic()
+                if on_progress and current_time - last_update_time >= 0.1:
+                    last_update_time = current_time
+                    fraction = min(encoder.frame_count / expected_frames, 1.0) if expected_frames else 0.0
+                    on_progress(ConversionProgress(fraction, progress, [
+                        OutputProgress(job.output_path, fraction, progress.total_size)]))
+                if count < BATCH_FRAMES:
+                    break
+            if encoder.frame_count:
+                encoder.close()
+    finally:
+        process.stdout.close()
+        usage = wait_process(process, peak_rss)
+        stderr_thread.join()
+
+    if encoder.frame_count == 0:
+        # 截取范围超出视频长度等情况下没有帧，留下的文件不是有效的 GIF
+        os.remove(job.output_path)
+        stderr_tail.append('没有解码出任何帧，截取范围可能超出视频长度\n')
+        return FFmpegResult(process.returncode or 1, ''.join(stderr_tail), progress, usage)
+    progress.finished = process.returncode == 0
+    if on_progress and progress.finished:
+        on_progress(ConversionProgress(1.0, progress, [OutputProgress(job.output_path, 1.0, progress.total_size)]))
+    return FFmpegResult(process.returncode, ''.join(stderr_tail), progress, usage)
+
+
+def compare_backends(input_video: str, fps: int, width: int, output_dir: str) -> List[dict]:
+    """用两个后端转换同一个视频，比较耗时、吞吐量和文件大小"""
+    from converter import convert
+
+    results = []
+    for name, convert_fn in (('ffmpeg', convert), ('native', native_convert)):
+        output_path = os.path.join(output_dir, f'{os.path.splitext(os.path.basename(input_video))[0]}_{name}.gif')
+        job = ConversionJob(input_video, output_path, fps, width)
+        start = time.monotonic()
+        result = convert_fn(job)
+        elapsed = time.monotonic() - start
+        frames = result.progress.frame
+        results.append({
+            'backend': name,
+            'returncode': result.returncode,
+            'seconds': round(elapsed, 3),
+            'frames': frames,
+            'frames_per_second': round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+            'bytes': os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较 ffmpeg 与内置编码器的吞吐量')
+    parser.add_argument('input')
+    parser.add_argument('--fps', type=int, default=10)
+    parser.add_argument('--width', type=int, default=480)
+    parser.add_argument('-o', '--output-dir', default='.')
+    args = parser.parse_args()
+    print(f"{'后端':<8}{'耗时(s)':>10}{'帧数':>8}{'帧/秒':>10}{'字节':>12}")
+    for row in compare_backends(args.input, args.fps, args.width, args.output_dir):
+        print(f"{row['backend']:<8}{row['seconds']:>10}{row['frames']:>8}{row['frames_per_second']:>10}"
+              f"{row['bytes']:>12}")
+    sys.exit(0)
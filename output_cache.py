@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# 按内容寻址的输出缓存：同一源文件、同样的滤镜和 ffmpeg 版本再次转换时直接复用结果
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from functools import partial
+from typing import Callable, List, Optional
+
+from app_cache import cache_dir, load_json, save_json
+from converter import (ConversionJob, ConversionProgress, OutputProgress, build_command, convert, conversion_failed,
+                       output_format, replaces_output, source_decode_plan)
+from ffmpeg_check import ffmpeg_version
+from ffmpeg_runner import FFmpegProgress, FFmpegResult
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+SAMPLE_BLOCK = 64 * 1024
+SAMPLE_COUNT = 16
+
+
+def fingerprint(path: str, samples: int = SAMPLE_COUNT, block_size: int = SAMPLE_BLOCK) -> str:
+    """
+    源文件指纹：大小、修改时间和均匀分布的若干数据块的哈希，不读取整个文件。
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(path, 'rb') as f:
+        if stat.st_size <= samples * block_size:
+            digest.update(f.read())
+        else:
+            step = (stat.st_size - block_size) // (samples - 1)
+            for i in range(samples):
+                f.seek(i * step)
+                digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def job_key(job: ConversionJob, mode: str = 'convert') -> str:
+    """
+    缓存键：源文件指纹 + 去掉路径和线程数后的完整 ffmpeg 参数 + ffmpeg 版本 + 转换方式。
+    输出路径只保留扩展名，它决定输出格式。解码方式按真实的源文件决定，快速解码与完整解码的结果不共用。
+    """
+    def placeholder(index: int, path: str) -> str:
+        return f'OUTPUT{index}' + output_format(path).extension
+
+    normalized = replace(job, input_video='INPUT', output_path=placeholder(0, job.output_path), threads=None,
+                         extra_outputs=[replace(spec, output_path=placeholder(i + 1, spec.output_path))
+                                        for i, spec in enumerate(job.extra_outputs)])
+    parts = [fingerprint(job.input_video), ffmpeg_version(), mode] + build_command(normalized, 'ffmpeg', decode=source_decode_plan(job))[1:]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class OutputCache:
+    """
+    保存转换结果的目录，总大小超过 max_bytes 时按最近最少使用淘汰。
+    命中时优先用硬链接提供结果，跨磁盘等无法链接时复制。
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory or cache_dir('outputs')
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _load(self):
+        data = load_json(self.index_path, {})
+        if not isinstance(data, dict):
+            data = {}
+        entries = OrderedDict(data.get('entries', {}))
+        stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'seconds_saved': 0.0}
+        stats.update(data.get('stats', {}))
+        return entries, stats
+
+    def _save(self, entries, stats):
+        try:
+            save_json(self.index_path, {'entries': entries, 'stats': stats})
+        except OSError as e:
+            print(f"Warning: Could not write output cache index: {e}")
+
+    def _file_path(self, key: str, index: int) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}_{index}.gif')
+
+    def _remove(self, key: str, entry) -> None:
+        for index in range(entry.get('files', 0)):
+            try:
+                os.remove(self._file_path(key, index))
+            except OSError:
+                pass
+
+    def fetch(self, key: str, output_paths: List[str]) -> bool:
+        """命中时把缓存的文件放到 output_paths 并返回 True"""
+        with self._lock:
+            entries, stats = self._load()
+            entry = entries.get(key)
+            valid = entry is not None and entry.get('files') == len(output_paths)
+            if valid:
+                sizes = entry.get('sizes', [])
+                for index in range(len(output_paths)):
+                    try:
+                        valid = valid and os.path.getsize(self._file_path(key, index)) == sizes[index]
+                    except (OSError, IndexError):
+                        valid = False
+            if not valid:
+                if entry is not None:
+                    # 缓存文件被改动或丢失
+                    self._remove(key, entry)
+                    del entries[key]
+                stats['misses'] += 1
+                self._save(entries, stats)
+                return False
+
+            for index, output_path in enumerate(output_paths):
+                _place(self._file_path(key, index), output_path)
+            entry['last_used'] = time.time()
+            entries.move_to_end(key)
+            stats['hits'] += 1
+            stats['bytes_saved'] += sum(entry['sizes'])
+            stats['seconds_saved'] += entry.get('elapsed', 0.0)
+            self._save(entries, stats)
+            return True
+
+    def store(self, key: str, output_paths: List[str], elapsed: float) -> None:
+        """保存一次转换的结果。存入的是副本，之后改写输出文件不会影响缓存"""
+        with self._lock:
+            entries, stats = self._load()
+            os.makedirs(os.path.dirname(self._file_path(key, 0)), exist_ok=True)
+            sizes = []
+            try:
+                for index, output_path in enumerate(output_paths):
+                    shutil.copyfile(output_path, self._file_path(key, index))
+                    sizes.append(os.path.getsize(output_path))
+            except OSError as e:
+                print(f"Warning: Could not store conversion result: {e}")
+                self._remove(key, {'files': len(output_paths)})
+                return
+            entries[key] = {'files': len(output_paths), 'sizes': sizes, 'elapsed': elapsed,
+                            'last_used': time.time()}
+            entries.move_to_end(key)
+            total = sum(sum(entry.get('sizes', [])) for entry in entries.values())
+            while total > self.max_bytes and len(entries) > 1:
+                old_key, old_entry = entries.popitem(last=False)
+                self._remove(old_key, old_entry)
+                total -= sum(old_entry.get('sizes', []))
+            self._save(entries, stats)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, stats = self._load()
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'entries': len(entries),
+            'bytes': sum(sum(entry.get('sizes', [])) for entry in entries.values()),
+            'max_bytes': self.max_bytes,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+            'bytes_saved': stats['bytes_saved'],
+            'seconds_saved': round(stats['seconds_saved'], 3),
+        }
+
+
+def _place(source: str, destination: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+_default_cache = None
+
+
+def default_cache() -> OutputCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OutputCache()
+    return _default_cache
+
+
+def describe_convert_fn(convert_fn: Callable) -> str:
+    """
+    转换函数的稳定描述：函数名加上 partial 的关键字参数（如内置编码器的颜色数、目标大小），
+    嵌套的转换函数同样按名称描述，不含内存地址。
+    """
+    if isinstance(convert_fn, partial):
+        keywords = ', '.join(f'{name}={describe_convert_fn(value) if callable(value) else repr(value)}'
+                             for name, value in sorted(convert_fn.keywords.items()))
+        return f'{describe_convert_fn(convert_fn.func)}({keywords})'
+    return getattr(convert_fn, '__name__', 'convert')
+
+
+def cached_convert(job: ConversionJob, duration: Optional[float] = None,
+                   on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                   cache: Optional[OutputCache] = None, convert_fn: Callable = convert,
+                   mode: Optional[str] = None) -> FFmpegResult:
+    """
+    带缓存的转换。convert_fn 为实际的转换函数（convert 或 parallel_convert），
+    mode 区分不同转换方式的结果，默认取 convert_fn 的名称。
+    """
+    cache = cache or default_cache()
+    output_paths = [spec.output_path for spec in job.outputs]
+    if mode is None:
+        mode = describe_convert_fn(convert_fn)
+    key = job_key(job, mode)
+    if cache.fetch(key, output_paths):
+        if on_progress:
+            on_progress(ConversionProgress(1.0, FFmpegProgress(finished=True), [
+                OutputProgress(path, 1.0, os.path.getsize(path)) for path in output_paths]))
+        return FFmpegResult(0, '', FFmpegProgress(finished=True))
+
+    # 输出文件可能是指向缓存的硬链接，先删除，避免 ffmpeg 就地覆盖缓存内容；
+    # 以替换方式写出的转换不会写入已有的文件，保留已有的输出直到完成
+    for path in output_paths:
+        if os.path.lexists(path) and not replaces_output(convert_fn):
+            os.remove(path)
+    start = time.monotonic()
+    result = convert_fn(job, duration, on_progress)
+    if not conversion_failed(result) and all(os.path.exists(path) for path in output_paths):
+        cache.store(key, output_paths, time.monotonic() - start)
+    return result
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 预览：按当前设置只编码播放位置附近的几秒，用预览的字节数和耗时按片段时长推算完整转换
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Optional, Tuple
+
+from api import convert_job
+from converter import CancelToken, ConversionJob, ConversionProgress, conversion_failed, convert
+
+PREVIEW_SECONDS = 3.0
+
+
+@dataclass
+class PreviewResult:
+    output_path: str
+    start: float  # 预览片段在源视频中的起点（秒）
+    clip_seconds: float  # 预览片段的时长
+    seconds: float  # 编码预览的耗时
+    bytes: int
+    estimated_seconds: float  # 按预览推算的完整转换耗时
+    estimated_bytes: int
+
+
+def preview_range(job: ConversionJob, duration: float, position: float,
+                  seconds: float = PREVIEW_SECONDS) -> Tuple[float, float]:
+    """以 position 为中心、不超出截取范围的 (起点, 终点)，范围比 seconds 短时取整个范围"""
+    low = job.start or 0.0
+    high = job.end if job.end is not None else duration
+    if duration > 0:
+        high = min(high, duration)
+    start = min(max(position - seconds / 2, low), max(low, high - seconds))
+    return start, max(start, min(start + seconds, high))
+
+
+def render_preview(job: ConversionJob, duration: float, position: float, output_path: str,
+                   convert_fn: Callable = convert, optimize: bool = False,
+                   on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                   cancel: Optional[CancelToken] = None, seconds: float = PREVIEW_SECONDS) -> PreviewResult:
+    """
+    用与完整转换相同的 convert_fn 和设置编码 position 附近的 seconds 秒到 output_path。
+    失败时抛出 RuntimeError，取消时删除不完整的输出并抛出 ConversionCancelled。
+    """
+    start, end = preview_range(job, duration, position, seconds)
+    if end <= start:
+        raise ValueError('截取范围为空，无法预览')
+    preview_job = replace(job, output_path=output_path, extra_outputs=[], start=start, end=end)
+    began = time.monotonic()
+    outcome = convert_job(preview_job, duration, on_progress, convert_fn, optimize, cancel=cancel)
+    elapsed = time.monotonic() - began
+    if conversion_failed(outcome.result):
+        lines = outcome.result.stderr.strip().splitlines()
+        raise RuntimeError(f"预览失败: {lines[-1] if lines else outcome.result.returncode}")
+    size = os.path.getsize(output_path)
+    clip_seconds = end - start
+    scale = (job.clip_duration(duration) or clip_seconds) / clip_seconds
+    return PreviewResult(output_path, start, clip_seconds, round(elapsed, 3), size,
+                         round(elapsed * scale, 1), int(size * scale))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# 输出质量：输出的动图或视频与按同样范围、帧率和尺寸缩放的源视频逐帧比较，得到 PSNR 和 SSIM
+import os
+import re
+import struct
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from converter import ConversionJob, OutputSpec, output_format
+from ffmpeg_runner import find_binary, run_ffmpeg
+from get_video_info import probe_video
+
+_PSNR = re.compile(r'PSNR .*average:(\S+)')
+_SSIM = re.compile(r'SSIM .*All:(\S+)')
+
+
+@dataclass
+class QualityReport:
+    output_path: str
+    output_bytes: int
+    psnr: float  # 所有帧的平均 PSNR（dB），与参考完全相同时为 inf
+    ssim: float  # 所有帧、所有通道的平均 SSIM（0 - 1）
+
+    def to_json(self):
+        data = asdict(self)
+        if self.psnr == float('inf'):
+            data['psnr'] = None  # JSON 没有 inf
+        return data
+
+
+def gif_size(path: str):
+    """从文件头读取 GIF 的画布尺寸 (宽, 高)"""
+    with open(path, 'rb') as f:
+        header = f.read(10)
+    if len(header) < 10 or not header.startswith(b'GIF'):
+        raise ValueError(f'{path} 不是 GIF 文件')
+    return struct.unpack('<HH', header[6:10])
+
+
+def output_size(path: str):
+    """输出的画面尺寸 (宽, 高)：GIF 读文件头，其他格式用 ffprobe"""
+    if output_format(path).name == 'gif':
+        return gif_size(path)
+    info = probe_video(path)
+    if info is None:
+        raise ValueError(f'无法获取 {path} 的尺寸')
+    return info.display_size
+
+
+def quality_command(job: ConversionJob, spec: OutputSpec, width: int, height: int) -> list:
+    reference = f'{job.trim_filter()}{job.crop_filter()}fps={spec.fps},scale={width}:{height}:flags=lanczos,format=rgb24'
+    return [find_binary('ffmpeg'), '-i', spec.output_path] + job.seek_options() + [
+        '-i', job.input_video,
+        '-filter_complex', f'[0:v]format=rgb24,split[a0][a1];[1:v]{reference},split[b0][b1];'
+                           f'[a0][b0]psnr;[a1][b1]ssim',
+        '-an', '-f', 'null', '-']
+
+
+def measure_quality(job: ConversionJob, spec: Optional[OutputSpec] = None) -> Optional[QualityReport]:
+    """
+    比较 spec（默认为第一个输出）与源视频，参考画面用与转换相同的截取范围、帧率和 lanczos 缩放。
+    无法比较（文件不存在、ffmpeg 失败）时打印警告并返回 None。
+    """
+    spec = spec or job.outputs[0]
+    try:
+        width, height = output_size(spec.output_path)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not measure quality: {e}")
+        return None
+    result = run_ffmpeg(quality_command(job, spec, width, height))
+    psnr = _PSNR.search(result.stderr)
+    ssim = _SSIM.search(result.stderr)
+    if result.returncode != 0 or psnr is None or ssim is None:
+        lines = result.stderr.strip().splitlines()
+        print(f"Warning: Could not measure quality of {spec.output_path}: {lines[-1] if lines else result.returncode}")
+        return None
+    return QualityReport(spec.output_path, os.path.getsize(spec.output_path), float(psnr.group(1)),
+                         float(ssim.group(1)))
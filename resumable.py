@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# 可续转的分块转换：按固定时长分块编码，每完成一块记入磁盘上的清单，中断后再次运行时跳过已完成的块
+import hashlib
+import os
+import shutil
+import uuid
+from typing import Callable, List, Optional, Tuple
+
+from app_cache import load_json, save_json
+from converter import ConversionJob, ConversionProgress, OutputProgress, conversion_failed, require_gif
+from ffmpeg_check import ffmpeg_version
+from ffmpeg_runner import FFmpegProgress, FFmpegResult, merge_usage, run_ffmpeg
+from get_video_info import probe_video
+from gif_format import join_gifs
+from output_cache import fingerprint
+from scheduler import cpu_count
+from segmented import palette_command, segment_command
+
+CHUNK_SECONDS = 30.0
+MANIFEST_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+PALETTE_FILE = 'palette.png'
+PALETTE_WEIGHT = 0.05  # 调色板采样在总进度中的占比
+
+
+def work_dir_for(output_path: str) -> str:
+    """分块和清单放在输出文件旁边，换一台机器（共享存储）或重启后按同样的输出路径找到"""
+    return output_path + '.parts'
+
+
+def discard_progress(output_path: str) -> None:
+    """删除未完成任务留下的分块"""
+    shutil.rmtree(work_dir_for(output_path), ignore_errors=True)
+
+
+def plan_chunks(duration: float, fps: int, chunk_seconds: float = CHUNK_SECONDS) -> List[Tuple[float, float]]:
+    """
+    把 [0, duration) 切成固定时长的块，返回 (起点, 时长) 列表。块长取整到输出帧间隔的整数倍，
+    拼接后的帧时间与整段转换一致；时长未知（0）时整段为一块，时长为 0 表示到结尾。
+    """
+    if duration <= 0:
+        return [(0.0, 0.0)]
+    step = max(1, round(chunk_seconds * fps)) / fps
+    chunks = []
+    start = 0.0
+    while start < duration - 1e-6:
+        chunks.append((start, min(step, duration - start)))
+        start = round(start + step, 6)
+    return chunks
+
+
+def job_signature(job: ConversionJob, chunk_seconds: float) -> dict:
+    """决定分块能否复用的全部参数：源文件、输出设置、分块时长和 ffmpeg 版本"""
+    return {
+        'input': fingerprint(job.input_video),
+        'fps': job.fps,
+        'width': job.width,
+        'colors': job.colors,
+        'start': job.start,
+        'end': job.end,
+        'crop': list(job.crop) if job.crop else None,  # 与读回的 JSON 比较
+        'chunk_seconds': chunk_seconds,
+        'ffmpeg': ffmpeg_version(),
+    }
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(work_dir: str, signature: dict) -> dict:
+    manifest = load_json(os.path.join(work_dir, MANIFEST_FILE))
+    if manifest and manifest.get('version') == MANIFEST_VERSION and manifest.get('signature') == signature:
+        palette = manifest.get('palette')
+        palette_path = os.path.join(work_dir, PALETTE_FILE)
+        if palette and os.path.exists(palette_path) and _sha256(palette_path) == palette['sha256']:
+            return manifest
+    # 没有清单、设置变了或调色板不对：已有的分块都不能用
+    for name in os.listdir(work_dir):
+        path = os.path.join(work_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+    return {'version': MANIFEST_VERSION, 'signature': signature, 'palette': None, 'chunks': {}}
+
+
+def _chunk_done(work_dir: str, record: Optional[dict]) -> bool:
+    if record is None:
+        return False
+    if not record['bytes']:
+        return True  # 超出视频结尾的空块
+    path = os.path.join(work_dir, record['file'])
+    return os.path.exists(path) and os.path.getsize(path) == record['bytes']
+
+
+def resumable_convert(job: ConversionJob, duration: Optional[float] = None,
+                      on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                      chunk_seconds: float = CHUNK_SECONDS) -> FFmpegResult:
+    """
+    可续转的转换，接口与 convert 相同。先生成全局调色板，再按 chunk_seconds 依次编码各块，
+    每块完成后写入清单；中断（取消、崩溃、重启）后用同样的参数再次运行，从第一个未完成的块继续。
+    全部完成后拼接成 GIF 并替换输出文件，之前不会覆盖已有的输出。不支持多输出任务。
+    """
+    if job.extra_outputs:
+        raise ValueError('可续转模式不支持多个输出')
+    require_gif(job, '可续转模式')
+    if duration is None:
+        info = probe_video(job.input_video)
+        duration = info.duration if info else 0.0
+    # 以下时间都相对截取范围的起点
+    base = job.start or 0.0
+    duration = job.clip_duration(duration) or 0.0
+    chunks = plan_chunks(duration, job.fps, chunk_seconds)
+    work_dir = work_dir_for(job.output_path)
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, MANIFEST_FILE)
+    manifest = _load_manifest(work_dir, job_signature(job, chunk_seconds))
+
+    done = [0.0] * len(chunks)
+    palette_done = [0.0]
+
+    def report():
+        if on_progress and duration > 0:
+            encoded = sum(done)
+            fraction = min(PALETTE_WEIGHT * palette_done[0] + (1 - PALETTE_WEIGHT) * encoded / duration, 1.0)
+            on_progress(ConversionProgress(fraction, FFmpegProgress(out_time=encoded),
+                                           [OutputProgress(job.output_path, fraction, 0)]))
+
+    usages = []
+    palette_path = os.path.join(work_dir, PALETTE_FILE)
+    if manifest['palette'] is None:
+        result = run_ffmpeg(palette_command(job, palette_path, keyframes_only=False), lambda progress: report())
+        if result.returncode != 0:
+            return result
+        usages.append(result.usage)
+        manifest['palette'] = {'file': PALETTE_FILE, 'sha256': _sha256(palette_path)}
+        save_json(manifest_path, manifest)
+    palette_done[0] = 1.0
+
+    for index, (start, length) in enumerate(chunks):
+        record = manifest['chunks'].get(str(index))
+        if _chunk_done(work_dir, record):
+            done[index] = length
+            continue
+        report()
+
+        def on_chunk_progress(progress: FFmpegProgress):
+            done[index] = min(progress.out_time, length) if length > 0 else 0.0
+            report()
+
+        name = f'chunk_{index:05d}.gif'
+        part_path = os.path.join(work_dir, f'chunk_{index:05d}.partial.gif')
+        command = segment_command(job, palette_path, base + start, length, part_path, job.threads or cpu_count())
+        if length <= 0:
+            # 时长未知时转换到结尾
+            t_index = command.index('-t')
+            del command[t_index:t_index + 2]
+        result = run_ffmpeg(command, on_chunk_progress)
+        if conversion_failed(result):
+            return result
+        usages.append(result.usage)
+        size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if size:
+            os.replace(part_path, os.path.join(work_dir, name))
+        manifest['chunks'][str(index)] = {'file': name, 'start': start, 'length': length, 'bytes': size}
+        save_json(manifest_path, manifest)
+        done[index] = length
+
+    paths = [os.path.join(work_dir, manifest['chunks'][str(i)]['file']) for i in range(len(chunks))
+             if manifest['chunks'][str(i)]['bytes']]
+    output_dir = os.path.dirname(os.path.abspath(job.output_path))
+    # 不用 mkstemp：它创建的文件只有所有者可读写，这里按 umask 创建，与其他输出的权限相同
+    tmp_path = os.path.join(output_dir, f'.vid2gif-{uuid.uuid4().hex}.gif')
+    try:
+        with open(tmp_path, 'xb') as output:
+            join_gifs(paths, output)
+        os.replace(tmp_path, job.output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    discard_progress(job.output_path)
+    return FFmpegResult(0, '', FFmpegProgress(out_time=duration, finished=True), merge_usage(usages))
+
+
+resumable_convert.replaces_output = True  # 见 converter.replaces_output
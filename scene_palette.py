@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# 分场景调色板：先在缩小的画面上检测场景切换，每个场景单独生成调色板，并按运动程度选择抖动方式
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from converter import (ConversionJob, ConversionProgress, MAX_COLORS, OutputProgress, conversion_failed,
+                       require_gif)
+from ffmpeg_runner import FFmpegProgress, FFmpegResult, find_binary, merge_usage, run_ffmpeg
+from get_video_info import probe_video
+from gif_format import join_gifs
+
+SCENE_THRESHOLD = 0.3  # select 滤镜的 scene 分数超过此值视为切换
+MIN_SCENE_SECONDS = 1.0  # 更短的场景并入前一个，每个场景之后的帧都要带局部颜色表
+ANALYSIS_WIDTH = 160
+ANALYSIS_WEIGHT = 0.2  # 场景分析在总进度中的占比
+# 场景内平均 scene 分数（相邻帧的差异）的分档
+STATIC_MOTION = 0.001
+LOW_MOTION = 0.004
+
+_PTS_TIME = re.compile(r'pts_time:(-?[\d.]+)')
+_SCENE_SCORE = re.compile(r'lavfi\.scene_score=([\d.]+)')
+
+
+@dataclass
+class Scene:
+    start: float  # 相对截取范围的起点（秒）
+    length: float  # 0 表示到结尾
+    motion: float  # 场景内相邻帧的平均差异
+
+    @property
+    def dither(self) -> str:
+        """
+        静止画面不抖动，未变化的区域逐帧相同，配合 diff_mode 压缩率最高；缓慢运动用大尺度的有序抖动，
+        图案不随时间闪动，又能减轻渐变的色带；运动剧烈时用与全局模式相同的误差扩散，噪点被运动掩盖。
+        """
+        if self.motion < STATIC_MOTION:
+            return 'none'
+        if self.motion < LOW_MOTION:
+            return 'bayer:bayer_scale=5'
+        return 'sierra2_4a'
+
+    @property
+    def stats_mode(self) -> str:
+        # 背景不动时调色板的颜色集中给变化的部分
+        return 'diff' if self.motion < STATIC_MOTION else 'full'
+
+
+def analysis_command(job: ConversionJob) -> List[str]:
+    command = [find_binary('ffmpeg')]
+    if job.threads:
+        command += ['-threads', str(job.threads)]
+    return command + job.seek_options() + [
+        '-i', job.input_video, '-an',
+        '-vf', f'{job.trim_filter()}{job.crop_filter()}fps={job.fps},scale={ANALYSIS_WIDTH}:-2,select=gte(scene\\,0),metadata=print',
+        '-f', 'null', '-']
+
+
+def parse_scene_scores(stderr: str) -> List[Tuple[float, float]]:
+    """metadata=print 的输出：每帧先打印 pts_time，再打印 lavfi.scene_score"""
+    scores = []
+    pts_time = None
+    for line in stderr.splitlines():
+        if 'Parsed_metadata' not in line:
+            continue
+        match = _PTS_TIME.search(line)
+        if match:
+            pts_time = float(match.group(1))
+            continue
+        match = _SCENE_SCORE.search(line)
+        if match and pts_time is not None:
+            scores.append((pts_time, float(match.group(1))))
+            pts_time = None
+    return scores
+
+
+def plan_scenes(scores: List[Tuple[float, float]], duration: float, threshold: float = SCENE_THRESHOLD,
+                min_length: float = MIN_SCENE_SECONDS) -> List[Scene]:
+    """
+    在 scene 分数超过 threshold 的帧处切分，切点都在输出帧的时间上；
+    距离上一个切点或结尾不足 min_length 的切换忽略。duration 为 0（未知）时最后一个场景到结尾。
+    """
+    end = duration or (scores[-1][0] if scores else 0.0)
+    cuts = [0.0]
+    for time, score in scores:
+        if score > threshold and time - cuts[-1] >= min_length and end - time >= min_length:
+            cuts.append(time)
+    scenes = []
+    for i, start in enumerate(cuts):
+        stop = cuts[i + 1] if i + 1 < len(cuts) else None
+        # 切换帧本身的分数不算场景内的运动
+        inside = [score for time, score in scores if start < time and (stop is None or time < stop)]
+        length = (stop - start) if stop is not None else (duration - start if duration else 0.0)
+        scenes.append(Scene(start, length, sum(inside) / len(inside) if inside else 0.0))
+    return scenes
+
+
+def scene_command(job: ConversionJob, scene: Scene, output_path: str) -> List[str]:
+    palettegen = [f'stats_mode={scene.stats_mode}']
+    if job.colors < MAX_COLORS:
+        palettegen.insert(0, f'max_colors={max(2, job.colors)}')
+    command = [find_binary('ffmpeg')]
+    if job.threads:
+        command += ['-threads', str(job.threads), '-filter_threads', str(job.threads)]
+    command += ['-ss', f'{(job.start or 0.0) + scene.start:.6f}']
+    if scene.length > 0:
+        command += ['-t', f'{scene.length:.6f}']
+    command += ['-i', job.input_video,
+                '-filter_complex', f'[0:v]{job.crop_filter()}fps={job.fps},scale={job.width}:-1:flags=lanczos,split[a][b];'
+                                   f'[a]palettegen={":".join(palettegen)}[p];'
+                                   f'[b][p]paletteuse=dither={scene.dither}:diff_mode=rectangle',
+                '-y', output_path]
+    return command
+
+
+def analyze_scenes(job: ConversionJob, duration: float, on_progress: Optional[Callable[[float], None]] = None,
+                   threshold: float = SCENE_THRESHOLD) -> Tuple[List[Scene], FFmpegResult]:
+    """在缩小到 ANALYSIS_WIDTH 宽的画面上计算每个输出帧的 scene 分数并切分场景，on_progress 接收 0 - 1"""
+
+    def report(progress: FFmpegProgress):
+        if on_progress and duration > 0:
+            on_progress(min(progress.out_time / duration, 1.0))
+
+    result = run_ffmpeg(analysis_command(job), report, stderr_lines=None)
+    if result.returncode != 0:
+        return [], result
+    return plan_scenes(parse_scene_scores(result.stderr), duration, threshold), result
+
+
+def scene_convert(job: ConversionJob, duration: Optional[float] = None,
+                  on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                  threshold: float = SCENE_THRESHOLD) -> FFmpegResult:
+    """
+    分场景调色板转换，接口与 convert 相同。每个场景单独编码，拼接时第一个场景的调色板作为全局颜色表，
+    其余场景的帧带局部颜色表。不支持多输出任务。
+    """
+    if job.extra_outputs:
+        raise ValueError('分场景调色板模式不支持多个输出')
+    require_gif(job, '分场景调色板模式')
+    if duration is None:
+        info = probe_video(job.input_video)
+        duration = info.duration if info else 0.0
+    duration = job.clip_duration(duration) or 0.0
+    os.makedirs(os.path.dirname(os.path.abspath(job.output_path)), exist_ok=True)
+
+    def report(fraction: float):
+        if on_progress:
+            on_progress(ConversionProgress(fraction, FFmpegProgress(out_time=fraction * duration),
+                                           [OutputProgress(job.output_path, fraction, 0)]))
+
+    scenes, analysis = analyze_scenes(job, duration, lambda fraction: report(ANALYSIS_WEIGHT * fraction), threshold)
+    if analysis.returncode != 0:
+        return analysis
+    results = []
+    encoded = 0.0
+    with tempfile.TemporaryDirectory(prefix='vid2gif-', dir=os.path.dirname(os.path.abspath(job.output_path))) as tmp:
+        paths = []
+        for index, scene in enumerate(scenes):
+            def on_scene_progress(progress: FFmpegProgress, scene=scene):
+                if duration > 0:
+                    done = encoded + min(progress.out_time, scene.length or duration)
+                    report(ANALYSIS_WEIGHT + (1 - ANALYSIS_WEIGHT) * min(done / duration, 1.0))
+
+            path = os.path.join(tmp, f'scene_{index:05d}.gif')
+            result = run_ffmpeg(scene_command(job, scene, path), on_scene_progress)
+            if conversion_failed(result):
+                return result
+            results.append(result)
+            encoded += scene.length
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                paths.append(path)
+        with open(job.output_path, 'wb') as output:
+            join_gifs(paths, output)
+    return FFmpegResult(0, '', FFmpegProgress(out_time=duration, finished=True),
+                        merge_usage([analysis.usage] + [r.usage for r in results]))
+
+
+def compare_palettes(input_video: str, fps: int, width: int, output_dir: str,
+                     threshold: float = SCENE_THRESHOLD) -> List[dict]:
+    """用全局调色板和分场景调色板转换同一个视频，比较耗时、大小和画质（PSNR/SSIM）"""
+    from converter import convert
+    from quality import measure_quality
+
+    results = []
+    for name, convert_fn in (('global', convert), ('scene', lambda job: scene_convert(job, threshold=threshold))):
+        output_path = os.path.join(output_dir, f'{os.path.splitext(os.path.basename(input_video))[0]}_{name}.gif')
+        job = ConversionJob(input_video, output_path, fps, width)
+        start = time.monotonic()
+        result = convert_fn(job)
+        elapsed = time.monotonic() - start
+        report = measure_quality(job) if not conversion_failed(result) else None
+        results.append({
+            'palette': name,
+            'returncode': result.returncode,
+            'seconds': round(elapsed, 3),
+            'bytes': os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+            'psnr': round(report.psnr, 2) if report else None,
+            'ssim': round(report.ssim, 4) if report else None,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较全局调色板与分场景调色板的大小和画质')
+    parser.add_argument('input')
+    parser.add_argument('--fps', type=int, default=10)
+    parser.add_argument('--width', type=int, default=480)
+    parser.add_argument('--threshold', type=float, default=SCENE_THRESHOLD)
+    parser.add_argument('-o', '--output-dir', default='.')
+    args = parser.parse_args()
+    probe_job = ConversionJob(args.input, '', args.fps, args.width)
+    info = probe_video(args.input)
+    scenes, _ = analyze_scenes(probe_job, info.duration if info else 0.0, threshold=args.threshold)
+    for scene in scenes:
+        print(f"场景 {scene.start:8.2f}s +{scene.length:7.2f}s  运动 {scene.motion:.4f}  抖动 {scene.dither}")
+    print(f"{'调色板':<8}{'耗时(s)':>10}{'字节':>12}{'PSNR':>8}{'SSIM':>8}")
+    for row in compare_palettes(args.input, args.fps, args.width, args.output_dir, args.threshold):
+        print(f"{row['palette']:<8}{row['seconds']:>10}{row['bytes']:>12}{row['psnr']!s:>8}{row['ssim']!s:>8}")
+    sys.exit(0)
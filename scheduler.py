@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, field, replace
+from typing import Callable, Iterable, List, Optional
+
+from converter import ConversionJob, convert, conversion_failed, output_format
+
+
+def cpu_count() -> int:
+    """可用的 CPU 核数，Linux 下考虑进程亲和性（容器、taskset）"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def plan_concurrency(jobs: Optional[int] = None, cores: Optional[int] = None):
+    """
+    返回 (并发 ffmpeg 进程数, 每个进程的线程数)，两者乘积不超过核数。
+
+    palettegen/paletteuse 难以利用很多核，默认每个进程分两个线程，用更多进程占满机器。
+    """
+    cores = cores or cpu_count()
+    if not jobs:
+        jobs = max(1, cores // 2)
+    jobs = max(1, min(jobs, cores))
+    return jobs, max(1, cores // jobs)
+
+
+def _read_cpu_times():
+    """/proc/stat 中所有 CPU 的 (总时间, 空闲时间)，单位为时钟周期；非 Linux 返回 None"""
+    try:
+        with open('/proc/stat') as f:
+            values = [int(value) for value in f.readline().split()[1:9]]
+    except (OSError, ValueError):
+        return None
+    if len(values) < 4:
+        return None
+    # idle + iowait，guest 时间已计入 user
+    return sum(values), values[3] + (values[4] if len(values) > 4 else 0)
+
+
+class CpuGovernor:
+    """
+    决定还能再启动几个 ffmpeg 进程、每个进程分几个线程。
+
+    所有运行中任务的线程数之和加上其他程序占用的核数不超过可用核数；其他程序的占用由两次调用之间
+    /proc/stat 的忙碌比例减去本程序已分配的线程数估算，没有 /proc/stat 时用 1 分钟平均负载。
+    没有任务在运行时至少分配一个线程，保证队列总能前进。
+    """
+
+    MIN_SAMPLE_TICKS = 20  # 采样间隔太短时沿用上次的结果
+
+    def __init__(self, jobs: Optional[int] = None, cores: Optional[int] = None):
+        self.cores = cores or cpu_count()
+        self.max_jobs, self.threads_per_job = plan_concurrency(jobs, self.cores)
+        self._last_times = _read_cpu_times()
+        self._busy_cores = 0.0
+
+    def busy_cores(self) -> float:
+        """整台机器正在使用的核数"""
+        times = _read_cpu_times()
+        if times is None or self._last_times is None:
+            if hasattr(os, 'getloadavg'):
+                return os.getloadavg()[0]
+            return 0.0
+        total = times[0] - self._last_times[0]
+        if total >= self.MIN_SAMPLE_TICKS:
+            idle = times[1] - self._last_times[1]
+            self._busy_cores = (1 - idle / total) * (os.cpu_count() or self.cores)
+            self._last_times = times
+        return self._busy_cores
+
+    def allocate(self, running_threads: List[int]) -> int:
+        """running_threads 为运行中各任务的线程数，返回下一个任务的线程数，0 表示现在不应再启动"""
+        if len(running_threads) >= self.max_jobs:
+            return 0
+        used = sum(running_threads)
+        external = max(0.0, self.busy_cores() - used)
+        free = self.cores - used - int(round(external))
+        if not running_threads:
+            free = max(free, 1)
+        return max(0, min(self.threads_per_job, free))
+
+
+@dataclass
+class JobResult:
+    input_video: str
+    output_path: str
+    returncode: int
+    success: bool
+    elapsed: float
+    output_bytes: int  # 所有输出的总字节数
+    error: str = ''
+    bytes_before_optimize: int = 0  # 帧间优化前的总字节数，未优化时为 0
+    quality: List[dict] = field(default_factory=list)  # 每个输出的 PSNR/SSIM，需要时由调用方填入
+
+    def to_json(self):
+        return asdict(self)
+
+
+def run_job(job: ConversionJob, convert_fn: Callable = convert, optimize: bool = False) -> JobResult:
+    """optimize 为 True 时转换成功后对每个输出做帧间优化，耗时计入 elapsed"""
+    start = time.monotonic()
+    try:
+        result = convert_fn(job)
+    except (OSError, ValueError, RuntimeError) as e:
+        return JobResult(job.input_video, job.output_path, -1, False, time.monotonic() - start, 0, str(e))
+    failed = conversion_failed(result)
+    bytes_before_optimize = 0
+    if optimize and not failed:
+        try:
+            from gif_optimize import optimize_outputs  # 需要 NumPy，用到时才导入
+            # 帧间优化只作用于 GIF，其他格式的编码器自己做帧间压缩
+            stats = optimize_outputs([spec.output_path for spec in job.outputs
+                                      if output_format(spec.output_path).name == 'gif'])
+        except RuntimeError as e:
+            print(f"Warning: {e}")
+            stats = []
+        bytes_before_optimize = sum(item.bytes_before for item in stats)
+    elapsed = time.monotonic() - start
+    output_bytes = 0
+    for spec in job.outputs:
+        try:
+            output_bytes += os.path.getsize(spec.output_path)
+        except OSError:
+            pass
+    error = result.stderr.strip().splitlines()[-1] if failed and result.stderr.strip() else ''
+    return JobResult(job.input_video, job.output_path, result.returncode, not failed, elapsed, output_bytes, error,
+                     bytes_before_optimize)
+
+
+class BatchScheduler:
+    """
+    批量转换调度器。每个任务是一个独立的 ffmpeg 子进程，工作线程只负责启动并等待子进程，
+    因此同时运行的进程数即为 jobs，每个进程通过 -threads/-filter_threads 限制线程数。
+    """
+
+    def __init__(self, jobs: Optional[int] = None, cores: Optional[int] = None):
+        self.jobs, self.threads_per_job = plan_concurrency(jobs, cores)
+
+    def run(self, jobs: Iterable[ConversionJob],
+            on_done: Optional[Callable[[JobResult], None]] = None,
+            convert_fn: Callable = convert, optimize: bool = False) -> List[JobResult]:
+        jobs = [replace(job, threads=job.threads or self.threads_per_job) for job in jobs]
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(run_job, job, convert_fn, optimize): index for index, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if on_done:
+                    on_done(result)
+        # 按提交顺序返回，便于与输入对应
+        return [results[index] for index in range(len(jobs))]
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# 分段并行转换：先采样生成全局调色板，再按关键帧切段并行编码，最后直接拼接 GIF
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from converter import (ConversionJob, ConversionProgress, OutputProgress, conversion_failed, palettegen_filter,
+                       require_gif)
+from ffmpeg_runner import FFmpegProgress, FFmpegResult, find_binary, merge_usage, popen_kwargs, run_ffmpeg
+from get_video_info import probe_video
+from gif_format import join_gifs
+from scheduler import cpu_count
+
+MIN_SEGMENT_SECONDS = 10.0
+PALETTE_WEIGHT = 0.1  # 调色板采样在总进度中的占比
+
+
+def keyframe_times(input_video: str) -> List[float]:
+    """读取视频流中所有关键帧的时间戳，只解析数据包，不解码"""
+    command = [find_binary('ffprobe'), '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', input_video]
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 text=True, encoding='utf-8', errors='replace', **popen_kwargs())
+    except OSError as e:
+        # 没有 ffprobe 时退化为不切段
+        print(f"Warning: Could not read keyframes: {e}")
+        return []
+    times = []
+    for line in process.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags:
+            try:
+                times.append(float(pts_time))
+            except ValueError:
+                continue
+    return sorted(set(times))
+
+
+def plan_segments(duration: float, keyframes: List[float], count: int,
+                  min_length: float = MIN_SEGMENT_SECONDS) -> List[Tuple[float, float]]:
+    """
+    把 [0, duration) 切成约 count 段，分界点吸附到最近的关键帧，
+    使每段都能从关键帧开始快速定位。返回 (起点, 时长) 列表。
+    """
+    count = max(1, min(count, int(duration // min_length) or 1))
+    boundaries = [0.0]
+    for i in range(1, count):
+        target = duration * i / count
+        candidates = [t for t in keyframes if boundaries[-1] + min_length / 2 <= t < duration - min_length / 2]
+        if not candidates:
+            continue
+        nearest = min(candidates, key=lambda t: abs(t - target))
+        if nearest > boundaries[-1]:
+            boundaries.append(nearest)
+    boundaries.append(duration)
+    return [(start, end - start) for start, end in zip(boundaries, boundaries[1:])]
+
+
+def palette_command(job: ConversionJob, palette_path: str, keyframes_only: bool) -> List[str]:
+    """
+    采样生成全局调色板。关键帧足够多时只解码关键帧，否则每秒取一帧。
+    """
+    command = [find_binary('ffmpeg')]
+    if keyframes_only:
+        command += ['-skip_frame', 'nokey']
+        sample = ''
+    else:
+        sample = 'fps=1,'
+    if job.threads:
+        command += ['-threads', str(job.threads)]
+    command += job.seek_options()
+    if job.end is not None:
+        command += ['-t', f'{job.clip_duration(None):.3f}']
+    command += ['-i', job.input_video,
+                '-vf', f'{sample}{job.crop_filter()}scale={job.width}:-1:flags=lanczos,{palettegen_filter(job.colors)}',
+                '-frames:v', '1', '-update', '1', '-y', palette_path]
+    return command
+
+
+def segment_command(job: ConversionJob, palette_path: str, start: float, length: float,
+                    output_path: str, threads: int) -> List[str]:
+    return [find_binary('ffmpeg'), '-threads', str(threads), '-filter_threads', str(threads),
+            '-ss', f'{start:.6f}', '-t', f'{length:.6f}', '-i', job.input_video,
+            '-i', palette_path,
+            '-filter_complex', f'[0:v]{job.crop_filter()}fps={job.fps},scale={job.width}:-1:flags=lanczos[x];[x][1:v]paletteuse',
+            '-y', output_path]
+
+
+def parallel_convert(job: ConversionJob, duration: Optional[float] = None,
+                     on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                     workers: Optional[int] = None) -> FFmpegResult:
+    """
+    分段并行转换，适合长视频。所有分段使用同一个全局调色板，拼接时不重新编码，
+    保留每帧延时和第一段的循环设置。不支持多输出任务。
+    """
+    if job.extra_outputs:
+        raise ValueError('分段并行模式不支持多个输出')
+    require_gif(job, '分段并行模式')
+    if duration is None:
+        info = probe_video(job.input_video)
+        duration = info.duration if info else 0.0
+    # 以下时间都相对截取范围的起点
+    base = job.start or 0.0
+    duration = job.clip_duration(duration) or 0.0
+    # job.threads 是整个任务的线程预算（调度器或转换队列分配），由各分段平分
+    budget = job.threads or cpu_count()
+    workers = workers or budget
+    os.makedirs(os.path.dirname(os.path.abspath(job.output_path)), exist_ok=True)
+
+    keyframes = [t - base for t in keyframe_times(job.input_video) if base <= t < base + duration]
+    segments = plan_segments(duration, keyframes, workers * 2) if duration > 0 else [(0.0, 0.0)]
+    threads = max(1, budget // min(workers, len(segments)))
+
+    lock = threading.Lock()
+    done = [0.0] * len(segments)
+    palette_done = [0.0]
+
+    def report():
+        if on_progress and duration > 0:
+            encoded = sum(done)
+            fraction = min(PALETTE_WEIGHT * palette_done[0] + (1 - PALETTE_WEIGHT) * encoded / duration, 1.0)
+            on_progress(ConversionProgress(fraction, FFmpegProgress(out_time=encoded),
+                                           [OutputProgress(job.output_path, fraction, 0)]))
+
+    with tempfile.TemporaryDirectory(prefix='vid2gif-', dir=os.path.dirname(os.path.abspath(job.output_path))) as tmp:
+        palette_path = os.path.join(tmp, 'palette.png')
+        # 采样阶段也回调进度（比例不变），调用方可以在回调中取消
+        result = run_ffmpeg(palette_command(job, palette_path, len(keyframes) >= 8), lambda progress: report())
+        if result.returncode != 0:
+            return result
+        palette_done[0] = 1.0
+        report()
+
+        def encode(index: int) -> FFmpegResult:
+            start, length = segments[index]
+
+            def on_segment_progress(progress: FFmpegProgress):
+                with lock:
+                    done[index] = min(progress.out_time, length)
+                    report()
+
+            segment_path = os.path.join(tmp, f'segment_{index:05d}.gif')
+            command = segment_command(job, palette_path, base + start, length, segment_path, threads)
+            if length <= 0:
+                # 时长未知时转换到结尾
+                t_index = command.index('-t')
+                del command[t_index:t_index + 2]
+            return run_ffmpeg(command, on_segment_progress)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(encode, range(len(segments))))
+        for segment_result in results:
+            if conversion_failed(segment_result):
+                return segment_result
+
+        segment_paths = [os.path.join(tmp, f'segment_{i:05d}.gif') for i in range(len(segments))]
+        segment_paths = [path for path in segment_paths if os.path.exists(path) and os.path.getsize(path) > 0]
+        with open(job.output_path, 'wb') as output:
+            join_gifs(segment_paths, output)
+
+    return FFmpegResult(0, '', FFmpegProgress(out_time=duration, finished=True),
+                        merge_usage([result.usage] + [r.usage for r in results]))
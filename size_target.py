@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+# 目标文件大小模式：用几段短样本拟合码率模型，选出不超过上限的最佳帧率、宽度和颜色数
+import math
+import os
+import tempfile
+from dataclasses import dataclass, replace
+from typing import Callable, List, Optional, Tuple
+
+from converter import (ConversionJob, ConversionProgress, MAX_COLORS, OutputProgress, OutputSpec, convert,
+                       conversion_failed, output_format)
+from ffmpeg_runner import FFmpegProgress, FFmpegResult
+from get_video_info import probe_video
+
+SAMPLE_SEGMENTS = 3
+SAMPLE_SECONDS = 2.0
+SAMPLE_WEIGHT = 0.2  # 采样在总进度中的占比
+SAFETY = 0.95  # 第一次完整编码按预测值的 95% 留余量
+CORRECTION_SAFETY = 0.9
+
+FPS_LADDER = (5, 8, 10, 12, 15, 20, 25, 30, 45, 60)
+WIDTH_SCALES = (1.0, 0.85, 0.75, 0.66, 0.5, 0.4, 0.33, 0.25)
+MIN_WIDTH = 120
+COLOR_LADDER = (256, 128, 64, 32)
+
+# 某个变量在样本中没有变化时使用的经验指数（字节/秒 ∝ fps^a · width^b · colors^c）
+PRIOR_EXPONENTS = (0.8, 1.6, 0.3)
+# 同样在预算内时优先保留分辨率，其次帧率，最后是颜色数
+PREFERENCE = (0.6, 1.0, 0.3)
+
+
+@dataclass
+class SizeChoice:
+    fps: int
+    width: int
+    colors: int
+    predicted_bytes: int
+
+
+class SizeModel:
+    """log(字节/秒) = k + a·log(fps) + b·log(宽度) + c·log(颜色数)，用最小二乘拟合"""
+
+    def __init__(self, intercept: float, exponents: Tuple[float, float, float]):
+        self.intercept = intercept
+        self.exponents = exponents
+
+    @classmethod
+    def fit(cls, samples: List[Tuple[int, int, int, float]]) -> 'SizeModel':
+        """samples 为 (fps, 宽度, 颜色数, 字节/秒)"""
+        points = [([math.log(fps), math.log(width), math.log(colors)], math.log(max(rate, 1.0)))
+                  for fps, width, colors, rate in samples]
+        varying = [i for i in range(3) if len({round(x[i], 6) for x, _ in points}) > 1]
+        exponents = list(PRIOR_EXPONENTS)
+        # 没有变化的变量用经验指数，先从 y 中扣除
+        rows = [[1.0] + [x[i] for i in varying] for x, _ in points]
+        ys = [y - sum(exponents[i] * x[i] for i in range(3) if i not in varying) for x, y in points]
+        coefficients = _least_squares(rows, ys)
+        for i, value in zip(varying, coefficients[1:]):
+            # 码率不会随帧率、宽度或颜色数增加而减小，拟合结果为负说明样本噪声太大
+            exponents[i] = max(value, 0.0)
+        if any(coefficients[1 + k] < 0 for k in range(len(varying))):
+            intercept = sum(y - sum(exponents[i] * x[i] for i in range(3)) for x, y in points) / len(points)
+        else:
+            intercept = coefficients[0]
+        return cls(intercept, tuple(exponents))
+
+    def bytes_per_second(self, fps: int, width: int, colors: int) -> float:
+        a, b, c = self.exponents
+        return math.exp(self.intercept + a * math.log(fps) + b * math.log(width) + c * math.log(colors))
+
+    def calibrate(self, predicted: float, actual: float) -> None:
+        """按一次完整编码的实际大小整体缩放模型"""
+        if predicted > 0 and actual > 0:
+            self.intercept += math.log(actual / predicted)
+
+
+def _least_squares(rows: List[List[float]], ys: List[float]) -> List[float]:
+    """解正规方程 (XᵀX)β = Xᵀy，变量只有几个，直接高斯消元"""
+    n = len(rows[0])
+    matrix = [[sum(r[i] * r[j] for r in rows) + (1e-9 if i == j else 0.0) for j in range(n)] +
+              [sum(r[i] * y for r, y in zip(rows, ys))] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(matrix[r][col]))
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        for r in range(n):
+            if r != col and matrix[col][col]:
+                factor = matrix[r][col] / matrix[col][col]
+                matrix[r] = [a - factor * b for a, b in zip(matrix[r], matrix[col])]
+    return [matrix[i][n] / matrix[i][i] if matrix[i][i] else 0.0 for i in range(n)]
+
+
+def candidate_settings(fps: int, width: int) -> List[Tuple[int, int, int]]:
+    """不超过用户所选帧率和宽度的所有组合，宽度取偶数"""
+    fps_options = sorted({f for f in FPS_LADDER if f <= fps} | {fps})
+    widths = sorted({int(width * scale) // 2 * 2 for scale in WIDTH_SCALES if width * scale >= MIN_WIDTH} | {width})
+    return [(f, w, c) for f in fps_options for w in widths for c in COLOR_LADDER]
+
+
+def sample_settings(fps: int, width: int) -> List[Tuple[int, int, int]]:
+    """采样点：原设置，以及分别降低帧率、宽度、颜色数和同时降低三者的设置"""
+    low_fps = max(1, fps // 2)
+    low_width = max(MIN_WIDTH, int(width * 0.5) // 2 * 2)
+    points = [(fps, width, MAX_COLORS), (low_fps, width, MAX_COLORS), (fps, low_width, MAX_COLORS),
+              (fps, width, 64), (low_fps, low_width, 64)]
+    unique = []
+    for point in points:
+        if point not in unique:
+            unique.append(point)
+    return unique
+
+
+def sample_windows(duration: float, count: int = SAMPLE_SEGMENTS,
+                   length: float = SAMPLE_SECONDS) -> List[Tuple[float, float]]:
+    """在片段中均匀取几个 (起点, 时长) 窗口，片段很短时整段作为一个样本"""
+    if duration <= count * length:
+        return [(0.0, duration)]
+    step = duration / count
+    return [(step * i + (step - length) / 2, length) for i in range(count)]
+
+
+def choose_settings(model: SizeModel, duration: float, max_bytes: int, fps: int, width: int,
+                    safety: float = SAFETY) -> SizeChoice:
+    """预测大小不超过 max_bytes * safety 的组合中取偏好得分最高的，都超出时取最小的"""
+    best = None
+    smallest = None
+    for f, w, c in candidate_settings(fps, width):
+        predicted = model.bytes_per_second(f, w, c) * duration
+        choice = SizeChoice(f, w, c, int(predicted))
+        if smallest is None or predicted < smallest.predicted_bytes:
+            smallest = choice
+        if predicted <= max_bytes * safety:
+            score = PREFERENCE[0] * math.log(f) + PREFERENCE[1] * math.log(w) + PREFERENCE[2] * math.log(c)
+            if best is None or score > best[0]:
+                best = (score, choice)
+    return best[1] if best else smallest
+
+
+def measure_samples(job: ConversionJob, duration: float, tmp: str,
+                    convert_fn: Callable = convert,
+                    on_fraction: Optional[Callable[[float], None]] = None) -> List[Tuple[int, int, int, float]]:
+    """
+    对每个样本窗口编码所有采样设置，返回各设置的平均字节/秒。
+    使用 convert 时同一窗口的所有设置共用一次解码。
+    """
+    settings = sample_settings(job.fps, job.width)
+    windows = sample_windows(duration)
+    totals = {setting: 0 for setting in settings}
+    seconds = 0.0
+    base = job.start or 0.0
+    runs = len(windows) * (1 if convert_fn is convert else len(settings))
+    done = 0
+    extension = output_format(job.output_path).extension  # 样本与最终输出的格式相同
+    for w, (start, length) in enumerate(windows):
+        specs = [OutputSpec(os.path.join(tmp, f'sample_{w}_{i}{extension}'), f, width, c)
+                 for i, (f, width, c) in enumerate(settings)]
+        groups = [specs] if convert_fn is convert else [[spec] for spec in specs]
+        for group in groups:
+            first = group[0]
+            sample_job = ConversionJob(job.input_video, first.output_path, first.fps, first.width,
+                                       threads=job.threads, extra_outputs=group[1:],
+                                       start=base + start, end=base + start + length, colors=first.colors,
+                                       crop=job.crop)
+            result = convert_fn(sample_job, None)
+            if conversion_failed(result):
+                lines = result.stderr.strip().splitlines()
+                raise RuntimeError(f'样本编码失败: {lines[-1] if lines else result.returncode}')
+            done += 1
+            if on_fraction:
+                on_fraction(done / runs)
+        seconds += length
+        for spec, setting in zip(specs, settings):
+            if os.path.exists(spec.output_path):
+                totals[setting] += os.path.getsize(spec.output_path)
+    return [(f, w, c, totals[(f, w, c)] / seconds) for f, w, c in settings if totals[(f, w, c)] > 0]
+
+
+def convert_to_size(job: ConversionJob, max_bytes: int, duration: Optional[float] = None,
+                    on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                    convert_fn: Callable = convert) -> Tuple[FFmpegResult, SizeChoice]:
+    """
+    在 job 的帧率和宽度以内选择不超过 max_bytes 的设置并转换。
+    先编码几段短样本拟合码率模型，再完整编码一次；结果超出上限时按实际大小校准模型，再编码一次。
+    返回最后一次转换的结果和所选设置。
+    """
+    if duration is None:
+        info = probe_video(job.input_video)
+        duration = info.duration if info else None
+    clip = job.clip_duration(duration)
+    if not clip:
+        raise ValueError('无法获取视频时长，不能按目标大小转换')
+    os.makedirs(os.path.dirname(os.path.abspath(job.output_path)), exist_ok=True)
+    last_fraction = [0.0]
+
+    def report(fraction: float, progress: FFmpegProgress):
+        # 校正编码从头开始时保持进度不倒退
+        fraction = max(last_fraction[0], min(fraction, 1.0))
+        last_fraction[0] = fraction
+        if on_progress:
+            on_progress(ConversionProgress(fraction, progress, [OutputProgress(job.output_path, fraction, 0)]))
+
+    with tempfile.TemporaryDirectory(prefix='vid2gif-', dir=os.path.dirname(os.path.abspath(job.output_path))) as tmp:
+        samples = measure_samples(job, clip, tmp, convert_fn,
+                                  lambda fraction: report(SAMPLE_WEIGHT * fraction, FFmpegProgress()))
+    if not samples:
+        raise RuntimeError('样本编码没有产生输出')
+    model = SizeModel.fit(samples)
+
+    def encode(choice: SizeChoice) -> FFmpegResult:
+        final_job = replace(job, fps=choice.fps, width=choice.width, colors=choice.colors)
+        return convert_fn(final_job, duration,
+                          lambda p: report(SAMPLE_WEIGHT + (1 - SAMPLE_WEIGHT) * p.fraction, p.ffmpeg))
+
+    choice = choose_settings(model, clip, max_bytes, job.fps, job.width)
+    result = encode(choice)
+    if conversion_failed(result) or not os.path.exists(job.output_path):
+        return result, choice
+    actual = os.path.getsize(job.output_path)
+    if actual > max_bytes:
+        model.calibrate(choice.predicted_bytes, actual)
+        corrected = choose_settings(model, clip, max_bytes, job.fps, job.width, CORRECTION_SAFETY)
+        if (corrected.fps, corrected.width, corrected.colors) != (choice.fps, choice.width, choice.colors):
+            print(f"Warning: {actual} 字节超出上限，改用 {corrected.width}px {corrected.fps}fps "
+                  f"{corrected.colors} 色重新编码")
+            choice = corrected
+            result = encode(choice)
+    return result, choice
+
+
+def target_size_convert(job: ConversionJob, duration: Optional[float] = None,
+                        on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                        max_bytes: int = 0, convert_fn: Callable = convert) -> FFmpegResult:
+    """与 convert 接口相同的包装，供调度器和输出缓存使用"""
+    if job.extra_outputs:
+        raise ValueError('目标大小模式不支持多个输出')
+    result, _ = convert_to_size(job, max_bytes, duration, on_progress, convert_fn)
+    return result
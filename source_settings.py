@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# 按源文件保存的设置：再次导入同一个文件时恢复帧率、分辨率、截取范围和裁剪区域。
+# 按路径而不是内容指纹区分，重新录制并覆盖同名文件时沿用之前的裁剪
+import os
+from typing import Optional
+
+from app_cache import cache_dir, load_json, save_json
+
+SETTINGS_FILE = 'source_settings.json'
+MAX_SOURCES = 500  # 只保留最近保存的若干个文件
+
+
+def _settings_path() -> str:
+    return os.path.join(cache_dir(), SETTINGS_FILE)
+
+
+def _key(video_path: str) -> str:
+    return os.path.normcase(os.path.abspath(video_path))
+
+
+def _load(path: str) -> dict:
+    data = load_json(path, {})
+    return data if isinstance(data, dict) else {}
+
+
+def load_source_settings(video_path: str) -> Optional[dict]:
+    settings = _load(_settings_path()).get(_key(video_path))
+    return settings if isinstance(settings, dict) else None
+
+
+def save_source_settings(video_path: str, settings: dict) -> None:
+    path = _settings_path()
+    data = _load(path)
+    data.pop(_key(video_path), None)
+    data[_key(video_path)] = settings  # 最近保存的排在最后
+    for key in list(data)[:-MAX_SOURCES]:
+        del data[key]
+    try:
+        save_json(path, data)
+    except OSError as e:
+        print(f"Warning: Could not save settings for {video_path}: {e}")
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# 每个任务的性能记录：各阶段耗时、ffmpeg 报告的速度、子进程的 CPU 时间和峰值内存
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict, field
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app_cache import cache_dir
+from converter import ConversionJob, ConversionProgress, convert, conversion_failed
+from ffmpeg_runner import FFmpegResult
+from get_video_info import probe_video
+from output_cache import cached_convert, describe_convert_fn
+
+SAMPLE_INTERVAL = 1.0  # 速度采样间隔（秒）
+
+
+@dataclass
+class JobMetrics:
+    job_id: str
+    started_at: float  # Unix 时间戳
+    input_video: str
+    input_bytes: int
+    outputs: List[str]
+    mode: str  # 转换方式，如 convert、native_convert、target_size_convert(...)
+    fps: int
+    width: int
+    colors: int
+    start: Optional[float]
+    end: Optional[float]
+    source_duration: Optional[float] = None
+    probe_seconds: float = 0.0
+    first_frame_seconds: Optional[float] = None  # 从开始转换到第一帧输出
+    encode_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    samples: List[Tuple[float, float, float, int]] = field(default_factory=list)  # (秒, speed, fps, frame)
+    mean_speed: float = 0.0
+    output_bytes: int = 0
+    cpu_seconds: Optional[float] = None
+    peak_rss_bytes: Optional[int] = None
+    returncode: int = 0
+    success: bool = False
+    error: str = ''
+
+    def to_json(self):
+        return asdict(self)
+
+    def summary(self) -> str:
+        """界面上显示的一行摘要"""
+        parts = [f'探测 {self.probe_seconds * 1000:.0f}ms']
+        if self.first_frame_seconds is not None:
+            parts.append(f'首帧 {self.first_frame_seconds:.1f}s')
+        parts.append(f'编码 {self.encode_seconds:.1f}s')
+        if self.mean_speed:
+            parts.append(f'{self.mean_speed:.2f}x')
+        if self.cpu_seconds is not None:
+            parts.append(f'CPU {self.cpu_seconds:.1f}s')
+        if self.peak_rss_bytes:
+            parts.append(f'内存 {self.peak_rss_bytes / 1024 ** 2:.0f}MB')
+        parts.append(f'{self.output_bytes / 1024:.0f}KB')
+        return ' · '.join(parts)
+
+
+class JsonLinesLog:
+    """追加写入的 JSON Lines 日志，每个任务一行，多线程共用"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: JobMetrics) -> None:
+        line = json.dumps(metrics.to_json(), ensure_ascii=False)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                print(f"Warning: Could not write telemetry log: {e}")
+
+
+def default_log_path() -> str:
+    return os.environ.get('VID2GIF_TELEMETRY_LOG') or os.path.join(cache_dir('telemetry'), 'jobs.jsonl')
+
+
+class MetricsRegistry:
+    """
+    按转换方式、帧率和宽度汇总的计数器，以 Prometheus 文本格式导出。
+    标签只取这几个取值有限的设置，具体到输入文件的数据见 JSON Lines 日志。
+    """
+
+    COUNTERS = (
+        ('vid2gif_jobs_total', '已完成的任务数'),
+        ('vid2gif_job_failures_total', '失败的任务数'),
+        ('vid2gif_job_wall_seconds_total', '任务总耗时'),
+        ('vid2gif_probe_seconds_total', '探测视频信息的总耗时'),
+        ('vid2gif_first_frame_seconds_total', '从开始到第一帧输出的总耗时'),
+        ('vid2gif_encode_seconds_total', '转换阶段的总耗时'),
+        ('vid2gif_source_seconds_total', '已转换的源视频时长'),
+        ('vid2gif_output_bytes_total', '输出的总字节数'),
+        ('vid2gif_child_cpu_seconds_total', '子进程的 CPU 时间'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._peak_rss: Dict[Tuple, int] = {}
+
+    def __call__(self, metrics: JobMetrics) -> None:
+        labels = (('mode', metrics.mode.split('(')[0]), ('fps', str(metrics.fps)), ('width', str(metrics.width)))
+        clip = metrics.end if metrics.end is not None else metrics.source_duration
+        values = {
+            'vid2gif_jobs_total': 1,
+            'vid2gif_job_failures_total': 0 if metrics.success else 1,
+            'vid2gif_job_wall_seconds_total': metrics.wall_seconds,
+            'vid2gif_probe_seconds_total': metrics.probe_seconds,
+            'vid2gif_first_frame_seconds_total': metrics.first_frame_seconds or 0.0,
+            'vid2gif_encode_seconds_total': metrics.encode_seconds,
+            'vid2gif_source_seconds_total': max(0.0, (clip or 0.0) - (metrics.start or 0.0)),
+            'vid2gif_output_bytes_total': metrics.output_bytes,
+            'vid2gif_child_cpu_seconds_total': metrics.cpu_seconds or 0.0,
+        }
+        with self._lock:
+            for name, value in values.items():
+                key = (name, labels)
+                self._counters[key] = self._counters.get(key, 0.0) + value
+            if metrics.peak_rss_bytes:
+                self._peak_rss[labels] = max(self._peak_rss.get(labels, 0), metrics.peak_rss_bytes)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, help_text in self.COUNTERS:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f'{name}{_labels(labels)} {value:g}')
+            lines += ['# HELP vid2gif_child_peak_rss_bytes 子进程的最大峰值内存',
+                      '# TYPE vid2gif_child_peak_rss_bytes gauge']
+            for labels, value in sorted(self._peak_rss.items()):
+                lines.append(f'vid2gif_child_peak_rss_bytes{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: Tuple) -> str:
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def serve_metrics(registry: MetricsRegistry, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """在后台线程中提供 /metrics，返回的 server 可用 shutdown() 停止"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def describe_mode(convert_fn: Callable) -> str:
+    """转换方式的描述，去掉输出缓存这一层，缓存命中的任务与实际转换归为同一类"""
+    while isinstance(convert_fn, partial) and convert_fn.func is cached_convert:
+        convert_fn = convert_fn.keywords.get('convert_fn', convert)
+    return describe_convert_fn(convert_fn)
+
+
+def instrumented_convert(job: ConversionJob, duration: Optional[float] = None,
+                         on_progress: Optional[Callable[[ConversionProgress], None]] = None,
+                         convert_fn: Callable = convert, sinks: Tuple[Callable[[JobMetrics], None], ...] = (),
+                         on_metrics: Optional[Callable[[JobMetrics], None]] = None) -> FFmpegResult:
+    """
+    与 convert 接口相同的包装：记录各阶段耗时和子进程资源占用，结束后把 JobMetrics 交给每个 sink，
+    再交给 on_metrics。未提供 duration 时先探测（计入 probe_seconds），再传给 convert_fn。
+    """
+    started = time.monotonic()
+    metrics = JobMetrics(uuid.uuid4().hex[:12], time.time(), job.input_video, _file_size(job.input_video),
+                         [spec.output_path for spec in job.outputs], describe_mode(convert_fn),
+                         job.fps, job.width, job.colors, job.start, job.end)
+    if duration is None:
+        info = probe_video(job.input_video)
+        duration = info.duration if info else None
+    metrics.source_duration = duration
+    metrics.probe_seconds = time.monotonic() - started
+
+    encode_started = time.monotonic()
+    last_sample = [float('-inf')]
+
+    def record(progress: ConversionProgress):
+        elapsed = time.monotonic() - encode_started
+        ffmpeg = progress.ffmpeg
+        if metrics.first_frame_seconds is None and ffmpeg.frame > 0:
+            metrics.first_frame_seconds = elapsed
+        if elapsed - last_sample[0] >= SAMPLE_INTERVAL and (ffmpeg.speed or ffmpeg.fps):
+            last_sample[0] = elapsed
+            metrics.samples.append((round(elapsed, 3), ffmpeg.speed, ffmpeg.fps, ffmpeg.frame))
+        if on_progress:
+            on_progress(progress)
+
+    result = None
+    try:
+        result = convert_fn(job, duration, record)
+        return result
+    except Exception as e:
+        metrics.error = str(e)
+        raise
+    finally:
+        now = time.monotonic()
+        metrics.encode_seconds = now - encode_started
+        metrics.wall_seconds = now - started
+        speeds = [sample[1] for sample in metrics.samples if sample[1]]
+        metrics.mean_speed = sum(speeds) / len(speeds) if speeds else 0.0
+        metrics.output_bytes = sum(_file_size(path) for path in metrics.outputs)
+        if result is not None:
+            metrics.returncode = result.returncode
+            metrics.success = not conversion_failed(result)
+            if result.usage is not None:
+                metrics.cpu_seconds = result.usage.cpu_seconds
+                metrics.peak_rss_bytes = result.usage.peak_rss_bytes
+            if not metrics.success and result.stderr.strip():
+                metrics.error = result.stderr.strip().splitlines()[-1]
+        else:
+            metrics.returncode = -1
+        for sink in sinks:
+            sink(metrics)
+        if on_metrics:
+            on_metrics(metrics)
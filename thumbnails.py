@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# 进度条的缩略图条：一次 ffmpeg 只解码关键帧，按固定间隔输出小尺寸 JPEG，按源文件指纹缓存在磁盘上
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from app_cache import cache_dir, load_json, save_json
+from ffmpeg_runner import FFmpegProgress, find_binary, popen_kwargs, run_ffmpeg
+from output_cache import fingerprint
+
+THUMBNAIL_HEIGHT = 72
+MAX_THUMBNAILS = 300
+MIN_INTERVAL = 1.0  # 短视频也不超过每秒一张
+MAX_CACHED_VIDEOS = 100  # 磁盘上保留最近使用的若干个视频的缩略图
+INDEX_VERSION = 1
+INDEX_FILE = 'index.json'
+
+
+@dataclass
+class ThumbnailStrip:
+    directory: str
+    interval: float  # 第 i 张对应 i * interval 秒
+    count: int
+
+    def path(self, index: int) -> str:
+        return os.path.join(self.directory, f'{index:05d}.jpg')
+
+    def index_at(self, seconds: float) -> int:
+        return max(0, min(self.count - 1, int(round(seconds / self.interval))))
+
+    def path_at(self, seconds: float) -> str:
+        return self.path(self.index_at(seconds))
+
+
+def thumbnail_interval(duration: float) -> float:
+    return max(MIN_INTERVAL, duration / MAX_THUMBNAILS)
+
+
+def strip_dir(video_path: str) -> str:
+    return os.path.join(cache_dir('thumbnails'), fingerprint(video_path)[:32])
+
+
+def thumbnail_command(video_path: str, interval: float, directory: str) -> List[str]:
+    """
+    解码器跳过非关键帧，fps 滤镜按 interval 取样（取样点之间没有关键帧时重复前一张），
+    eof_action=pass 保证关键帧很少的短视频也至少有一张。只用一个线程，不和播放、转换争抢 CPU。
+    """
+    return [find_binary('ffmpeg'), '-skip_frame', 'nokey', '-threads', '1', '-i', video_path,
+            '-an', '-sn', '-dn',
+            '-vf', f'fps=1/{interval:.6f}:eof_action=pass,scale=-2:{THUMBNAIL_HEIGHT}',
+            '-q:v', '5', '-start_number', '0', os.path.join(directory, '%05d.jpg')]
+
+
+def grab_frame(video_path: str, seconds: float, max_width: int = 1280) -> bytes:
+    """
+    解码 seconds 处的一帧，返回 PNG 数据，宽度不超过 max_width（等比缩小，画面比例与显示尺寸相同）。
+    用于在暂停的画面上选择裁剪区域。失败时抛出 RuntimeError。
+    """
+    command = [find_binary('ffmpeg'), '-v', 'error', '-ss', f'{max(0.0, seconds):.3f}', '-i', video_path,
+               '-an', '-sn', '-dn', '-frames:v', '1', '-vf', f"scale='min({max_width},iw)':-2",
+               '-f', 'image2pipe', '-c:v', 'png', '-']
+    try:
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, **popen_kwargs())
+    except OSError as e:
+        raise RuntimeError(f'无法读取画面: {e}')
+    if process.returncode != 0 or not process.stdout:
+        lines = process.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(f"无法读取画面: {lines[-1] if lines else process.returncode}")
+    return process.stdout
+
+
+def load_strip(video_path: str) -> Optional[ThumbnailStrip]:
+    """读取磁盘缓存，没有完整的缓存时返回 None"""
+    try:
+        directory = strip_dir(video_path)
+    except OSError:
+        return None
+    index = load_json(os.path.join(directory, INDEX_FILE))
+    if not index or index.get('version') != INDEX_VERSION or index.get('height') != THUMBNAIL_HEIGHT:
+        return None
+    strip = ThumbnailStrip(directory, index['interval'], index['count'])
+    if strip.count <= 0 or not os.path.exists(strip.path(strip.count - 1)):
+        return None
+    os.utime(directory)  # 记录最近使用，淘汰时按修改时间
+    return strip
+
+
+def _prune(keep: str) -> None:
+    root = cache_dir('thumbnails')
+    directories = [os.path.join(root, name) for name in os.listdir(root)]
+    directories = [path for path in directories if os.path.isdir(path) and path != keep]
+    directories.sort(key=os.path.getmtime, reverse=True)
+    for path in directories[MAX_CACHED_VIDEOS - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def extract_thumbnails(video_path: str, duration: float,
+                       on_progress: Optional[Callable[[FFmpegProgress], None]] = None) -> Optional[ThumbnailStrip]:
+    """
+    生成缩略图条并写入磁盘缓存，已有缓存时直接返回。失败时返回 None；
+    on_progress 抛出的异常（如取消）会结束 ffmpeg 并原样抛出，未完成的目录在下次生成时清空。
+    """
+    strip = load_strip(video_path)
+    if strip is not None:
+        return strip
+    directory = strip_dir(video_path)
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    interval = thumbnail_interval(duration)
+    result = run_ffmpeg(thumbnail_command(video_path, interval, directory), on_progress)
+    count = len([name for name in os.listdir(directory) if name.endswith('.jpg')])
+    if result.returncode != 0 or count == 0:
+        lines = result.stderr.strip().splitlines()
+        print(f"Warning: Could not extract thumbnails for {video_path}: {lines[-1] if lines else result.returncode}")
+        return None
+    save_json(os.path.join(directory, INDEX_FILE),
+              {'version': INDEX_VERSION, 'height': THUMBNAIL_HEIGHT, 'interval': interval, 'count': count})
+    try:
+        _prune(directory)
+    except OSError as e:
+        print(f"Warning: Could not prune thumbnail cache: {e}")
+    return ThumbnailStrip(directory, interval, count)
@@ -1,15 +1,199 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-                               QPushButton, QComboBox, QProgressBar, QSizePolicy, QSlider, QStyle)
-from PySide6.QtCore import Qt, Signal, QUrl, QTime
-from PySide6.QtGui import QDropEvent, QDragEnterEvent, QKeyEvent, QIcon
-from PySide6.QtMultimedia import QMediaPlayer
-from PySide6.QtMultimediaWidgets import QVideoWidget
+                               QPushButton, QComboBox, QProgressBar, QSizePolicy, QSlider, QStyle,
+                               QCheckBox, QStyleOptionSlider, QDoubleSpinBox, QTableWidget, QTableWidgetItem,
+                               QAbstractItemView, QHeaderView)
+from PySide6.QtCore import Qt, Signal, QUrl, QTime, QRect, QPoint, QSize
+from PySide6.QtGui import QDropEvent, QDragEnterEvent, QKeyEvent, QIcon, QPainter, QColor, QPixmap, QMovie
+
+
+class PixmapCache:
+    """按占用字节数限制的 QPixmap LRU，未命中时从磁盘加载"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._pixmaps = OrderedDict()
+
+    @staticmethod
+    def _size(pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def get(self, path):
+        pixmap = self._pixmaps.get(path)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(path)
+            return pixmap
+        pixmap = QPixmap(path)
+        if pixmap.isNull():
+            return None
+        self._pixmaps[path] = pixmap
+        self.bytes += self._size(pixmap)
+        while self.bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self.bytes -= self._size(evicted)
+        return pixmap
+
+    def clear(self):
+        self._pixmaps.clear()
+        self.bytes = 0
+
+
+class CropSelector(QWidget):
+    """在暂停的画面上拖出裁剪区域；crop 为源视频显示尺寸上的 (x, y, 宽, 高)，None 表示整个画面"""
+    crop_selected = Signal(object)  # 松开鼠标时的区域，由调用方校验后用 set_crop 设回
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pixmap = QPixmap()
+        self.source_size = (1, 1)
+        self.crop = None
+        self._anchor = None  # 拖动起点（源视频坐标）
+        self.setCursor(Qt.CrossCursor)
+        self.setMinimumSize(160, 90)
+
+    def set_frame(self, pixmap, source_size, crop):
+        self.pixmap = pixmap
+        self.source_size = source_size
+        self.set_crop(crop)
+
+    def set_crop(self, crop):
+        self.crop = crop
+        self.update()
+
+    def image_rect(self):
+        """画面在控件中等比缩放、居中后的区域"""
+        source_width, source_height = self.source_size
+        scale = min(self.width() / source_width, self.height() / source_height)
+        width, height = int(source_width * scale), int(source_height * scale)
+        return QRect((self.width() - width) // 2, (self.height() - height) // 2, width, height)
+
+    def to_source(self, point):
+        rect = self.image_rect()
+        source_width, source_height = self.source_size
+        x = (point.x() - rect.x()) * source_width / max(1, rect.width())
+        y = (point.y() - rect.y()) * source_height / max(1, rect.height())
+        return min(max(0, int(x)), source_width), min(max(0, int(y)), source_height)
+
+    def to_widget(self, crop):
+        rect = self.image_rect()
+        scale = rect.width() / self.source_size[0]
+        x, y, width, height = crop
+        return QRect(rect.x() + int(x * scale), rect.y() + int(y * scale), int(width * scale), int(height * scale))
+
+    def _drag_crop(self, point):
+        (x0, y0), (x1, y1) = self._anchor, self.to_source(point)
+        return min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._anchor = self.to_source(event.position().toPoint())
+            self.set_crop(None)
+
+    def mouseMoveEvent(self, event):
+        if self._anchor is not None:
+            self.set_crop(self._drag_crop(event.position().toPoint()))
+
+    def mouseReleaseEvent(self, event):
+        if self._anchor is not None and event.button() == Qt.LeftButton:
+            crop = self._drag_crop(event.position().toPoint())
+            self._anchor = None
+            self.crop_selected.emit(crop)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        rect = self.image_rect()
+        painter.fillRect(self.rect(), QColor(0, 0, 0))
+        if not self.pixmap.isNull():
+            painter.drawPixmap(rect, self.pixmap)
+        if not self.crop:
+            return
+        selection = self.to_widget(self.crop)
+        shade = QColor(0, 0, 0, 150)
+        # 选区外的部分压暗
+        painter.fillRect(QRect(rect.left(), rect.top(), rect.width(), selection.top() - rect.top()), shade)
+        painter.fillRect(QRect(rect.left(), selection.bottom() + 1, rect.width(), rect.bottom() - selection.bottom()),
+                         shade)
+        painter.fillRect(QRect(rect.left(), selection.top(), selection.left() - rect.left(), selection.height()), shade)
+        painter.fillRect(QRect(selection.right() + 1, selection.top(), rect.right() - selection.right(),
+                               selection.height()), shade)
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawRect(selection.adjusted(0, 0, -1, -1))
+        painter.drawText(selection.adjusted(4, 4, -4, -4), Qt.AlignLeft | Qt.AlignTop,
+                         f"{self.crop[2]}x{self.crop[3]}")
+
+
+class RangeSlider(QSlider):
+    """在进度条上标出截取范围的起点和终点；鼠标悬停时发出对应的位置，用于显示缩略图"""
+    hovered = Signal(int)  # 鼠标下的值（毫秒）
+    hover_left = Signal()
+
+    def __init__(self, orientation, parent=None):
+        super().__init__(orientation, parent)
+        self.range_start = None
+        self.range_end = None
+        self.setMouseTracking(True)
+
+    def set_range_markers(self, start, end):
+        self.range_start = start
+        self.range_end = end
+        self.update()
+
+    def value_to_x(self, value):
+        option = QStyleOptionSlider()
+        self.initStyleOption(option)
+        groove = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderGroove, self)
+        handle = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderHandle, self)
+        span = groove.width() - handle.width()
+        return groove.x() + handle.width() // 2 + QStyle.sliderPositionFromValue(
+            self.minimum(), self.maximum(), value, span)
+
+    def x_to_value(self, x):
+        option = QStyleOptionSlider()
+        self.initStyleOption(option)
+        groove = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderGroove, self)
+        handle = self.style().subControlRect(QStyle.CC_Slider, option, QStyle.SC_SliderHandle, self)
+        span = groove.width() - handle.width()
+        return QStyle.sliderValueFromPosition(self.minimum(), self.maximum(),
+                                              x - groove.x() - handle.width() // 2, span)
+
+    def mouseMoveEvent(self, event):
+        super().mouseMoveEvent(event)
+        # 拖动时由 sliderMoved 给出手柄的位置
+        if not self.isSliderDown() and self.maximum() > self.minimum():
+            self.hovered.emit(self.x_to_value(int(event.position().x())))
+
+    def leaveEvent(self, event):
+        super().leaveEvent(event)
+        if not self.isSliderDown():
+            self.hover_left.emit()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.maximum() <= self.minimum() or (self.range_start is None and self.range_end is None):
+            return
+        start = self.range_start if self.range_start is not None else self.minimum()
+        end = self.range_end if self.range_end is not None else self.maximum()
+        x0, x1 = self.value_to_x(start), self.value_to_x(end)
+        painter = QPainter(self)
+        painter.fillRect(QRect(x0, self.height() // 2 - 3, max(1, x1 - x0), 6), QColor(0, 120, 215, 90))
+        painter.setPen(QColor(0, 120, 215))
+        for value, x in ((self.range_start, x0), (self.range_end, x1)):
+            if value is not None:
+                painter.drawLine(x, 2, x, self.height() - 2)
+        painter.end()
 
 
 class VideoToGifConverterUI(QMainWindow):
     import_video_signal = Signal(str)
     start_conversion_signal = Signal(str, str, int, int)
+    job_selected = Signal(int)
+
+    JOB_COLUMNS = ["文件", "分辨率", "帧率", "时长", "输出设置", "状态"]
+    QUEUE_COLUMNS = ["文件", "优先级", "线程", "进度", "状态"]
+    PREVIEW_MAX_HEIGHT = 240  # 预览动图超出窗口宽度或此高度时按比例缩小显示
 
     def __init__(self):
         super().__init__()
@@ -28,13 +212,26 @@ class VideoToGifConverterUI(QMainWindow):
         self.drag_drop_label.setAcceptDrops(True)
         self.drag_drop_label.mousePressEvent = self.drag_drop_clicked
 
-        self.video_widget = QVideoWidget()
-        self.video_widget.hide()
+        # 播放器在第一次打开视频时才创建，QtMultimedia 的加载不计入启动时间
+        self.video_widget = None
+        self.media_player = None
+
+        # 进度条的缩略图：悬停或拖动时显示，拖动期间不定位播放器，松开后才定位
+        self.thumbnail_strip = None
+        self.thumbnail_pixmaps = PixmapCache()
+        self.thumbnail_popup = QWidget(self, Qt.ToolTip)
+        popup_layout = QVBoxLayout(self.thumbnail_popup)
+        popup_layout.setContentsMargins(2, 2, 2, 2)
+        popup_layout.setSpacing(0)
+        self.thumbnail_image = QLabel()
+        self.thumbnail_time = QLabel()
+        self.thumbnail_time.setAlignment(Qt.AlignCenter)
+        popup_layout.addWidget(self.thumbnail_image)
+        popup_layout.addWidget(self.thumbnail_time)
 
         self.stacked_widget = QWidget()
         self.stacked_layout = QVBoxLayout(self.stacked_widget)
         self.stacked_layout.addWidget(self.drag_drop_label)
-        self.stacked_layout.addWidget(self.video_widget)
 
         self.stacked_widget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         layout.addWidget(self.stacked_widget, 1)  # Set stretch factor to 1
@@ -44,13 +241,57 @@ class VideoToGifConverterUI(QMainWindow):
         self.play_pause_button = QPushButton()
         self.play_pause_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
         self.play_pause_button.setFixedSize(40, 40)
-        self.progress_slider = QSlider(Qt.Horizontal)
+        self.progress_slider = RangeSlider(Qt.Horizontal)
         self.time_label = QLabel("00:00 / 00:00")
         controls_layout.addWidget(self.play_pause_button)
         controls_layout.addWidget(self.progress_slider)
         controls_layout.addWidget(self.time_label)
         layout.addLayout(controls_layout)
 
+        # 预览：按当前设置编码的几秒动图，设置改变时重新生成
+        self.preview_widget = QWidget()
+        preview_layout = QVBoxLayout(self.preview_widget)
+        preview_layout.setContentsMargins(0, 0, 0, 0)
+        self.preview_label = QLabel()
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_info_label = QLabel()
+        self.preview_info_label.setAlignment(Qt.AlignCenter)
+        self.preview_info_label.setWordWrap(True)
+        preview_layout.addWidget(self.preview_label)
+        preview_layout.addWidget(self.preview_info_label)
+        self.preview_widget.hide()
+        self.preview_movie = None
+        layout.addWidget(self.preview_widget)
+
+        # 截取范围
+        range_layout = QHBoxLayout()
+        self.mark_in_button = QPushButton("设为起点 (I)")
+        self.mark_out_button = QPushButton("设为终点 (O)")
+        self.clear_range_button = QPushButton("清除范围")
+        self.range_label = QLabel("范围: 全部")
+        range_layout.addWidget(self.mark_in_button)
+        range_layout.addWidget(self.mark_out_button)
+        range_layout.addWidget(self.clear_range_button)
+        range_layout.addWidget(self.range_label, 1)
+        layout.addLayout(range_layout)
+
+        # 裁剪画面：暂停在当前画面上拖出区域，转换时先裁剪再缩放
+        crop_layout = QHBoxLayout()
+        self.crop_button = QPushButton("裁剪画面")
+        self.crop_button.setCheckable(True)
+        self.crop_button.setToolTip("在当前画面上拖出保留的区域，只处理和输出这部分像素；分辨率按裁剪后的尺寸选择")
+        self.clear_crop_button = QPushButton("清除裁剪")
+        self.crop_label = QLabel("裁剪: 全部")
+        crop_layout.addWidget(self.crop_button)
+        crop_layout.addWidget(self.clear_crop_button)
+        crop_layout.addWidget(self.crop_label, 1)
+        layout.addLayout(crop_layout)
+        self.crop_selector = CropSelector()
+        self.crop_selector.hide()
+        self.stacked_layout.addWidget(self.crop_selector)
+        self.range_start_ms = None
+        self.range_end_ms = None
+
         # Video info
         info_layout = QHBoxLayout()
         self.fps_label = QLabel("帧率: ")
@@ -62,17 +303,54 @@ class VideoToGifConverterUI(QMainWindow):
         info_widget.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Fixed)
         layout.addWidget(info_widget)
 
+        # 导入的文件列表，选中一行后下方的设置只作用于该文件
+        self.job_table = QTableWidget(0, len(self.JOB_COLUMNS))
+        self.job_table.setHorizontalHeaderLabels(self.JOB_COLUMNS)
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.job_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.verticalHeader().hide()
+        self.job_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.job_table.setMaximumHeight(140)
+        self.job_table.itemSelectionChanged.connect(self._job_selection_changed)
+        layout.addWidget(self.job_table)
+
         # Output settings
         settings_layout = QHBoxLayout()
         self.fps_combo = QComboBox()
         self.fps_combo.addItems(["10", "15", "20", "25", "30", "45", "60"])
         self.resolution_combo = QComboBox()
         self.resolution_combo.addItems(
-            ["640x360", "854x480", "960x540", "1280x720", "1920x1080", "2560x1440", "3840x2160"])
+            ["320x180", "480x270", "640x360", "854x480", "960x540", "1280x720", "1920x1080", "2560x1440", "3840x2160"])
         settings_layout.addWidget(QLabel("输出帧率:"))
         settings_layout.addWidget(self.fps_combo)
         settings_layout.addWidget(QLabel("输出分辨率:"))
         settings_layout.addWidget(self.resolution_combo)
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItem("FFmpeg 编码", "ffmpeg")
+        self.backend_combo.addItem("内置编码器", "native")
+        self.backend_combo.setToolTip("内置编码器由 NumPy 生成调色板和 LZW 数据，需要安装 numpy")
+        settings_layout.addWidget(self.backend_combo)
+        self.parallel_checkbox = QCheckBox("分段并行")
+        self.parallel_checkbox.setToolTip("长视频切段后用所有 CPU 核并行编码")
+        settings_layout.addWidget(self.parallel_checkbox)
+        self.resumable_checkbox = QCheckBox("可续转")
+        self.resumable_checkbox.setToolTip("分块编码并在输出文件旁记录进度，取消或程序退出后重新加入队列时从未完成的块继续")
+        settings_layout.addWidget(self.resumable_checkbox)
+        self.scene_palette_checkbox = QCheckBox("分场景调色板")
+        self.scene_palette_checkbox.setToolTip("检测场景切换，每个场景单独生成调色板，并按画面运动程度选择抖动方式")
+        settings_layout.addWidget(self.scene_palette_checkbox)
+        self.optimize_checkbox = QCheckBox("帧间优化")
+        self.optimize_checkbox.setToolTip("合并重复帧、只保存变化区域，屏幕录像可显著减小文件（内置编码器总是优化）")
+        settings_layout.addWidget(self.optimize_checkbox)
+        self.max_size_spin = QDoubleSpinBox()
+        self.max_size_spin.setRange(0, 1024)
+        self.max_size_spin.setDecimals(1)
+        self.max_size_spin.setSuffix(" MB")
+        self.max_size_spin.setSpecialValueText("不限大小")
+        self.max_size_spin.setToolTip("设置后先试编几段样本，在所选帧率和分辨率以内自动降低设置，使 GIF 不超过该大小")
+        settings_layout.addWidget(QLabel("大小上限:"))
+        settings_layout.addWidget(self.max_size_spin)
         settings_widget = QWidget()
         settings_widget.setLayout(settings_layout)
         layout.addWidget(settings_widget)
@@ -81,8 +359,17 @@ class VideoToGifConverterUI(QMainWindow):
         path_layout = QHBoxLayout()
         self.path_edit = QLineEdit()
         self.path_button = QPushButton("选择保存位置")
+        self.path_button.setToolTip("保存类型决定输出格式：GIF、WebP、APNG、MP4 或 WebM")
+        self.compare_button = QPushButton("格式对比")
+        self.compare_button.setToolTip("按当前帧率和分辨率把一小段样本编码为每种格式，比较编码耗时和文件大小")
         path_layout.addWidget(self.path_edit)
         path_layout.addWidget(self.path_button)
+        self.preview_button = QPushButton("预览")
+        self.preview_button.setCheckable(True)
+        self.preview_button.setToolTip("按当前设置编码播放位置附近的几秒并在窗口中显示，推算完整转换的大小和耗时；"
+                                       "按下时修改设置会重新生成")
+        path_layout.addWidget(self.compare_button)
+        path_layout.addWidget(self.preview_button)
         path_widget = QWidget()
         path_widget.setLayout(path_layout)
         layout.addWidget(path_widget)
@@ -96,10 +383,40 @@ class VideoToGifConverterUI(QMainWindow):
         self.progress_label = QLabel("就绪")
         progress_layout.addWidget(self.progress_bar)
         progress_layout.addWidget(self.progress_label)
+        self.metrics_label = QLabel("")
+        self.metrics_label.setToolTip("上次转换的性能摘要，详细记录见缓存目录下的 telemetry/jobs.jsonl")
+        progress_layout.addWidget(self.metrics_label)
         progress_widget = QWidget()
         progress_widget.setLayout(progress_layout)
         layout.addWidget(progress_widget)
 
+        # 转换队列
+        self.queue_table = QTableWidget(0, len(self.QUEUE_COLUMNS))
+        self.queue_table.setHorizontalHeaderLabels(self.QUEUE_COLUMNS)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.queue_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queue_table.verticalHeader().hide()
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.queue_table.setMaximumHeight(140)
+        layout.addWidget(self.queue_table)
+        queue_layout = QHBoxLayout()
+        self.queue_up_button = QPushButton("上移")
+        self.queue_down_button = QPushButton("下移")
+        self.priority_combo = QComboBox()
+        self.queue_cancel_button = QPushButton("取消任务")
+        self.queue_clear_button = QPushButton("清除已结束")
+        queue_layout.addWidget(self.queue_up_button)
+        queue_layout.addWidget(self.queue_down_button)
+        queue_layout.addWidget(QLabel("优先级:"))
+        queue_layout.addWidget(self.priority_combo)
+        queue_layout.addWidget(self.queue_cancel_button)
+        queue_layout.addWidget(self.queue_clear_button)
+        queue_layout.addStretch(1)
+        queue_widget = QWidget()
+        queue_widget.setLayout(queue_layout)
+        layout.addWidget(queue_widget)
+
         # 添加用于动画的计时器
         # self.animation_timer = QTimer(self)
         # self.animation_timer.timeout.connect(self.update_progress_animation)
@@ -108,25 +425,26 @@ class VideoToGifConverterUI(QMainWindow):
         # 控制按钮
         button_layout = QHBoxLayout()
         self.import_button = QPushButton("导入")
-        self.convert_button = QPushButton("开始转换")
+        self.convert_button = QPushButton("加入队列")
+        self.convert_button.setToolTip("按当前设置把选中的文件加入转换队列")
+        self.convert_all_button = QPushButton("全部加入队列")
         button_layout.addWidget(self.import_button)
         button_layout.addWidget(self.convert_button)
+        button_layout.addWidget(self.convert_all_button)
         button_widget = QWidget()
         button_widget.setLayout(button_layout)
         layout.addWidget(button_widget)
 
-        # Set up media player
-        self.media_player = QMediaPlayer()
-        self.media_player.setVideoOutput(self.video_widget)
-
         # 播放器控制
         self.play_pause_button.clicked.connect(self.toggle_play_pause)
-        self.media_player.playbackStateChanged.connect(self.update_play_pause_button)
         self.progress_slider.sliderPressed.connect(self.slider_pressed)
         self.progress_slider.sliderReleased.connect(self.slider_released)
-        self.progress_slider.sliderMoved.connect(self.set_position)
-        self.media_player.positionChanged.connect(self.position_changed)
-        self.media_player.durationChanged.connect(self.duration_changed)
+        self.progress_slider.sliderMoved.connect(self.scrub)
+        self.progress_slider.hovered.connect(self.show_thumbnail)
+        self.progress_slider.hover_left.connect(self.thumbnail_popup.hide)
+        self.mark_in_button.clicked.connect(self.mark_in)
+        self.mark_out_button.clicked.connect(self.mark_out)
+        self.clear_range_button.clicked.connect(self.clear_range)
 
         # Customize slider behavior
         self.progress_slider.setPageStep(0)
@@ -140,11 +458,80 @@ class VideoToGifConverterUI(QMainWindow):
 
     def dropEvent(self, event: QDropEvent):
         for url in event.mimeData().urls():
-            self.import_video_signal.emit(url.toLocalFile())
-            break
+            if url.isLocalFile():
+                self.import_video_signal.emit(url.toLocalFile())
+
+    def _job_row(self, item_id):
+        for row in range(self.job_table.rowCount()):
+            if self.job_table.item(row, 0).data(Qt.UserRole) == item_id:
+                return row
+        return -1
+
+    def add_job_row(self, item_id, name, status):
+        row = self.job_table.rowCount()
+        self.job_table.insertRow(row)
+        cell = QTableWidgetItem(name)
+        cell.setData(Qt.UserRole, item_id)
+        cell.setToolTip(name)
+        self.job_table.setItem(row, 0, cell)
+        for column in range(1, len(self.JOB_COLUMNS)):
+            self.job_table.setItem(row, column, QTableWidgetItem(""))
+        self.job_table.item(row, len(self.JOB_COLUMNS) - 1).setText(status)
+
+    def update_job_row(self, item_id, resolution=None, fps=None, duration=None, settings=None, status=None):
+        row = self._job_row(item_id)
+        if row < 0:
+            return
+        for column, value in enumerate((resolution, fps, duration, settings, status), start=1):
+            if value is not None:
+                self.job_table.item(row, column).setText(value)
+
+    def select_job_row(self, item_id):
+        row = self._job_row(item_id)
+        if row >= 0:
+            self.job_table.selectRow(row)
+
+    def current_job_id(self):
+        rows = self.job_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.job_table.item(rows[0].row(), 0).data(Qt.UserRole)
+
+    def _job_selection_changed(self):
+        item_id = self.current_job_id()
+        if item_id is not None:
+            self.job_selected.emit(item_id)
+
+    def show_queue(self, rows):
+        """rows 为按队列顺序的 [(entry_id, 各列文字, 提示)]，保留当前选中的任务"""
+        selected = self.current_queue_id()
+        self.queue_table.setRowCount(len(rows))
+        for row, (entry_id, cells, tooltip) in enumerate(rows):
+            for column, text in enumerate(cells):
+                cell = self.queue_table.item(row, column)
+                if cell is None:
+                    cell = QTableWidgetItem()
+                    self.queue_table.setItem(row, column, cell)
+                cell.setText(text)
+                cell.setToolTip(tooltip)
+            self.queue_table.item(row, 0).setData(Qt.UserRole, entry_id)
+        if selected is not None:
+            self.select_queue_row(selected)
+
+    def select_queue_row(self, entry_id):
+        for row in range(self.queue_table.rowCount()):
+            if self.queue_table.item(row, 0).data(Qt.UserRole) == entry_id:
+                self.queue_table.selectRow(row)
+                return
+
+    def current_queue_id(self):
+        rows = self.queue_table.selectionModel().selectedRows()
+        if not rows:
+            return None
+        return self.queue_table.item(rows[0].row(), 0).data(Qt.UserRole)
 
     def update_video_info(self, fps, resolution):
-        self.fps_label.setText(f"帧率: {fps:.2f}")
+        self.fps_label.setText(f"帧率: {fps:.2f}" if fps else "帧率: ")
         self.resolution_label.setText(f"分辨率: {resolution}")
 
     def set_default_fps(self, fps):
@@ -155,6 +542,13 @@ class VideoToGifConverterUI(QMainWindow):
             self.fps_combo.addItem(str(int(fps)))
             self.fps_combo.setCurrentIndex(self.fps_combo.count() - 1)
 
+    def set_resolution_presets(self, presets):
+        """按缩放前的画面尺寸替换分辨率选项，不发出修改信号"""
+        self.resolution_combo.blockSignals(True)
+        self.resolution_combo.clear()
+        self.resolution_combo.addItems(presets)
+        self.resolution_combo.blockSignals(False)
+
     def set_default_resolution(self, resolution):
         index = self.resolution_combo.findText(resolution)
         if index >= 0:
@@ -170,30 +564,94 @@ class VideoToGifConverterUI(QMainWindow):
             self.seek_backward()
         elif event.key() == Qt.Key_Right:
             self.seek_forward()
+        elif event.key() == Qt.Key_I:
+            self.mark_in()
+        elif event.key() == Qt.Key_O:
+            self.mark_out()
         else:
             super().keyPressEvent(event)
 
+    def ensure_player(self):
+        """创建播放器，返回是否可用；QtMultimedia 无法加载时只是没有预览，不影响转换"""
+        if self.media_player is not None:
+            return True
+        try:
+            from PySide6.QtMultimedia import QMediaPlayer
+            from PySide6.QtMultimediaWidgets import QVideoWidget
+        except ImportError as e:
+            print(f"Warning: Could not load QtMultimedia: {e}")
+            return False
+        self.video_widget = QVideoWidget()
+        self.video_widget.hide()
+        self.stacked_layout.addWidget(self.video_widget)
+        self.media_player = QMediaPlayer()
+        self.media_player.setVideoOutput(self.video_widget)
+        self.media_player.playbackStateChanged.connect(self.update_play_pause_button)
+        self.media_player.positionChanged.connect(self.position_changed)
+        self.media_player.durationChanged.connect(self.duration_changed)
+        return True
+
+    def is_playing(self):
+        return (self.media_player is not None
+                and self.media_player.playbackState() == self.media_player.PlayingState)
+
     def toggle_play_pause(self):
-        if self.media_player.playbackState() == QMediaPlayer.PlayingState:
+        if self.media_player is None:
+            return
+        if self.is_playing():
             self.media_player.pause()
         else:
             self.media_player.play()
 
-    def update_play_pause_button(self, state):
-        if state == QMediaPlayer.PlayingState:
+    def update_play_pause_button(self, _state):
+        if self.is_playing():
             self.play_pause_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPause))
         else:
             self.play_pause_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
 
     def slider_pressed(self):
-        self.media_player.pause()
+        if self.media_player is not None:
+            self.media_player.pause()
 
     def slider_released(self):
-        self.set_position(self.progress_slider.value())
-        self.media_player.play()
+        if not self.progress_slider.underMouse():
+            self.thumbnail_popup.hide()
+        if self.media_player is not None:
+            self.set_position(self.progress_slider.value())
+            self.media_player.play()
+
+    def scrub(self, position):
+        """拖动进度条：有缩略图时只显示缩略图，否则直接定位播放器"""
+        if self.show_thumbnail(position):
+            self.update_time_label(position, self.progress_slider.maximum())
+        else:
+            self.set_position(position)
+
+    def set_thumbnails(self, strip):
+        self.thumbnail_strip = strip
+        self.thumbnail_pixmaps.clear()
+        self.thumbnail_popup.hide()
+
+    def show_thumbnail(self, position):
+        """在进度条上方显示 position（毫秒）处的缩略图，没有缩略图时返回 False"""
+        if self.thumbnail_strip is None:
+            return False
+        pixmap = self.thumbnail_pixmaps.get(self.thumbnail_strip.path_at(position / 1000))
+        if pixmap is None:
+            return False
+        self.thumbnail_image.setPixmap(pixmap)
+        self.thumbnail_time.setText(QTime(0, 0).addMSecs(position).toString("mm:ss"))
+        self.thumbnail_popup.adjustSize()
+        slider = self.progress_slider
+        x = slider.value_to_x(position) - self.thumbnail_popup.width() // 2
+        x = max(0, min(x, slider.width() - self.thumbnail_popup.width()))
+        self.thumbnail_popup.move(slider.mapToGlobal(QPoint(x, -self.thumbnail_popup.height() - 4)))
+        self.thumbnail_popup.show()
+        return True
 
     def set_position(self, position):
-        self.media_player.setPosition(position)
+        if self.media_player is not None:
+            self.media_player.setPosition(position)
 
     def position_changed(self, position):
         if not self.progress_slider.isSliderDown():
@@ -211,22 +669,134 @@ class VideoToGifConverterUI(QMainWindow):
         self.time_label.setText(f"{position_time.toString(time_format)} / {duration_time.toString(time_format)}")
 
     def seek_backward(self):
+        if self.media_player is None:
+            return
         current_position = self.media_player.position()
         new_position = max(0, current_position - 500)
         self.media_player.setPosition(new_position)
 
     def seek_forward(self):
+        if self.media_player is None:
+            return
         current_position = self.media_player.position()
         duration = self.media_player.duration()
         new_position = min(duration, current_position + 500)
         self.media_player.setPosition(new_position)
 
+    def mark_in(self):
+        if self.media_player is None:
+            return
+        self.range_start_ms = self.media_player.position()
+        if self.range_end_ms is not None and self.range_end_ms <= self.range_start_ms:
+            self.range_end_ms = None
+        self.update_range_display()
+
+    def mark_out(self):
+        if self.media_player is None:
+            return
+        self.range_end_ms = self.media_player.position()
+        if self.range_start_ms is not None and self.range_start_ms >= self.range_end_ms:
+            self.range_start_ms = None
+        self.update_range_display()
+
+    def clear_range(self):
+        self.range_start_ms = None
+        self.range_end_ms = None
+        self.update_range_display()
+
+    def update_range_display(self):
+        self.progress_slider.set_range_markers(self.range_start_ms, self.range_end_ms)
+        if self.range_start_ms is None and self.range_end_ms is None:
+            self.range_label.setText("范围: 全部")
+            return
+        time_format = "mm:ss.zzz"
+        start = QTime(0, 0).addMSecs(self.range_start_ms or 0).toString(time_format)
+        if self.range_end_ms is not None:
+            end_ms = self.range_end_ms
+        else:
+            end_ms = self.media_player.duration() if self.media_player is not None else 0
+        end = QTime(0, 0).addMSecs(end_ms).toString(time_format)
+        self.range_label.setText(f"范围: {start} - {end}")
+
+    def set_range(self, start_ms, end_ms):
+        self.range_start_ms = start_ms
+        self.range_end_ms = end_ms
+        self.update_range_display()
+
+    def get_range(self):
+        """返回截取范围 (起点秒, 终点秒)，未设置的一端为 None"""
+        start = self.range_start_ms / 1000 if self.range_start_ms is not None else None
+        end = self.range_end_ms / 1000 if self.range_end_ms is not None else None
+        return start, end
+
     def load_video(self, file_path):
+        self.clear_range()
+        self.set_thumbnails(None)
+        if not self.ensure_player():
+            return
         self.media_player.setSource(QUrl.fromLocalFile(file_path))
         self.play_pause_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
         self.drag_drop_label.hide()
         self.video_widget.show()
 
+    def show_crop_selector(self, png_data, source_size, crop):
+        """用 png_data 的画面替换播放器，在上面选择裁剪区域"""
+        pixmap = QPixmap()
+        pixmap.loadFromData(png_data, "PNG")
+        self.crop_selector.set_frame(pixmap, source_size, crop)
+        self.drag_drop_label.hide()
+        if self.video_widget is not None:
+            self.video_widget.hide()
+        self.crop_selector.show()
+
+    def hide_crop_selector(self):
+        self.crop_selector.hide()
+        if self.video_widget is not None:
+            self.video_widget.show()
+        else:
+            self.drag_drop_label.show()
+
+    def update_crop_display(self, crop):
+        self.crop_selector.set_crop(crop)
+        if crop is None:
+            self.crop_label.setText("裁剪: 全部")
+        else:
+            x, y, width, height = crop
+            self.crop_label.setText(f"裁剪: {width}x{height}，位置 ({x}, {y})")
+
+    def show_preview_message(self, text):
+        """预览进行中或失败时只显示文字，保留上一次的动图"""
+        self.preview_info_label.setText(text)
+        self.preview_widget.show()
+
+    def show_preview(self, path, text):
+        """显示预览文件；QMovie 不能播放的格式（APNG、MP4、WebM）只显示文字"""
+        self.clear_preview_movie()
+        movie = QMovie(path)
+        if movie.isValid():
+            movie.jumpToFrame(0)
+            size = movie.frameRect().size()
+            limit = QSize(self.stacked_widget.width(), self.PREVIEW_MAX_HEIGHT)
+            if size.width() > limit.width() or size.height() > limit.height():
+                movie.setScaledSize(size.scaled(limit, Qt.KeepAspectRatio))
+            self.preview_movie = movie
+            self.preview_label.setMovie(movie)
+            movie.start()
+        else:
+            text += "（此格式无法在窗口中播放）"
+        self.show_preview_message(text)
+
+    def clear_preview_movie(self):
+        if self.preview_movie is not None:
+            self.preview_movie.stop()
+            self.preview_label.clear()
+            self.preview_movie = None
+
+    def hide_preview(self):
+        self.clear_preview_movie()
+        self.preview_info_label.clear()
+        self.preview_widget.hide()
+
     def stop_progress_animation(self):
         self.progress_bar.setValue(100)
         self.progress_label.setText("转换完成")
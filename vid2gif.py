@@ -1,215 +1,717 @@
 # -*- coding: utf-8 -*-
+import time
+
+STARTED = time.perf_counter()  # 启动计时的起点，在其他导入之前
+
+import json
 import sys
 import os
-import re
-import time
-import subprocess
+from functools import partial
 
+from PySide6.QtCore import QEvent, QObject, QThread, QTimer, Signal
 from PySide6.QtWidgets import QApplication, QFileDialog, QMessageBox
-from PySide6.QtCore import QThread, Signal
 
 from ui import VideoToGifConverterUI
-from get_video_info import get_video_info
+from app_cache import cache_dir
+from job_list import (DEFAULT_PRESET_SOURCE, FileItem, ProbeService, STATUS_FAILED, STATUS_READY, default_output_path,
+                      format_duration, resolution_presets, scaled_resolution)
+from conversion_queue import (ConversionQueue, PRIORITY_NAMES, PRIORITY_NORMAL, QueueEntry, STATE_CANCELLED,
+                              STATE_DONE, STATE_FAILED, STATE_QUEUED, STATE_RUNNING)
+from converter import (OUTPUT_FORMATS, CancelToken, ConversionCancelled, ConversionJob, convert, normalize_crop,
+                       output_format)
+from ffmpeg_check import ffmpeg_capabilities
+from source_settings import load_source_settings, save_source_settings
+from resumable import resumable_convert
+from scene_palette import scene_convert
+from segmented import parallel_convert
+from size_target import target_size_convert
+
+IMPORTED = time.perf_counter()
+
+
+class FFmpegCheckThread(QThread):
+    """在后台查找 ffmpeg 并检查版本和滤镜，结果有磁盘缓存，通常很快返回"""
+    checked = Signal(object)  # FFmpegCapabilities
+
+    def run(self):
+        self.checked.emit(ffmpeg_capabilities())
+
+
+class FormatCompareThread(QThread):
+    """在后台把样本编码为每种输出格式"""
+    progress = Signal(float)
+    compared = Signal(object, str)  # FormatSample 列表（失败时为 None），错误信息
+
+    def __init__(self, input_video, fps, width, start, end, duration, crop=None):
+        super().__init__()
+        self.args = (input_video, fps, width, start, end, duration)
+        self.crop = crop
+
+    def run(self):
+        from format_compare import compare_formats
+        try:
+            samples = compare_formats(*self.args, crop=self.crop, on_progress=self.progress.emit)
+        except (OSError, ValueError, RuntimeError) as e:
+            self.compared.emit(None, str(e))
+            return
+        self.compared.emit(samples, '')
+
+
+class ThumbnailThread(QThread):
+    """在后台生成进度条的缩略图条，切换文件时取消"""
+    extracted = Signal(str, object)  # 源文件，ThumbnailStrip（失败时为 None）
+
+    def __init__(self, input_video, duration):
+        super().__init__()
+        self.input_video = input_video
+        self.duration = duration
+        self.cancel_token = CancelToken()
 
+    def run(self):
+        from thumbnails import extract_thumbnails
+        try:
+            strip = extract_thumbnails(self.input_video, self.duration,
+                                       lambda _progress: self.cancel_token.check())
+        except ConversionCancelled:
+            return
+        except OSError as e:
+            print(f"Warning: Could not extract thumbnails: {e}")
+            strip = None
+        self.extracted.emit(self.input_video, strip)
 
-class ConversionThread(QThread):
-    progress_update = Signal(int)
-    error = Signal(str)
-    success = Signal()
 
-    def __init__(self, input_video, output_path, fps, width, total_frames):
+class FrameGrabThread(QThread):
+    """在后台解码一帧供选择裁剪区域，大文件或网络盘上的定位和解码不阻塞界面"""
+    grabbed = Signal(object, str)  # PNG 数据（失败时为 None），错误信息
+
+    def __init__(self, input_video, position):
         super().__init__()
         self.input_video = input_video
-        self.output_path = output_path
-        self.fps = fps
-        self.width = width
-        self.total_frames = total_frames
+        self.position = position
+        self.cancel_token = CancelToken()  # 单帧无法中途结束，取消后只是丢弃结果
 
     def run(self):
+        from thumbnails import grab_frame
         try:
-            ffmpeg_path = 'ffmpeg.exe'
-            command = [
-                ffmpeg_path,
-                '-i', self.input_video,
-                '-vf',
-                f'fps={self.fps},scale={self.width}:-1:flags=lanczos,split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse',
-                '-y',
-                self.output_path
-            ]
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            process = subprocess.Popen(command, startupinfo=startupinfo,
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                       text=True, encoding='utf-8', errors='replace',
-                                       creationflags=subprocess.CREATE_NO_WINDOW)
-
-            # 初始进度阶段（0-33%）
-            for i in range(34):
-                time.sleep(0.67)  # 模拟初始化过程
-                self.progress_update.emit(i)
-
-            last_update_time = time.time()
-            for line in process.stderr:
-                frame_match = re.search(r'frame=\s*(\d+)', line)
-                if frame_match:
-                    current_frame = int(frame_match.group(1))
-                    progress = 33 + int((current_frame / self.total_frames) * 67)
-                    self.progress_update.emit(min(progress, 99))  # 进度不得超过99%
-                    # DEBUG 显示当前已转换的帧
-                    print(current_frame, self.total_frames)
-
-                # 检查进程是否仍在运行
-                if process.poll() is not None:
-                    break
-
-                # 限制进度更新频率
-                current_time = time.time()
-                if current_time - last_update_time > 0.1:  # 每0.1秒最多更新一次
-                    last_update_time = current_time
-
-            # 等待进程完成
-            process.wait()
-
-            if process.returncode != 0:
-                error_output = process.stderr.read()
-                if "Output file is empty" not in error_output:  # 忽略这个特定的错误
-                    self.error.emit(f"FFmpeg error: {error_output}")
-                else:
-                    self.success.emit()
-            else:
-                self.success.emit()
-
-            # 确保进度到达100%
-            self.progress_update.emit(100)
-
-        except Exception as e:
-            self.error.emit(f"Error: {str(e)}")
+            frame = grab_frame(self.input_video, self.position)
+        except RuntimeError as e:
+            self.grabbed.emit(None, str(e))
+            return
+        if not self.cancel_token.cancelled:
+            self.grabbed.emit(frame, '')
+
+
+class PreviewThread(QThread):
+    """在后台编码预览片段，设置改变或关闭预览时取消"""
+    progress = Signal(float)
+    rendered = Signal(object, str)  # PreviewResult（失败时为 None），错误信息
+
+    def __init__(self, job, duration, position, output_path, convert_fn, optimize):
+        super().__init__()
+        self.args = (job, duration, position, output_path, convert_fn, optimize)
+        self.cancel_token = CancelToken()
+
+    def run(self):
+        from preview import render_preview
+        try:
+            result = render_preview(*self.args, on_progress=lambda p: self.progress.emit(p.fraction),
+                                    cancel=self.cancel_token)
+        except ConversionCancelled:
+            return
+        except (OSError, ValueError, RuntimeError) as e:
+            self.rendered.emit(None, str(e))
+            return
+        self.rendered.emit(result, '')
+
+
+class StartupTiming(QObject):
+    """
+    --startup-timing：以 JSON 打印启动各阶段距进程开始执行本文件的毫秒数后退出。
+    import_ms 为导入完成，window_shown_ms 为主窗口第一次绘制，interactive_ms 为第一次绘制后事件循环空闲。
+    """
+
+    def __init__(self, window):
+        super().__init__()
+        self.marks = {'import_ms': self.elapsed_ms(IMPORTED)}
+        window.installEventFilter(self)
+
+    @staticmethod
+    def elapsed_ms(now=None):
+        return round(((now or time.perf_counter()) - STARTED) * 1000, 1)
+
+    def mark(self, name):
+        self.marks.setdefault(name, self.elapsed_ms())
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and 'window_shown_ms' not in self.marks:
+            self.mark('window_shown_ms')
+            # 零延时的定时器在已排队的事件（包括首帧的其余绘制）处理完后才触发
+            QTimer.singleShot(0, self.interactive)
+        return False
+
+    def interactive(self):
+        self.mark('interactive_ms')
+        print(json.dumps(self.marks))
+        QApplication.quit()
 
 
 class VideoToGifConverter:
     def __init__(self):
         self.ui = VideoToGifConverterUI()
-        self.input_video = None
-        self.output_file = None
-        self.conversion_thread = None
+        self.items = {}  # item_id -> FileItem，按导入顺序
+        self.current_id = None
+        self._loading_item = False  # 切换文件时填入设置，不算用户修改
+
+        # 转换队列：窗口在转换时保持可用，同时运行的任务数和线程数由 CPU 预算决定
+        self.queue = ConversionQueue()
+        self.queue.entry_changed.connect(self.refresh_queue)
+        self.queue.entry_finished.connect(self.queue_entry_finished)
+        for priority, name in PRIORITY_NAMES.items():
+            self.ui.priority_combo.addItem(name, priority)
+        self.ui.priority_combo.setCurrentIndex(self.ui.priority_combo.findData(PRIORITY_NORMAL))
+
+        # 视频信息在线程池中探测，结果排队回到主线程，界面不会因 ffprobe 卡住
+        self.probe_service = ProbeService()
+        self.probe_service.probed.connect(self.on_probed)
+
+        # ffmpeg 的检查在窗口显示后于后台进行，不推迟启动
+        self.ffmpeg_check = FFmpegCheckThread()
+        self.ffmpeg_check.checked.connect(self.ffmpeg_checked)
 
         # Connect signals
         self.ui.import_button.clicked.connect(self.import_video)
         self.ui.convert_button.clicked.connect(self.start_conversion)
+        self.ui.convert_all_button.clicked.connect(self.enqueue_all)
+        self.ui.queue_up_button.clicked.connect(partial(self.move_queue_entry, -1))
+        self.ui.queue_down_button.clicked.connect(partial(self.move_queue_entry, 1))
+        self.ui.queue_cancel_button.clicked.connect(self.cancel_queue_entry)
+        self.ui.queue_clear_button.clicked.connect(self.clear_finished_entries)
+        self.ui.priority_combo.currentIndexChanged.connect(self.change_priority)
+        self.ui.queue_table.itemSelectionChanged.connect(self.queue_selection_changed)
         self.ui.path_button.clicked.connect(self.choose_output_file)
+        self.ui.compare_button.clicked.connect(self.compare_formats)
+        self.format_compare = None
+        self.thumbnail_thread = None
+        self.preview_thread = None
+        self.frame_grab_thread = None
+        self.preview_path = None  # 正在显示的预览文件，换成新的预览后删除
+        self.preview_count = 0
+        self.stale_threads = set()  # 已取消、尚未退出的线程，退出前保留引用
+        # 设置连续改变时只在停下后重新生成预览
+        self.preview_timer = QTimer()
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(400)
+        self.preview_timer.timeout.connect(self.start_preview)
+        self.ui.preview_button.toggled.connect(self.preview_toggled)
+        for signal in (self.ui.fps_combo.currentTextChanged, self.ui.resolution_combo.currentTextChanged,
+                       self.ui.backend_combo.currentIndexChanged, self.ui.scene_palette_checkbox.toggled,
+                       self.ui.optimize_checkbox.toggled, self.ui.path_edit.textChanged):
+            signal.connect(self.schedule_preview)
         self.ui.import_video_signal.connect(self.handle_dropped_video)
         self.ui.start_conversion_signal.connect(self.start_conversion)
+        self.ui.job_selected.connect(self.select_item)
+        self.ui.fps_combo.currentTextChanged.connect(self.settings_changed)
+        self.ui.resolution_combo.currentTextChanged.connect(self.settings_changed)
+        self.ui.path_edit.textEdited.connect(self.output_path_edited)
+        self.ui.crop_button.toggled.connect(self.crop_mode_toggled)
+        self.ui.crop_selector.crop_selected.connect(self.crop_selected)
+        self.ui.clear_crop_button.clicked.connect(self.clear_crop)
+
+    @property
+    def current_item(self):
+        return self.items.get(self.current_id)
 
     def import_video(self):
         file_dialog = QFileDialog()
-        self.input_video, _ = file_dialog.getOpenFileName(self.ui, "选择视频文件", "",
-                                                          "Video Files (*.mp4 *.avi *.mov)")
-        if self.input_video:
-            self.update_video_info()
-            self.suggest_output_file()
-            self.ui.load_video(self.input_video)
+        paths, _ = file_dialog.getOpenFileNames(self.ui, "选择视频文件", "",
+                                                "Video Files (*.mp4 *.avi *.mov)")
+        self.add_files(paths)
 
     def handle_dropped_video(self, file_path):
-        self.input_video = file_path
-        self.update_video_info()
-        self.suggest_output_file()
-        self.ui.load_video(self.input_video)
-
-    def update_video_info(self):
-        if self.input_video:
-            video_info = get_video_info(self.input_video)
-            fps = video_info['frame_rate']
-            width = video_info['width']
-            height = video_info['height']
+        self.add_files([file_path])
+
+    def add_files(self, paths):
+        """加入文件列表并提交探测，不等待结果；列表为空时选中第一个新文件"""
+        known = {item.input_video for item in self.items.values()}
+        for path in paths:
+            if not path or path in known:
+                continue
+            known.add(path)
+            item = FileItem(path, default_output_path(path), int(self.ui.fps_combo.currentText()),
+                            self.ui.resolution_combo.currentText())
+            self.items[item.item_id] = item
+            self.ui.add_job_row(item.item_id, item.name, item.status)
+            self.ui.update_job_row(item.item_id, settings=item.settings_text)
+            self.probe_service.submit(item.item_id, path)
+            if self.current_id is None:
+                self.ui.select_job_row(item.item_id)
+
+    def on_probed(self, item_id, info):
+        item = self.items.get(item_id)
+        if item is None:
+            return
+        item.info = info
+        if info is None:
+            item.status = STATUS_FAILED
+            self.ui.update_job_row(item_id, status=item.status)
+            return
+        item.status = STATUS_READY
+        width, height = info.display_size
+        fps = float(info.frame_rate)
+        # 用户已经改过这个文件的设置时保留用户的选择，否则恢复上次为这个文件保存的设置
+        saved = load_source_settings(item.input_video) if not item.settings_edited else None
+        if saved:
+            item.apply_settings(saved)
+        if not item.settings_edited:
+            if fps > 0:
+                item.fps = int(fps)
+            item.resolution = f"{width}x{height}"
+        self.ui.update_job_row(item_id, resolution=f"{width}x{height}", fps=f"{fps:.2f}",
+                               duration=format_duration(info.duration), settings=item.settings_text,
+                               status=item.status)
+        if item_id == self.current_id:
             self.ui.update_video_info(fps, f"{width}x{height}")
-            self.ui.set_default_fps(fps)
-            self.ui.set_default_resolution(f"{width}x{height}")
+            self.load_item_settings(item)
+            self.ui.set_range(item.range_start_ms, item.range_end_ms)
+            self.load_thumbnails(item)
+            self.schedule_preview()
 
-    def suggest_output_file(self):
-        if self.input_video:
-            input_dir = os.path.dirname(self.input_video)
-            input_name = os.path.splitext(os.path.basename(self.input_video))[0]
-            suggested_output = os.path.join(input_dir, f"{input_name}.gif")
-            self.ui.update_path_edit(suggested_output)
-            self.output_file = suggested_output
+    def select_item(self, item_id):
+        if item_id == self.current_id or item_id not in self.items:
+            return
+        self.ui.crop_button.setChecked(False)
+        self.save_current_item()
+        self.current_id = item_id
+        item = self.items[item_id]
+        self.load_item_settings(item)
+        self.ui.load_video(item.input_video)
+        self.ui.set_range(item.range_start_ms, item.range_end_ms)
+        self.load_thumbnails(item)
+        self.schedule_preview()
+        if item.info is not None:
+            width, height = item.info.display_size
+            self.ui.update_video_info(float(item.info.frame_rate), f"{width}x{height}")
+        else:
+            self.ui.update_video_info(0, item.status)
+
+    def load_thumbnails(self, item):
+        """为当前文件生成缩略图条，取消之前文件未完成的生成；需要视频时长，探测完成前不开始"""
+        self.cancel_thread(self.thumbnail_thread)
+        self.thumbnail_thread = None
+        if item.info is None or item.info.duration <= 0:
+            return
+        self.thumbnail_thread = ThumbnailThread(item.input_video, item.info.duration)
+        self.thumbnail_thread.extracted.connect(self.thumbnails_extracted)
+        self.thumbnail_thread.start()
+
+    def cancel_thread(self, thread):
+        """取消带 cancel_token 的后台线程，线程退出前保留引用"""
+        if thread is None or thread.isFinished():
+            return
+        thread.cancel_token.cancel()
+        self.stale_threads.add(thread)
+        thread.finished.connect(lambda: self.stale_threads.discard(thread))
+
+    def shutdown_threads(self):
+        self.cancel_thread(self.thumbnail_thread)
+        self.cancel_thread(self.preview_thread)
+        self.cancel_thread(self.frame_grab_thread)
+        for thread in list(self.stale_threads):
+            thread.wait()
+        self.remove_preview_file()
+
+    def thumbnails_extracted(self, input_video, strip):
+        item = self.current_item
+        if strip is not None and item is not None and item.input_video == input_video:
+            self.ui.set_thumbnails(strip)
+
+    def preview_toggled(self, checked):
+        if checked:
+            self.start_preview()
+            return
+        self.preview_timer.stop()
+        self.cancel_thread(self.preview_thread)
+        self.preview_thread = None
+        self.ui.hide_preview()
+        self.remove_preview_file()
+
+    def schedule_preview(self, _value=None):
+        if self.ui.preview_button.isChecked() and not self._loading_item:
+            self.preview_timer.start()
+
+    def start_preview(self):
+        """按当前设置重新生成预览，取消未完成的上一次"""
+        self.preview_timer.stop()
+        self.cancel_thread(self.preview_thread)
+        self.preview_thread = None
+        item = self.current_item
+        self.save_current_item()
+        if item is None or item.info is None:
+            self.ui.show_preview_message("请先导入视频并等待读取视频信息")
+            return
+        try:
+            job, convert_fn, optimize = self.conversion_plan(item, preview=True)
+        except ValueError as e:
+            self.ui.show_preview_message(str(e))
+            return
+        player = self.ui.media_player
+        position = player.position() / 1000 if player is not None else 0.0
+        self.preview_count += 1
+        output_path = os.path.join(cache_dir('preview'),
+                                   f'preview_{os.getpid()}_{self.preview_count}{output_format(job.output_path).extension}')
+        thread = PreviewThread(job, item.info.duration, position, output_path, convert_fn, optimize)
+        thread.progress.connect(lambda fraction: self.ui.show_preview_message(f"正在生成预览 {fraction:.0%}"))
+        thread.rendered.connect(partial(self.preview_rendered, thread))
+        self.preview_thread = thread
+        self.ui.show_preview_message("正在生成预览")
+        thread.start()
+
+    def preview_rendered(self, thread, result, error):
+        if thread is not self.preview_thread or not self.ui.preview_button.isChecked():
+            if result is not None:
+                self.remove_preview_file(result.output_path)
+            return
+        if result is None:
+            self.ui.show_preview_message(f"预览失败：{error}")
+            return
+        self.ui.show_preview(result.output_path,
+                             f"预览 {result.clip_seconds:.1f} 秒：{result.bytes / 1024:.1f} KB，编码 {result.seconds:.1f} 秒；"
+                             f"完整转换约 {result.estimated_bytes / 1024 / 1024:.1f} MB，"
+                             f"约 {result.estimated_seconds:.0f} 秒")
+        self.remove_preview_file()
+        self.preview_path = result.output_path
+
+    def remove_preview_file(self, path=None):
+        """删除 path，默认为正在显示的预览文件"""
+        if path is None:
+            path, self.preview_path = self.preview_path, None
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Warning: Could not remove preview {path}: {e}")
+
+    def save_current_item(self):
+        """把界面上的截取范围和输出路径存回当前文件，帧率和分辨率在修改时已保存"""
+        item = self.current_item
+        if item is None:
+            return
+        item.range_start_ms = self.ui.range_start_ms
+        item.range_end_ms = self.ui.range_end_ms
+        item.output_path = self.ui.get_output_path()
+        self.save_settings(item)
+
+    def save_settings(self, item):
+        # 探测完成前不保存，以免覆盖探测后才恢复的设置
+        if item.info is not None:
+            save_source_settings(item.input_video, item.saved_settings())
+
+    def load_item_settings(self, item):
+        self._loading_item = True
+        try:
+            self.ui.set_resolution_presets(resolution_presets(item.source_size or DEFAULT_PRESET_SOURCE))
+            self.ui.update_crop_display(item.crop)
+            self.ui.set_default_fps(item.fps)
+            self.ui.set_default_resolution(item.resolution)
+            self.ui.update_path_edit(item.output_path)
+        finally:
+            self._loading_item = False
+
+    def settings_changed(self, _text=None):
+        item = self.current_item
+        if item is None or self._loading_item:
+            return
+        item.fps = int(self.ui.fps_combo.currentText())
+        item.resolution = self.ui.resolution_combo.currentText()
+        item.settings_edited = True
+        self.ui.update_job_row(item.item_id, settings=item.settings_text)
+        self.save_settings(item)
+
+    def crop_mode_toggled(self, checked):
+        """按下时暂停播放，在后台读取当前画面后在上面选择裁剪区域；松开按钮回到播放器"""
+        self.cancel_thread(self.frame_grab_thread)
+        self.frame_grab_thread = None
+        if not checked:
+            self.ui.hide_crop_selector()
+            self.ui.update_crop_display(self.current_item.crop if self.current_item else None)
+            return
+        item = self.current_item
+        if item is None or item.info is None:
+            self.show_error_message("请先导入视频并等待读取视频信息")
+            self.ui.crop_button.setChecked(False)
+            return
+        player = self.ui.media_player
+        position = 0.0
+        if player is not None:
+            player.pause()
+            position = player.position() / 1000
+        thread = FrameGrabThread(item.input_video, position)
+        thread.grabbed.connect(partial(self.frame_grabbed, thread))
+        self.frame_grab_thread = thread
+        self.ui.crop_label.setText("正在读取画面…")
+        thread.start()
+
+    def frame_grabbed(self, thread, frame, error):
+        item = self.current_item
+        # 读取期间松开了按钮或切换了文件
+        if thread is not self.frame_grab_thread or item is None or item.input_video != thread.input_video:
+            return
+        self.frame_grab_thread = None
+        if frame is None:
+            self.show_error_message(error)
+            self.ui.crop_button.setChecked(False)
+            return
+        self.ui.update_crop_display(item.crop)
+        self.ui.show_crop_selector(frame, item.info.display_size, item.crop)
+
+    def crop_selected(self, crop):
+        item = self.current_item
+        if item is not None and item.info is not None:
+            self.set_crop(item, normalize_crop(crop, item.info.display_size))
+
+    def clear_crop(self):
+        item = self.current_item
+        if item is not None and item.info is not None:
+            self.set_crop(item, None)
+
+    def set_crop(self, item, crop):
+        """
+        修改裁剪区域，分辨率预设随之按裁剪后的尺寸计算：原来选的是原尺寸或比新画面宽时取新画面的原尺寸，
+        否则保留宽度、按新的比例计算高度
+        """
+        previous_width = item.source_size[0]
+        item.crop = crop
+        size = item.source_size
+        width = item.width
+        if width >= previous_width or width > size[0]:
+            width = size[0]
+        item.resolution = scaled_resolution(width, size)
+        item.settings_edited = True
+        self.load_item_settings(item)
+        self.ui.update_job_row(item.item_id, settings=item.settings_text)
+        self.save_settings(item)
+        self.schedule_preview()
+
+    def output_path_edited(self, path):
+        item = self.current_item
+        if item is not None:
+            item.output_path = path.strip()
 
     def choose_output_file(self):
+        item = self.current_item
         file_dialog = QFileDialog()
-        self.output_file, _ = file_dialog.getSaveFileName(self.ui, "保存 GIF", self.output_file or "",
-                                                          "GIF Files (*.gif);;All Files (*)")
-        if self.output_file:
-            self.ui.update_path_edit(self.output_file)
+        filters = [f"{fmt.label} (*{fmt.extension})" for fmt in OUTPUT_FORMATS.values()]
+        current = output_format(item.output_path if item else "")
+        output_file, selected = file_dialog.getSaveFileName(self.ui, "保存动图", item.output_path if item else "",
+                                                            ";;".join(filters),
+                                                            f"{current.label} (*{current.extension})")
+        if output_file:
+            # 没有写扩展名时按所选类型补上
+            extension = os.path.splitext(output_file)[1].lower()
+            if extension not in [fmt.extension for fmt in OUTPUT_FORMATS.values()]:
+                for fmt in OUTPUT_FORMATS.values():
+                    if selected.endswith(f"(*{fmt.extension})"):
+                        output_file += fmt.extension
+                        break
+            self.ui.update_path_edit(output_file)
+            if item is not None:
+                item.output_path = output_file
+
+    def compare_formats(self):
+        item = self.current_item
+        self.save_current_item()
+        if item is None or item.info is None:
+            self.show_error_message("请先导入视频并等待读取视频信息")
+            return
+        if self.format_compare is not None and self.format_compare.isRunning():
+            return
+        start, end = item.clip_range()
+        self.format_compare = FormatCompareThread(item.input_video, item.fps, item.width, start, end,
+                                                  item.info.duration, item.crop)
+        self.format_compare.progress.connect(
+            lambda fraction: self.ui.compare_button.setText(f"格式对比 {fraction:.0%}"))
+        self.format_compare.compared.connect(self.formats_compared)
+        self.ui.compare_button.setEnabled(False)
+        self.format_compare.start()
+
+    def formats_compared(self, samples, error):
+        self.ui.compare_button.setEnabled(True)
+        self.ui.compare_button.setText("格式对比")
+        if samples is None:
+            self.show_error_message(f"格式对比失败：{error}")
+            return
+        gif_bytes = next((s.bytes for s in samples if s.format == 'gif' and not s.error), 0)
+        rows = []
+        for sample in sorted(samples, key=lambda s: (bool(s.error), s.bytes)):
+            if sample.error:
+                rows.append(f"<tr><td>{sample.label}</td><td colspan=3>失败</td></tr>")
+                continue
+            ratio = f"{sample.bytes / gif_bytes:.0%}" if gif_bytes else "-"
+            rows.append(f"<tr><td>{sample.label}</td><td align=right>{sample.seconds:.2f} s</td>"
+                        f"<td align=right>{sample.bytes / 1024:.1f} KB</td><td align=right>{ratio}</td></tr>")
+        header = "<tr><th>格式</th><th>编码耗时</th><th>大小</th><th>相对 GIF</th></tr>"
+        QMessageBox.information(self.ui, "格式对比", f"<table cellspacing=6>{header}{''.join(rows)}</table>")
 
     def start_conversion(self):
-        if not self.input_video or not self.output_file:
+        item = self.current_item
+        self.save_current_item()
+        if item is None or not item.output_path:
             self.show_error_message("请选择输入视频和输出文件")
             return
-
-        fps = int(self.ui.fps_combo.currentText())
-        width = int(self.ui.resolution_combo.currentText().split('x')[0])
-
-        video_info = get_video_info(self.input_video)
-        if not video_info or 'total_frames' not in video_info:
+        if item.probing:
+            self.show_error_message("正在读取视频信息，请稍候")
+            return
+        if item.info is None:
             self.show_error_message("无法获取视频信息")
             return
-
-        total_frames = video_info['total_frames']
-
-        self.conversion_thread = ConversionThread(self.input_video, self.output_file, fps, width, total_frames)
-        self.conversion_thread.progress_update.connect(self.update_progress)
-        self.conversion_thread.success.connect(self.conversion_successful)
-        self.conversion_thread.finished.connect(self.conversion_finished)
-        self.conversion_thread.error.connect(self.show_error_message)
-        self.conversion_thread.start()
-
-        self.disable_ui_elements()
-        self.ui.progress_bar.setValue(0)
-        self.ui.progress_label.setText("转换中... 0%")
-
-    def update_progress(self, value):
-        self.ui.progress_bar.setValue(value)
-        self.ui.progress_label.setText(f"转换中... {value}%")
+        self.enqueue(item)
+
+    def enqueue_all(self):
+        """把所有已读取信息的文件按各自的设置加入队列，跳过已在队列中等待或运行的文件"""
+        self.save_current_item()
+        pending = {entry.job.input_video for entry in self.queue.entries if not entry.finished}
+        for item in self.items.values():
+            if item.info is not None and item.output_path and item.input_video not in pending:
+                self.enqueue(item)
+
+    def conversion_plan(self, item, preview=False):
+        """
+        按界面上的设置返回 (job, convert_fn, optimize)，不包括大小上限。设置不适用于输出格式时抛出 ValueError。
+        preview 为 True 时分段并行和可续转换成普通转换：二者只改变编码方式，画面相同，短片段上只有额外开销。
+        """
+        # 导入时已在后台探测过，这里不再启动 ffprobe
+        start, end = item.clip_range()
+        job = ConversionJob(item.input_video, item.output_path, item.fps, item.width, start=start, end=end,
+                            crop=item.crop)
+        native = self.ui.backend_combo.currentData() == 'native'
+        if native:
+            from native_gif import native_convert  # 依赖 NumPy，选用时才导入
+            convert_fn = native_convert
+        elif self.ui.scene_palette_checkbox.isChecked():
+            convert_fn = scene_convert
+        elif self.ui.resumable_checkbox.isChecked() and not preview:
+            convert_fn = resumable_convert
+        elif self.ui.parallel_checkbox.isChecked() and not preview:
+            convert_fn = parallel_convert
+        else:
+            convert_fn = convert
+        if convert_fn is not convert and output_format(job.output_path).name != 'gif':
+            raise ValueError("内置编码器、分场景调色板、可续转和分段并行只支持 GIF 输出")
+        # 内置编码器在编码时已经做了帧间优化
+        return job, convert_fn, self.ui.optimize_checkbox.isChecked() and not native
+
+    def enqueue(self, item):
+        try:
+            job, convert_fn, optimize = self.conversion_plan(item)
+        except ValueError as e:
+            self.show_error_message(str(e))
+            return
+        max_size = self.ui.max_size_spin.value()
+        if max_size > 0:
+            convert_fn = partial(target_size_convert, max_bytes=int(max_size * 1024 * 1024), convert_fn=convert_fn)
+        self.queue.add(QueueEntry(job, item.info.duration, convert_fn, optimize, PRIORITY_NORMAL))
+
+    def refresh_queue(self, _entry_id=None):
+        rows = []
+        for entry in self.queue.entries:
+            tooltip = "\n".join(text for text in (entry.job.output_path, entry.message, entry.metrics) if text)
+            rows.append((entry.entry_id, [os.path.basename(entry.job.input_video), PRIORITY_NAMES[entry.priority],
+                                          str(entry.threads) if entry.threads else "", f"{entry.progress}%",
+                                          entry.state], tooltip))
+        self.ui.show_queue(rows)
+
+        # 总进度按未取消的任务平均
+        active = [entry for entry in self.queue.entries if entry.state != STATE_CANCELLED]
+        running = sum(1 for entry in active if entry.state == STATE_RUNNING)
+        queued = sum(1 for entry in active if entry.state == STATE_QUEUED)
+        self.ui.progress_bar.setValue(sum(entry.progress for entry in active) // len(active) if active else 0)
+        if running or queued:
+            self.ui.progress_label.setText(f"转换中 {running} 个，排队 {queued} 个")
+        elif active:
+            self.ui.progress_label.setText("转换完成")
+        else:
+            self.ui.reset_progress()
+        metrics = [entry.metrics for entry in self.queue.entries if entry.metrics]
+        self.ui.metrics_label.setText(metrics[-1] if metrics else "")
+
+    def queue_entry_finished(self, entry_id):
+        if self.queue.busy():
+            return
+        # 队列全部结束时汇总一次，不为每个任务弹窗
+        done = [entry for entry in self.queue.entries if entry.state == STATE_DONE and not entry.reported]
+        failed = [entry for entry in self.queue.entries if entry.state == STATE_FAILED and not entry.reported]
+        for entry in done + failed:
+            entry.reported = True
+        if failed:
+            details = "\n".join(f"{os.path.basename(entry.job.input_video)}：{entry.message.strip()[-300:]}"
+                                 for entry in failed)
+            self.show_error_message(f"{len(failed)} 个任务转换失败\n{details}")
+        elif done:
+            message = f"{len(done)} 个转换已完成！"
+            total = sum(os.path.getsize(entry.job.output_path) for entry in done
+                        if os.path.exists(entry.job.output_path))
+            message += f"\n文件大小：{total / 1024 / 1024:.2f} MB"
+            optimized = [entry.message for entry in done if entry.message]
+            if len(done) == 1 and optimized:
+                message += "\n" + optimized[0]
+            QMessageBox.information(self.ui, "转换完成", message)
+
+    def move_queue_entry(self, offset):
+        entry_id = self.ui.current_queue_id()
+        if entry_id is not None:
+            self.queue.move(entry_id, offset)
+            self.ui.select_queue_row(entry_id)
+
+    def cancel_queue_entry(self):
+        entry_id = self.ui.current_queue_id()
+        if entry_id is not None:
+            self.queue.cancel(entry_id)
+
+    def change_priority(self, _index):
+        entry_id = self.ui.current_queue_id()
+        if entry_id is not None:
+            self.queue.set_priority(entry_id, self.ui.priority_combo.currentData())
+
+    def queue_selection_changed(self):
+        entry = self.queue.entry(self.ui.current_queue_id() or 0)
+        if entry is not None:
+            self.ui.priority_combo.blockSignals(True)
+            self.ui.priority_combo.setCurrentIndex(self.ui.priority_combo.findData(entry.priority))
+            self.ui.priority_combo.blockSignals(False)
+
+    def clear_finished_entries(self):
+        self.queue.clear_finished()
+        self.refresh_queue()
 
     def show_error_message(self, message):
         if "Output file is empty" not in message:  # 忽略这个特定的错误
             QMessageBox.critical(self.ui, "错误", message)
 
-    def conversion_successful(self):
-        self.ui.stop_progress_animation()
-        QMessageBox.information(self.ui, "转换完成", "GIF 转换已完成！")
-
-    def conversion_failed(self, error_message):
-        self.ui.reset_progress()
-        self.ui.enable_convert_button(True)
-        self.show_error_message(f"转换失败: {error_message}")
-        self.ui.progress_bar.setFormat("转换失败")
-
-    def conversion_finished(self):
-        self.ui.stop_progress_animation()
-        self.enable_ui_elements()
-
-    def disable_ui_elements(self):
-        self.ui.enable_convert_button(False)
-        self.ui.import_button.setEnabled(False)
-        self.ui.path_button.setEnabled(False)
-        self.ui.fps_combo.setEnabled(False)
-        self.ui.resolution_combo.setEnabled(False)
-
-    def enable_ui_elements(self):
-        self.ui.enable_convert_button(True)
-        self.ui.import_button.setEnabled(True)
-        self.ui.path_button.setEnabled(True)
-        self.ui.fps_combo.setEnabled(True)
-        self.ui.resolution_combo.setEnabled(True)
+    def ffmpeg_checked(self, capabilities):
+        problems = capabilities.problems()
+        if problems:
+            print(f"Warning: {'；'.join(problems)}")
+            if not self.queue.busy():
+                self.ui.progress_label.setText('；'.join(problems))
 
     def run(self):
         self.ui.show()
+        QTimer.singleShot(0, self.ffmpeg_check.start)
 
 
 if __name__ == "__main__":
+    startup_timing = '--startup-timing' in sys.argv
+    if startup_timing:
+        sys.argv.remove('--startup-timing')
     app = QApplication(sys.argv)
     converter = VideoToGifConverter()
+    app.aboutToQuit.connect(converter.queue.shutdown)
+    app.aboutToQuit.connect(converter.ffmpeg_check.wait)
+    app.aboutToQuit.connect(converter.shutdown_threads)
+    app.aboutToQuit.connect(converter.save_current_item)
+    if startup_timing:
+        timing = StartupTiming(converter.ui)
+        timing.mark('ui_built_ms')
     converter.run()
     sys.exit(app.exec())